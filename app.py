@@ -1,74 +1,361 @@
 """GaussDB Operations Ticket Viewer - FastAPI App"""
-import io
-from datetime import datetime
+import asyncio
+import hashlib
+from contextlib import asynccontextmanager
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
 from pathlib import Path
-from fastapi import FastAPI, Request
-from fastapi.responses import HTMLResponse, StreamingResponse
+from typing import Optional
+from fastapi import FastAPI, HTTPException, Request, Response
+from fastapi.responses import FileResponse, HTMLResponse, JSONResponse, StreamingResponse
 from fastapi.templating import Jinja2Templates
 
-from config import DATABASE_CONFIG, SERVER_HOST, SERVER_PORT, TICKET_URL_PATTERN
-from database import create_database
-
-app = FastAPI(title="GaussDB Ops Viewer", description="运维工单浏览器")
+import metrics
+import tracing
+from compression import CompressionMiddleware
+from config import (COMPRESSION_CONFIG, DATABASE_CONFIG, EXPORT_CONFIG, METRICS_CONFIG, SERVER_HOST,
+                    SERVER_PORT, TICKET_URL_PATTERN, TRACING_CONFIG)
+from database import ReviewConflictError, create_database
+from export import (ARROW_FORMATS, EXPORT_FIELDS, EXPORT_FORMATS, FULL_EXPORT_FIELDS,
+                    require_pyarrow, stream_export)
+from history import MAX_HISTORY_PAGE_SIZE
+from jobs import DONE, ExportJobManager
+from query import MAX_PAGE_SIZE, TicketQuery, parse_fields
+from rawjson import RawJSONResponse, jsonable
+from search import MAX_SEARCH_PAGE_SIZE
+from stats import facet_counts
+
+metrics.configure(**METRICS_CONFIG)
+tracing.configure(**TRACING_CONFIG)
+
+# Initialize database (async adapter keeps blocking queries off the event loop)
+db = create_database(DATABASE_CONFIG, async_mode=True)
+export_jobs = ExportJobManager(DATABASE_CONFIG, ticket_url_pattern=TICKET_URL_PATTERN,
+                               metrics_config=METRICS_CONFIG, **EXPORT_CONFIG)
+
+
+def _pool_gauges() -> None:
+    stats = db.pool_stats()
+    metrics.set_gauge('db_pool_connections', stats['in_use'], state='in_use')
+    metrics.set_gauge('db_pool_connections', stats['idle'], state='idle')
+
+
+metrics.add_collector(_pool_gauges)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await db.connect()
+    if DATABASE_CONFIG['auto_migrate']:
+        await db.migrate()
+    yield
+    export_jobs.close()
+    await db.close()
+
+
+# RawJSONResponse encodes with orjson when installed
+app = FastAPI(title="GaussDB Ops Viewer", description="运维工单浏览器", lifespan=lifespan,
+              default_response_class=RawJSONResponse)
+if COMPRESSION_CONFIG['enabled']:
+    app.add_middleware(CompressionMiddleware, minimum_size=COMPRESSION_CONFIG['minimum_size'])
+if TRACING_CONFIG['enabled']:
+    app.add_middleware(tracing.TracingMiddleware)
+if METRICS_CONFIG['enabled']:
+    # Added last so it is outermost: request timings include compression
+    app.add_middleware(metrics.MetricsMiddleware)
 
 BASE_DIR = Path(__file__).resolve().parent
 templates = Jinja2Templates(directory=BASE_DIR / "templates")
 
-# Configure Jinja2 to not escape unicode in tojson
-templates.env.policies['json.dumps_kwargs'] = {'ensure_ascii': False}
+# Tickets embedded in the initial page; later pages are fetched on scroll
+INDEX_PAGE_SIZE = 100
+MAX_REVIEW_BATCH = 1000
+MAX_BULK_TICKETS = 50
 
-# Initialize database
-db = create_database(DATABASE_CONFIG)
+# Configure Jinja2 to not escape unicode in tojson, and to encode ticket rows
+templates.env.policies['json.dumps_kwargs'] = {'ensure_ascii': False, 'default': jsonable}
 
 
 @app.get("/", response_class=HTMLResponse)
-async def index(request: Request):
-    """Main page - loads only ticket summaries."""
-    tickets = db.get_ticket_list()
-
-    # Extract unique values for filters
-    issue_types = sorted(set(t['issueType'] for t in tickets))
-    owners = sorted(set(t['owner'] for t in tickets))
-
-    return templates.TemplateResponse(
-        "index.html",
-        {
-            "request": request,
-            "tickets": tickets,
-            "issue_types": issue_types,
-            "owners": owners,
-            "ticket_url_pattern": TICKET_URL_PATTERN
-        }
-    )
+async def index(
+    request: Request,
+    type: str = "all",
+    owner: str = "all",
+    score: str = "all",
+    review: str = "all",
+    sort: str = "updateTime-desc"
+):
+    """Main page - first page of ticket summaries; the rest is loaded on scroll."""
+    query = _ticket_query(type=type, owner=owner, score=score, review=review, sort=sort, limit=INDEX_PAGE_SIZE)
+    page, facets = await asyncio.gather(db.get_ticket_page(query), db.get_facets())
+
+    with tracing.span('template'):
+        return templates.TemplateResponse(
+            request,
+            "index.html",
+            {
+                "page": page,
+                "page_size": INDEX_PAGE_SIZE,
+                "issue_types": facets['issueTypes'],
+                "owners": facets['owners'],
+                "ticket_url_pattern": TICKET_URL_PATTERN
+            }
+        )
+
+
+def _etag(*parts) -> str:
+    """Weak ETag from the values a response derives from (it varies with Content-Encoding)."""
+    digest = hashlib.blake2b(repr(parts).encode('utf-8'), digest_size=8).hexdigest()
+    return f'W/"{digest}"'
+
+
+def _as_utc(value) -> Optional[datetime]:
+    """Parse a stored timestamp (text or datetime; naive means UTC)."""
+    if not value:
+        return None
+    if not isinstance(value, datetime):
+        try:
+            value = datetime.fromisoformat(str(value).replace('Z', '+00:00'))
+        except ValueError:
+            return None
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value.astimezone(timezone.utc).replace(microsecond=0)
+
+
+def _ticket_query(**params) -> TicketQuery:
+    """TicketQuery from request parameters; invalid filter values are a 400."""
+    try:
+        return TicketQuery(**params)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+def _cache_headers(etag: str, *timestamps) -> dict:
+    """ETag/Last-Modified headers; clients must revalidate before reusing the response."""
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    times = [t for t in map(_as_utc, timestamps) if t]
+    if times:
+        headers["Last-Modified"] = format_datetime(max(times), usegmt=True)
+    return headers
+
+
+def _not_modified(request: Request, headers: dict) -> bool:
+    """Whether the client's copy is current (If-None-Match, else If-Modified-Since)."""
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        # Weak comparison: W/"x" matches "x"
+        etag = headers["ETag"].removeprefix("W/")
+        tags = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+        return "*" in tags or etag in tags
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since and "Last-Modified" in headers:
+        try:
+            since = parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return False
+        return parsedate_to_datetime(headers["Last-Modified"]) <= since
+    return False
 
 
 @app.get("/api/tickets")
-async def api_tickets():
-    """API endpoint for tickets."""
-    return db.get_all_tickets()
+async def api_tickets(
+    request: Request,
+    type: str = "all",
+    owner: str = "all",
+    score: str = "all",
+    review: str = "all",
+    sort: str = "updateTime-desc",
+    limit: int = 50,
+    cursor: Optional[str] = None,
+    fields: Optional[str] = None
+):
+    """API endpoint for tickets: filtered, sorted, keyset-paginated page.
+
+    Pass the returned ``nextCursor`` as ``cursor`` to fetch the next page.
+    ``fields`` is a comma separated projection, or ``summary``/``detail``.
+    The ETag changes with the ticket/review data version, so repeated
+    requests for an unchanged page get 304.
+    """
+    query = _ticket_query(
+        type=type, owner=owner, score=score, review=review, sort=sort,
+        limit=max(1, min(limit, MAX_PAGE_SIZE)), cursor=cursor, fields=parse_fields(fields)
+    )
+    version = await db.get_data_version()
+    headers = _cache_headers(_etag(version, sorted(request.query_params.multi_items())),
+                             version['tickets'][1], version['reviews'][1])
+    if _not_modified(request, headers):
+        return Response(status_code=304, headers=headers)
+    try:
+        # Returned as-is: the JSON columns are spliced into the body undecoded
+        return RawJSONResponse(await db.get_ticket_page(query), headers=headers)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@app.get("/api/search")
+async def api_search(
+    q: str,
+    type: str = "all",
+    owner: str = "all",
+    score: str = "all",
+    review: str = "all",
+    limit: int = 20,
+    offset: int = 0
+):
+    """Full-text search over ticket content, best matches first.
+
+    Every whitespace separated term in ``q`` must appear in the problem,
+    root cause, analysis or solution. Results are ticket summaries with a
+    ``highlight`` HTML excerpt; pass ``nextOffset`` as ``offset`` for more.
+    Only the most recent 1000 matches are ranked; ``truncated`` says there
+    were more (narrow the search or the filters to reach them).
+    """
+    query = _ticket_query(type=type, owner=owner, score=score, review=review)
+    return await db.search_tickets(q, query, limit=max(1, min(limit, MAX_SEARCH_PAGE_SIZE)),
+                                   offset=max(0, offset))
+
+
+@app.get("/api/tickets/count")
+async def api_tickets_count(
+    type: str = "all",
+    owner: str = "all",
+    score: str = "all",
+    review: str = "all"
+):
+    """Count tickets matching the filters, and in total."""
+    query = _ticket_query(type=type, owner=owner, score=score, review=review)
+    if query == TicketQuery():
+        total = await db.count_tickets(query)
+        return {"filtered": total, "total": total}
+    filtered, total = await asyncio.gather(db.count_tickets(query), db.count_tickets(TicketQuery()))
+    return {"filtered": filtered, "total": total}
+
+
+@app.get("/api/tickets/bulk")
+async def api_tickets_bulk(ids: str):
+    """Details and reviews of several tickets in one query (the viewer prefetches with it).
+
+    ``ids`` is a comma separated list of process IDs. Returns ``items`` in
+    request order, each with the ticket, its review and the review's ETag
+    (for If-Match on save), and the ``missing`` IDs.
+    """
+    process_ids = list(dict.fromkeys(pid.strip() for pid in ids.split(",") if pid.strip()))
+    if len(process_ids) > MAX_BULK_TICKETS:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_BULK_TICKETS} ids per request")
+    details = await db.get_ticket_details(process_ids)
+    items = []
+    missing = []
+    for process_id in process_ids:
+        detail = details.get(process_id)
+        if detail is None:
+            missing.append(process_id)
+            continue
+        review = detail['review'] or _empty_review(process_id)
+        items.append({
+            "processId": process_id,
+            "ticket": detail['ticket'],
+            "review": review,
+            "reviewEtag": _review_etag(review)
+        })
+    return RawJSONResponse({"items": items, "missing": missing})
+
+
+@app.get("/api/stats")
+async def api_stats(
+    type: str = "all",
+    owner: str = "all",
+    score: str = "all",
+    review: str = "all"
+):
+    """Ticket counts per issue type, owner, review status and score band.
+
+    Returns the total and filtered counts, per-value counts for each filter
+    dropdown (with the other filters applied), and the matching
+    (issueType, owner, review, score) groups.
+    """
+    query = _ticket_query(type=type, owner=owner, score=score, review=review)
+    return facet_counts(await db.get_ticket_stats(), query)
 
 
 @app.get("/api/tickets/{process_id}")
-async def api_ticket_detail(process_id: str):
-    """API endpoint for single ticket."""
-    ticket = db.get_ticket_by_id(process_id)
+async def api_ticket_detail(process_id: str, request: Request):
+    """API endpoint for single ticket.
+
+    ETag/Last-Modified come from the ticket's update time, classification
+    and review, read without loading the ticket; 304 if the client's copy
+    is current.
+    """
+    validator = await db.get_ticket_validator(process_id)
+    if validator is None:
+        return {"error": "not found"}
+    create_time, update_time = validator[:2]
+    headers = _cache_headers(_etag(*validator), update_time or create_time, validator[5])
+    if _not_modified(request, headers):
+        return Response(status_code=304, headers=headers)
+    ticket = await db.get_ticket_by_id(process_id)
     if ticket:
-        return ticket
+        return RawJSONResponse(ticket, headers=headers)
     return {"error": "not found"}
 
 
+def _empty_review(process_id: str) -> dict:
+    """Placeholder for a ticket without a review (version 0)."""
+    return {"processId": process_id, "conclusion": None, "content": "", "createTime": None,
+            "updateTime": None, "version": 0}
+
+
+def _review_etag(review: dict) -> str:
+    return f'"{review["version"]}"'
+
+
+def _parse_if_match(value: Optional[str]) -> Optional[int]:
+    """Expected review version from an If-Match header (None: unconditional)."""
+    if value is None or value.strip() == "*":
+        return None
+    tag = value.strip()
+    if tag.startswith("W/"):
+        tag = tag[2:]
+    tag = tag.strip('"')
+    if not tag.isdigit():
+        raise HTTPException(status_code=400, detail="If-Match must be a review ETag")
+    return int(tag)
+
+
+def _current_reviews(conflicts: dict) -> list:
+    """Current reviews from a ReviewConflictError, placeholders for missing ones."""
+    return [review or _empty_review(pid) for pid, review in conflicts.items()]
+
+
 @app.get("/api/tickets/{process_id}/review")
-async def api_get_review(process_id: str):
-    """Get review for a ticket."""
-    review = db.get_ticket_review(process_id)
-    if review:
-        return review
-    return {"processId": process_id, "conclusion": None, "content": "", "createTime": None, "updateTime": None}
+async def api_get_review(process_id: str, request: Request, response: Response):
+    """Get review for a ticket. The ETag is the review version, for If-Match on save."""
+    review = await db.get_ticket_review(process_id) or _empty_review(process_id)
+    headers = {"ETag": _review_etag(review), "Cache-Control": "no-cache"}
+    if _not_modified(request, headers):
+        return Response(status_code=304, headers=headers)
+    response.headers.update(headers)
+    return review
+
+
+@app.get("/api/tickets/{process_id}/review/history")
+async def api_review_history(process_id: str, limit: int = 20, before: Optional[int] = None):
+    """Revisions of a ticket's review, newest first.
+
+    Pass the returned ``nextBefore`` as ``before`` for older revisions.
+    """
+    return await db.get_review_history(process_id, limit=max(1, min(limit, MAX_HISTORY_PAGE_SIZE)),
+                                       before=before)
 
 
 @app.post("/api/tickets/{process_id}/review")
-async def api_save_review(process_id: str, request: Request):
-    """Save review for a ticket."""
+async def api_save_review(process_id: str, request: Request, response: Response):
+    """Save review for a ticket.
+
+    With ``If-Match`` (the ETag from the GET), the save only succeeds if
+    nobody saved the review in between; otherwise 409 with the current review.
+    """
+    version = _parse_if_match(request.headers.get("if-match"))
     body = await request.json()
     # Use `or ""` to handle both missing keys and explicit null values
     conclusion = body.get("conclusion") or ""
@@ -77,149 +364,193 @@ async def api_save_review(process_id: str, request: Request):
     # Use "-" as placeholder for "通过" reviews with no comment
     if not content:
         content = "-"
-    review = db.save_ticket_review(process_id, conclusion, content)
+    try:
+        review = await db.save_ticket_review(process_id, conclusion, content, version)
+    except ReviewConflictError as e:
+        # Return the current review so the client can merge and retry
+        current = _current_reviews(e.conflicts)[0]
+        return JSONResponse(
+            status_code=409,
+            content={"detail": "Review was changed by someone else", "review": current},
+            headers={"ETag": _review_etag(current)}
+        )
+    response.headers["ETag"] = _review_etag(review)
     return review
 
 
+@app.post("/api/reviews/batch")
+async def api_save_reviews(request: Request):
+    """Save reviews for many tickets in one transaction.
+
+    Body: ``{"reviews": [{"processId", "conclusion", "content", "version"?}, ...]}``.
+    Returns one result per item, in order: ``{"processId", "ok": true,
+    "review"}`` or ``{"processId", "ok": false, "error"}`` for invalid items,
+    which are skipped while the rest are saved. Items with a ``version``
+    only save if the review still has it; any conflict fails the whole batch
+    with 409 and the current reviews.
+    """
+    try:
+        body = await request.json()
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid JSON body")
+    items = body.get("reviews") if isinstance(body, dict) else None
+    if not isinstance(items, list) or not items:
+        raise HTTPException(status_code=400, detail="reviews must be a non-empty list")
+    if len(items) > MAX_REVIEW_BATCH:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_REVIEW_BATCH} reviews per batch")
+
+    results = []
+    valid = []
+    for item in items:
+        process_id = item.get("processId") if isinstance(item, dict) else None
+        if not isinstance(process_id, str) or not process_id:
+            results.append({"processId": process_id, "ok": False, "error": "processId is required"})
+            continue
+        version = item.get("version")
+        if version is not None and (type(version) is not int or version < 0):
+            results.append({"processId": process_id, "ok": False, "error": "version must be an integer >= 0"})
+            continue
+        # Same defaults as the single-ticket save
+        valid.append({
+            "processId": process_id,
+            "conclusion": item.get("conclusion") or "",
+            "content": item.get("content") or "-",
+            "version": version,
+        })
+        results.append({"processId": process_id, "ok": True})
+
+    try:
+        saved = {review["processId"]: review for review in await db.save_ticket_reviews(valid)}
+    except ReviewConflictError as e:
+        return JSONResponse(
+            status_code=409,
+            content={"detail": "Reviews were changed by someone else",
+                     "conflicts": _current_reviews(e.conflicts)}
+        )
+    for result in results:
+        if result["ok"]:
+            result["review"] = saved[result["processId"]]
+    return {"results": results}
+
+
+@app.get("/metrics")
+async def api_metrics():
+    """Prometheus metrics of all workers (text exposition format)."""
+    if not metrics.enabled():
+        raise HTTPException(status_code=404, detail="Metrics are disabled")
+    # Reads the other workers' files: off the event loop
+    body = await asyncio.to_thread(metrics.render)
+    return Response(content=body, media_type=metrics.CONTENT_TYPE)
+
+
+@app.get("/api/health")
+async def api_health():
+    """Health check with connection pool and cache statistics."""
+    return {"status": "ok", "pool": db.pool_stats(), "cache": db.cache_stats()}
+
+
+def _export_query(params: dict, format: str, full: bool) -> TicketQuery:
+    """Validate export parameters and build the query for them."""
+    if format not in EXPORT_FORMATS:
+        raise HTTPException(status_code=400, detail=f"Unsupported export format: {format}")
+    if format in ARROW_FORMATS:
+        try:
+            require_pyarrow()
+        except ImportError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+    fields = FULL_EXPORT_FIELDS if full and format != "xlsx" else EXPORT_FIELDS
+    return _ticket_query(fields=fields, **params)
+
+
 @app.get("/api/export")
 async def api_export(
     type: str = "all",
     owner: str = "all",
     score: str = "all",
     review: str = "all",
-    sort: str = "updateTime-desc"
+    sort: str = "updateTime-desc",
+    format: str = "xlsx",
+    full: bool = False
 ):
-    """Export tickets to Excel with filters and sorting."""
-    from openpyxl import Workbook
-    from openpyxl.styles import Font, Alignment
-    from openpyxl.worksheet.table import Table, TableStyleInfo
-
-    tickets = db.get_ticket_list()
-
-    # Apply filters
-    filtered = []
-    for ticket in tickets:
-        if type != "all" and ticket["issueType"] != type:
-            continue
-        if owner != "all" and ticket["owner"] != owner:
-            continue
-        if score != "all":
-            s = ticket["score"]
-            if score == "high" and s < 8:
-                continue
-            if score == "medium" and (s < 6 or s >= 8):
-                continue
-            if score == "low" and s >= 6:
-                continue
-        if review != "all":
-            if review == "pending":
-                if ticket.get("hasReview"):
-                    continue
-            elif review == "expired":
-                if not ticket.get("reviewExpired"):
-                    continue
-            else:
-                # 通过/不通过/待定
-                if ticket.get("reviewExpired") or ticket.get("conclusion") != review:
-                    continue
-        filtered.append(ticket)
-
-    # Apply sorting
-    sort_field, sort_order = sort.split("-") if "-" in sort else (sort, "desc")
-    reverse = sort_order == "desc"
-
-    if sort_field == "id":
-        filtered.sort(key=lambda t: t["processId"], reverse=reverse)
-    elif sort_field == "score":
-        filtered.sort(key=lambda t: t["score"] or 0, reverse=reverse)
-    elif sort_field == "createTime":
-        filtered.sort(key=lambda t: t["createTime"] or "", reverse=reverse)
-    elif sort_field == "updateTime":
-        filtered.sort(key=lambda t: t["updateTime"] or "", reverse=reverse)
-
-    # Create workbook
-    wb = Workbook()
-    ws = wb.active
-    ws.title = "工单列表"
-
-    # Headers
-    headers = ["工单ID", "URL", "问题类型", "负责人", "问题描述", "得分", "审核结论", "审核意见"]
-    for col, header in enumerate(headers, 1):
-        ws.cell(row=1, column=col, value=header)
-
-    # Get all reviews in one query (avoid N+1 problem)
-    all_reviews = db.get_all_reviews()
-
-    # Data rows
-    for row_idx, ticket in enumerate(filtered, 2):
-        # Generate URL if pattern is set
-        url = ""
-        if TICKET_URL_PATTERN:
-            url = TICKET_URL_PATTERN.replace("{processId}", ticket["processId"])
-
-        # Get review info from cached dict
-        rev = all_reviews.get(ticket["processId"])
-        conclusion = rev.get("conclusion", "") if rev else ""
-        content = rev.get("content", "") if rev else ""
-
-        ws.cell(row=row_idx, column=1, value=ticket["processId"])
-        url_cell = ws.cell(row=row_idx, column=2)
-        if url:
-            url_cell.value = "🔗"
-            url_cell.hyperlink = url
-            url_cell.font = Font(color="0563C1")
-            url_cell.alignment = Alignment(horizontal="center")
-        ws.cell(row=row_idx, column=3, value=ticket["issueType"])
-        ws.cell(row=row_idx, column=4, value=ticket["owner"])
-        ws.cell(row=row_idx, column=5, value=ticket["problem"])
-        ws.cell(row=row_idx, column=6, value=ticket["score"])
-        ws.cell(row=row_idx, column=7, value=conclusion)
-        ws.cell(row=row_idx, column=8, value=content)
-
-    # Adjust column widths
-    # Fixed width for 问题描述(E) and 审核意见(H): 80 characters
-    ws.column_dimensions["E"].width = 80
-    ws.column_dimensions["H"].width = 80
-
-    # Auto-fit other columns based on content
-    for col_letter in ["A", "B", "C", "D", "F", "G"]:
-        max_length = 0
-        for cell in ws[col_letter]:
-            if cell.value:
-                cell_len = len(str(cell.value))
-                if cell_len > max_length:
-                    max_length = cell_len
-        ws.column_dimensions[col_letter].width = max(max_length + 2, 4)
-
-    # Create table for filter/sort in Excel
-    if filtered:
-        table_range = f"A1:H{len(filtered) + 1}"
-        table = Table(displayName="TicketTable", ref=table_range)
-        table.tableStyleInfo = TableStyleInfo(
-            name="TableStyleMedium9",
-            showFirstColumn=False,
-            showLastColumn=False,
-            showRowStripes=True,
-            showColumnStripes=False
-        )
-        ws.add_table(table)
-
-    # Save to buffer
-    buffer = io.BytesIO()
-    wb.save(buffer)
-    buffer.seek(0)
+    """Export tickets with filters and sorting.
+
+    ``format`` is xlsx (default), csv, ndjson, parquet or arrow. ``full``
+    adds the ticket details (root cause, analysis, solution...) to the
+    machine-readable formats. Rows are read in batches and the file is
+    streamed as it is built, so memory use does not grow with the number
+    of exported tickets.
+    """
+    query = _export_query(dict(type=type, owner=owner, score=score, review=review, sort=sort),
+                          format, full)
+    tickets = db.iter_tickets(query)
 
     # Generate filename with timestamp
+    media_type, extension = EXPORT_FORMATS[format]
     timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    filename = f"tickets_export_{timestamp}.xlsx"
+    filename = f"tickets_export_{timestamp}.{extension}"
 
     return StreamingResponse(
-        buffer,
-        media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+        stream_export(tickets, format, query.fields, TICKET_URL_PATTERN),
+        media_type=media_type,
         headers={"Content-Disposition": f"attachment; filename={filename}"}
     )
 
 
+def _job_response(state: dict) -> dict:
+    return {
+        "id": state["id"],
+        "status": state["status"],
+        "format": state["format"],
+        "rows": state.get("rows", 0),
+        "total": state.get("total"),
+        "size": state.get("size"),
+        "error": state.get("error"),
+        "downloadUrl": f"/api/export/jobs/{state['id']}/download" if state["status"] == DONE else None,
+    }
+
+
+@app.post("/api/export/jobs", status_code=202)
+async def api_create_export_job(request: Request):
+    """Start a background export, or return the cached/in-progress one.
+
+    The JSON body takes the same parameters as ``GET /api/export``.
+    """
+    body = await request.json()
+    params = {key: str(body.get(key) or "all") for key in ("type", "owner", "score", "review")}
+    params["sort"] = body.get("sort") or "updateTime-desc"
+    format = body.get("format") or "xlsx"
+    query = _export_query(params, format, bool(body.get("full")))
+
+    data_version = await db.get_data_version()
+    state = await asyncio.to_thread(export_jobs.submit, query, format, data_version)
+    return _job_response(state)
+
+
+@app.get("/api/export/jobs/{job_id}")
+async def api_export_job(job_id: str):
+    """Get the status and progress of an export job."""
+    state = await asyncio.to_thread(export_jobs.get, job_id)
+    if not state:
+        raise HTTPException(status_code=404, detail="Export job not found")
+    return _job_response(state)
+
+
+@app.get("/api/export/jobs/{job_id}/download")
+async def api_export_job_download(job_id: str):
+    """Download the result of a finished export job."""
+    state = await asyncio.to_thread(export_jobs.get, job_id)
+    if not state:
+        raise HTTPException(status_code=404, detail="Export job not found")
+    if state["status"] != DONE:
+        raise HTTPException(status_code=409, detail=f"Export job is {state['status']}")
+    export_jobs.touch(state)
+    return FileResponse(
+        export_jobs.result_path(state),
+        media_type=EXPORT_FORMATS[state["format"]][0],
+        filename=state["filename"]
+    )
+
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host=SERVER_HOST, port=SERVER_PORT)
@@ -0,0 +1,345 @@
+"""Load test: concurrent simulated reviewer sessions against a running server.
+
+Each virtual reviewer loops through what the page does: open ``/``, load
+the facet counts, page through tickets, open tickets (bulk detail requests
+with prefetch, as ``fetchTicketDetail`` does), save reviews with If-Match
+and now and then run an export job. Concurrency is stepped through
+``--concurrency`` levels; each level reports per-endpoint latency
+percentiles and histograms, error rates and throughput, and the level where
+throughput stops growing is reported as the saturation point.
+
+    python benchmarks/load.py --url http://127.0.0.1:3011 --concurrency 1,4,16,64
+    python benchmarks/load.py --workers 1,2,4 --concurrency 4,16,64 -o load.json
+
+With ``--workers`` the server is started for each setting (uvicorn
+``--workers N`` with the current environment, so DB_* select the
+database) instead of using ``--url``. Requires httpx.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import signal
+import subprocess
+import sys
+import time
+from bisect import bisect_left
+from collections import defaultdict
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+try:
+    import httpx
+except ImportError:
+    httpx = None
+
+ROOT = Path(__file__).resolve().parent.parent
+
+PAGE_SIZE = 100
+# As the page: the ticket being opened plus this many after it
+PREFETCH_COUNT = 5
+EXPORT_POLL_INTERVAL = 0.5
+# Upper bounds (ms) of the latency histogram buckets; the last is open-ended
+BUCKETS_MS = [1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, float('inf')]
+# Throughput growth below which a level counts as saturated
+SATURATION_GAIN = 0.1
+
+
+def percentile(sorted_values: List[float], q: float) -> float:
+    """Nearest-rank percentile of an ascending list."""
+    index = max(0, min(len(sorted_values) - 1, round(q / 100 * len(sorted_values) + 0.5) - 1))
+    return sorted_values[index]
+
+
+class Recorder:
+    """Latency and status of the requests made inside the measurement window."""
+
+    def __init__(self, start: float, end: float):
+        self.start = start
+        self.end = end
+        self.latencies: Dict[str, List[float]] = defaultdict(list)
+        self.errors: Dict[str, int] = defaultdict(int)
+        self.conflicts: Dict[str, int] = defaultdict(int)
+
+    async def request(self, client, endpoint: str, method: str, url: str, **kwargs):
+        """Send a request; returns the response, or None if it failed."""
+        started = time.perf_counter()
+        try:
+            response = await client.request(method, url, **kwargs)
+        except httpx.HTTPError:
+            response = None
+        elapsed = time.perf_counter() - started
+        if self.start <= started < self.end:
+            self.latencies[endpoint].append(elapsed)
+            if response is None or (response.status_code >= 400 and response.status_code != 409):
+                self.errors[endpoint] += 1
+            elif response.status_code == 409:
+                # Two reviewers saved the same ticket: expected under load
+                self.conflicts[endpoint] += 1
+        return response if response is not None and response.status_code < 400 else None
+
+    def summary(self) -> Dict[str, Any]:
+        window = self.end - self.start
+        endpoints = {}
+        for endpoint, latencies in sorted(self.latencies.items()):
+            latencies.sort()
+            histogram = [0] * len(BUCKETS_MS)
+            for latency in latencies:
+                histogram[bisect_left(BUCKETS_MS, latency * 1000)] += 1
+            endpoints[endpoint] = {
+                'requests': len(latencies),
+                'errors': self.errors[endpoint],
+                'conflicts': self.conflicts[endpoint],
+                'error_rate': self.errors[endpoint] / len(latencies),
+                'p50_ms': percentile(latencies, 50) * 1000,
+                'p95_ms': percentile(latencies, 95) * 1000,
+                'p99_ms': percentile(latencies, 99) * 1000,
+                'max_ms': latencies[-1] * 1000,
+                'histogram': histogram,
+            }
+        requests = sum(e['requests'] for e in endpoints.values())
+        errors = sum(e['errors'] for e in endpoints.values())
+        return {
+            'requests': requests,
+            'errors': errors,
+            'error_rate': errors / requests if requests else 0.0,
+            'throughput': (requests - errors) / window,
+            'endpoints': endpoints,
+        }
+
+
+async def _think(rng: random.Random, mean: float) -> None:
+    if mean > 0:
+        await asyncio.sleep(rng.expovariate(1 / mean))
+
+
+async def reviewer(client, recorder: Recorder, rng: random.Random, args, deadline: float) -> None:
+    """One reviewer, repeating sessions until ``deadline``."""
+    while time.perf_counter() < deadline:
+        await recorder.request(client, 'GET /', 'GET', '/')
+        await recorder.request(client, 'GET /api/stats', 'GET', '/api/stats')
+
+        process_ids: List[str] = []
+        cursor = None
+        for _ in range(rng.randint(1, args.max_pages)):
+            params = {'limit': PAGE_SIZE}
+            if cursor:
+                params['cursor'] = cursor
+            response = await recorder.request(client, 'GET /api/tickets', 'GET', '/api/tickets', params=params)
+            if response is None:
+                break
+            page = response.json()
+            process_ids += [item['processId'] for item in page['items']]
+            cursor = page.get('nextCursor')
+            await _think(rng, args.think)
+            if not cursor:
+                break
+        if not process_ids:
+            continue
+
+        # Open consecutive tickets; after the first, each step prefetches one more
+        first = rng.randrange(len(process_ids))
+        opened = process_ids[first:first + args.tickets_per_session]
+        etags = {}
+        for index, process_id in enumerate(opened):
+            position = first + index
+            wanted = process_ids[position:position + PREFETCH_COUNT + 1] if index == 0 \
+                else process_ids[position + PREFETCH_COUNT:position + PREFETCH_COUNT + 1]
+            if wanted:
+                response = await recorder.request(client, 'GET /api/tickets/bulk', 'GET', '/api/tickets/bulk',
+                                                  params={'ids': ','.join(wanted)})
+                if response is not None:
+                    etags.update((item['processId'], item['reviewEtag']) for item in response.json()['items'])
+            await _think(rng, args.think)
+
+            if rng.random() < args.save_ratio:
+                headers = {'If-Match': etags[process_id]} if etags.get(process_id) else {}
+                conclusion = rng.choice(['通过', '不通过', '待定'])
+                await recorder.request(client, 'POST review', 'POST', f'/api/tickets/{process_id}/review',
+                                       headers=headers,
+                                       json={'conclusion': conclusion, 'content': f'load test {rng.random():.6f}'})
+                await _think(rng, args.think)
+
+        if rng.random() < args.export_ratio:
+            await export(client, recorder, deadline)
+
+
+async def export(client, recorder: Recorder, deadline: float) -> None:
+    """Run an export job as the page does: submit, poll, download."""
+    response = await recorder.request(client, 'POST /api/export/jobs', 'POST', '/api/export/jobs', json={})
+    if response is None:
+        return
+    job = response.json()
+    while job['status'] in ('queued', 'running'):
+        if time.perf_counter() >= deadline:
+            return
+        await asyncio.sleep(EXPORT_POLL_INTERVAL)
+        response = await recorder.request(client, 'GET /api/export/jobs/{id}', 'GET',
+                                          f"/api/export/jobs/{job['id']}")
+        if response is None:
+            return
+        job = response.json()
+    if job['status'] == 'done':
+        await recorder.request(client, 'GET /api/export/jobs/{id}/download', 'GET', job['downloadUrl'])
+
+
+async def run_level(url: str, concurrency: int, args, seed: int) -> Dict[str, Any]:
+    """Run ``concurrency`` reviewers; measure after the warm-up."""
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=url, limits=limits, timeout=args.timeout) as client:
+        start = time.perf_counter() + args.warmup
+        recorder = Recorder(start, start + args.duration)
+        await asyncio.gather(*(
+            reviewer(client, recorder, random.Random(f'{seed}:{concurrency}:{i}'), args, recorder.end)
+            for i in range(concurrency)
+        ))
+    return dict(concurrency=concurrency, **recorder.summary())
+
+
+def saturation_point(levels: List[Dict[str, Any]], max_error_rate: float,
+                     slo_ms: Optional[float]) -> Optional[Dict[str, Any]]:
+    """First level past which throughput no longer grows (or errors/SLO are breached).
+
+    Returns the last level before that point, or None if no level saturated.
+    """
+    for previous, level in zip(levels, levels[1:]):
+        p95 = max((e['p95_ms'] for e in level['endpoints'].values()), default=0.0)
+        if (level['throughput'] < previous['throughput'] * (1 + SATURATION_GAIN)
+                or level['error_rate'] > max_error_rate
+                or (slo_ms is not None and p95 > slo_ms)):
+            return previous
+    return None
+
+
+def print_level(level: Dict[str, Any], histograms: bool) -> None:
+    print(f"\nconcurrency {level['concurrency']}: {level['throughput']:.1f} req/s, "
+          f"{level['requests']} requests, error rate {level['error_rate']:.2%}")
+    print(f"  {'endpoint':36}{'requests':>9}{'errors':>8}{'409':>6}{'p50 ms':>9}{'p95 ms':>9}"
+          f"{'p99 ms':>9}{'max ms':>9}")
+    for endpoint, stats in level['endpoints'].items():
+        print(f"  {endpoint:36}{stats['requests']:>9}{stats['errors']:>8}{stats['conflicts']:>6}"
+              f"{stats['p50_ms']:>9.1f}{stats['p95_ms']:>9.1f}{stats['p99_ms']:>9.1f}{stats['max_ms']:>9.1f}")
+        if histograms:
+            peak = max(stats['histogram'])
+            lower = 0
+            for bound, count in zip(BUCKETS_MS, stats['histogram']):
+                label = f"{lower:g}-{bound:g} ms" if bound != float('inf') else f">{lower:g} ms"
+                if count:
+                    print(f"      {label:>14} {count:>7} {'#' * max(1, round(40 * count / peak))}")
+                lower = bound
+
+
+class Server:
+    """uvicorn with ``workers`` processes on a free local port, for the duration of a run."""
+
+    def __init__(self, workers: int, port: int):
+        self.workers = workers
+        self.url = f'http://127.0.0.1:{port}'
+        self.command = [sys.executable, '-m', 'uvicorn', 'app:app', '--host', '127.0.0.1',
+                        '--port', str(port), '--workers', str(workers), '--log-level', 'warning']
+        self.process = None
+
+    def __enter__(self) -> 'Server':
+        # Own process group, so workers and export processes can be killed together
+        self.process = subprocess.Popen(self.command, cwd=ROOT, env=dict(os.environ, WORKERS=str(self.workers)),
+                                        start_new_session=True)
+        deadline = time.monotonic() + 60
+        while time.monotonic() < deadline:
+            if self.process.poll() is not None:
+                raise SystemExit(f"server exited with status {self.process.returncode}")
+            try:
+                if httpx.get(f'{self.url}/api/health', timeout=1).status_code == 200:
+                    return self
+            except httpx.HTTPError:
+                pass
+            time.sleep(0.2)
+        self.__exit__()
+        raise SystemExit("server did not become healthy within 60s")
+
+    def __exit__(self, *exc) -> None:
+        self.process.terminate()
+        try:
+            self.process.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            os.killpg(self.process.pid, signal.SIGKILL)
+            self.process.wait()
+
+
+def run_setting(url: str, args, label: str) -> Dict[str, Any]:
+    levels = []
+    for concurrency in args.concurrency:
+        level = asyncio.run(run_level(url, concurrency, args, args.seed))
+        levels.append(level)
+        print_level(level, args.histograms)
+    saturated = saturation_point(levels, args.max_error_rate, args.slo_ms)
+    print()
+    if saturated:
+        print(f"{label}: saturates at concurrency {saturated['concurrency']} "
+              f"({saturated['throughput']:.1f} req/s)")
+    else:
+        print(f"{label}: not saturated up to concurrency {levels[-1]['concurrency']} "
+              f"({levels[-1]['throughput']:.1f} req/s)")
+    return {
+        'levels': levels,
+        'saturation': ({'concurrency': saturated['concurrency'], 'throughput': saturated['throughput']}
+                       if saturated else None),
+    }
+
+
+def _int_list(text: str) -> List[int]:
+    return [int(value) for value in text.split(',')]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Reviewer-session load test")
+    parser.add_argument('--url', default='http://127.0.0.1:3011', help="server to test (default: %(default)s)")
+    parser.add_argument('--workers', type=_int_list,
+                        help="start the server with each of these WORKERS settings, e.g. 1,2,4")
+    parser.add_argument('--port', type=int, default=3099, help="port for servers started by --workers")
+    parser.add_argument('--concurrency', type=_int_list, default=[1, 4, 16, 64],
+                        help="concurrent reviewers per level (default: 1,4,16,64)")
+    parser.add_argument('--duration', type=float, default=30.0, help="measured seconds per level (default: 30)")
+    parser.add_argument('--warmup', type=float, default=3.0, help="unmeasured seconds per level (default: 3)")
+    parser.add_argument('--think', type=float, default=0.0,
+                        help="mean pause between actions in seconds (default: 0, i.e. saturate)")
+    parser.add_argument('--max-pages', type=int, default=3, help="ticket pages loaded per session (default: 3)")
+    parser.add_argument('--tickets-per-session', type=int, default=10, help="default: 10")
+    parser.add_argument('--save-ratio', type=float, default=0.5, help="share of opened tickets saved (default: 0.5)")
+    parser.add_argument('--export-ratio', type=float, default=0.02,
+                        help="share of sessions running an export (default: 0.02)")
+    parser.add_argument('--timeout', type=float, default=60.0, help="request timeout in seconds")
+    parser.add_argument('--max-error-rate', type=float, default=0.01,
+                        help="error rate treated as saturation (default: 0.01)")
+    parser.add_argument('--slo-ms', type=float, help="p95 latency (any endpoint) treated as saturation")
+    parser.add_argument('--histograms', action='store_true', help="print latency histograms")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('-o', '--output', help="save results as JSON")
+    args = parser.parse_args()
+    if httpx is None:
+        raise SystemExit("benchmarks/load.py requires httpx: pip install httpx")
+
+    results = {'buckets_ms': [str(bound) for bound in BUCKETS_MS], 'settings': {}}
+    if args.workers:
+        for workers in args.workers:
+            print(f"\n=== WORKERS={workers} ===")
+            with Server(workers, args.port) as server:
+                results['settings'][f'workers={workers}'] = run_setting(server.url, args, f"WORKERS={workers}")
+    else:
+        results['settings'][args.url] = run_setting(args.url, args, args.url)
+
+    if args.workers and len(args.workers) > 1:
+        print("\nsaturation by WORKERS:")
+        for name, setting in results['settings'].items():
+            saturation = setting['saturation']
+            best = max(setting['levels'], key=lambda level: level['throughput'])
+            print(f"  {name:12} peak {best['throughput']:8.1f} req/s at concurrency {best['concurrency']:>4}"
+                  + (f", saturates at {saturation['concurrency']}" if saturation else ", not saturated"))
+
+    if args.output:
+        Path(args.output).write_text(json.dumps(results, indent=2, ensure_ascii=False), encoding='utf-8')
+        print(f"results saved: {args.output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,325 @@
+"""Benchmark suite: database layer, page render and export.
+
+Runs each case against generated datasets and reports latency percentiles,
+throughput and peak RSS; ``compare`` diffs two result files and exits
+non-zero when a case regressed.
+
+    python benchmarks/suite.py run --sizes 10000,100000 --backends sqlite -o current.json
+    python benchmarks/suite.py compare baseline.json current.json [--threshold 0.1]
+
+Datasets are generated once (``generate_mock_data``, fixed seed) and reused:
+SQLite files under ``--data-dir``, PostgreSQL databases named
+``<DB_NAME>_bench_<size>`` on the server of DB_HOST/DB_PORT/DB_USER.
+Each case runs in a fresh process, so its peak RSS is its own. Database
+cases call the backend directly (no cache, as the code in database.py
+runs); ``index`` and ``export`` go through the app with a test client.
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+from multiprocessing import get_context
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Tuple
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+# config reads the environment at import: the modules using it are imported
+# in the case process, after its environment is set up
+
+SEED = 0
+DEFAULT_SIZES = '10000,100000'
+CASES = ['get_ticket_list', 'get_ticket_by_id', 'get_all_reviews', 'save_ticket_review', 'index', 'export']
+
+# (metric, direction): +1 when higher is worse, -1 when lower is worse
+COMPARED_METRICS = [('p50_ms', 1), ('p95_ms', 1), ('ops_per_sec', -1), ('peak_rss_mb', 1)]
+
+
+def _database_config(backend: str, size: int, data_dir: Path) -> Dict[str, Any]:
+    from config import DATABASE_CONFIG
+    config = dict(DATABASE_CONFIG, type=backend, cache={'enabled': False})
+    if backend == 'sqlite':
+        config['path'] = str(data_dir / f'tickets_{size}.db')
+    else:
+        config['database'] = f"{DATABASE_CONFIG['database']}_bench_{size}"
+    return config
+
+
+def _environment(config: Dict[str, Any], data_dir: Path, cache: bool) -> Dict[str, str]:
+    """Environment pointing the app's config at a dataset."""
+    return {
+        'DB_TYPE': config['type'],
+        'DB_PATH': config['path'],
+        'DB_HOST': config['host'],
+        'DB_PORT': str(config['port']),
+        'DB_NAME': config['database'],
+        'DB_USER': config['user'],
+        'DB_PASSWORD': config['password'],
+        'DB_AUTO_MIGRATE': 'false',
+        'CACHE_ENABLED': 'true' if cache else 'false',
+        'EXPORT_DIR': str(data_dir / 'exports'),
+    }
+
+
+def _ticket_count(db) -> int:
+    with db._connection() as conn:
+        cursor = conn.cursor()
+        try:
+            cursor.execute('SELECT COUNT(*) FROM operations_kb')
+        except Exception:
+            conn.rollback()
+            return 0
+        return cursor.fetchone()[0]
+
+
+def _create_postgresql_database(config: Dict[str, Any]) -> None:
+    import psycopg2
+    conn = psycopg2.connect(host=config['host'], port=config['port'], user=config['user'],
+                            password=config['password'], database='postgres')
+    try:
+        conn.autocommit = True
+        cursor = conn.cursor()
+        cursor.execute('SELECT 1 FROM pg_database WHERE datname = %s', (config['database'],))
+        if cursor.fetchone() is None:
+            cursor.execute(f'CREATE DATABASE "{config["database"]}"')
+    finally:
+        conn.close()
+
+
+def prepare_dataset(config: Dict[str, Any], size: int, workers: int) -> None:
+    """Generate the dataset unless it already holds ``size`` tickets."""
+    import generate_mock_data as mock
+    import migrations
+    from database import create_database
+
+    if config['type'] == 'postgresql':
+        _create_postgresql_database(config)
+    db = create_database(config)
+    try:
+        if _ticket_count(db) == size:
+            return
+        print(f"generating {size} tickets ({config['type']})...", file=sys.stderr)
+        options = mock.Options(SEED, tuple((name, 1.0) for name in mock.issue_types),
+                               tuple((name, 1.0) for name in mock.owners), 0.5, 0.1, 365)
+        with db._connection() as conn:
+            mock.load(conn, db.dialect, mock.generate(options, size, workers), batch_size=100000)
+            migrations.migrate(conn, db.dialect)
+    finally:
+        db.close()
+
+
+def percentile(sorted_values: List[float], q: float) -> float:
+    """Nearest-rank percentile of an ascending list."""
+    index = max(0, min(len(sorted_values) - 1, round(q / 100 * len(sorted_values) + 0.5) - 1))
+    return sorted_values[index]
+
+
+def _peak_rss_mb() -> float:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return peak / 2 ** 20 if sys.platform == 'darwin' else peak / 2 ** 10
+
+
+def _database_case(case: str, size: int) -> Tuple[Callable[[int], Any], Callable[[], None]]:
+    """(operation taking the iteration number, cleanup) for a database case."""
+    from config import DATABASE_CONFIG
+    from database import create_database
+
+    db = create_database(dict(DATABASE_CONFIG, cache={'enabled': False}))
+    rng = random.Random(SEED)
+    if case == 'get_ticket_list':
+        return lambda i: db.get_ticket_list(), db.close
+    if case == 'get_ticket_by_id':
+        return lambda i: db.get_ticket_by_id(f'TICKET-{1001 + rng.randrange(size)}'), db.close
+    if case == 'get_all_reviews':
+        return lambda i: db.get_all_reviews(), db.close
+    if case == 'save_ticket_review':
+        # Update existing reviews only, so reruns keep the dataset the same size
+        with db._connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('SELECT processId FROM ticket_review ORDER BY processId LIMIT 1000')
+            process_ids = [row[0] for row in cursor.fetchall()]
+        return (lambda i: db.save_ticket_review(rng.choice(process_ids), '待定', f'benchmark {i}'),
+                db.close)
+    raise ValueError(f"unknown case: {case}")
+
+
+def _app_case(case: str, export_format: str) -> Tuple[Callable[[int], Any], Callable[[], None]]:
+    from fastapi.testclient import TestClient
+    import app
+
+    client = TestClient(app.app)
+    client.__enter__()
+
+    def get(path: str) -> int:
+        response = client.get(path)
+        response.raise_for_status()
+        return len(response.content)
+
+    if case == 'index':
+        return lambda i: get('/'), lambda: client.__exit__(None, None, None)
+    if case == 'export':
+        return (lambda i: get(f'/api/export?format={export_format}'),
+                lambda: client.__exit__(None, None, None))
+    raise ValueError(f"unknown case: {case}")
+
+
+def run_case(case: str, size: int, environment: Dict[str, str], duration: float,
+             min_iterations: int, max_iterations: int, export_format: str) -> Dict[str, Any]:
+    """Run one case (in its own process) and return its measurements."""
+    os.environ.update(environment)
+    if case in ('index', 'export'):
+        operation, cleanup = _app_case(case, export_format)
+    else:
+        operation, cleanup = _database_case(case, size)
+    try:
+        # Warm up: pool, row types, templates
+        operation(-1)
+        timings = []
+        started = time.perf_counter()
+        for i in range(max_iterations):
+            start = time.perf_counter()
+            operation(i)
+            timings.append(time.perf_counter() - start)
+            if i + 1 >= min_iterations and time.perf_counter() - started >= duration:
+                break
+        elapsed = time.perf_counter() - started
+    finally:
+        cleanup()
+
+    timings.sort()
+    return {
+        'iterations': len(timings),
+        'mean_ms': sum(timings) / len(timings) * 1000,
+        'p50_ms': percentile(timings, 50) * 1000,
+        'p95_ms': percentile(timings, 95) * 1000,
+        'p99_ms': percentile(timings, 99) * 1000,
+        'max_ms': timings[-1] * 1000,
+        'ops_per_sec': len(timings) / elapsed,
+        'peak_rss_mb': _peak_rss_mb(),
+    }
+
+
+def _git_commit() -> str:
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ''
+
+
+def run(args) -> None:
+    sizes = [int(size) for size in args.sizes.split(',')]
+    backends = args.backends.split(',')
+    cases = args.cases.split(',') if args.cases else CASES
+    unknown = set(cases) - set(CASES)
+    if unknown:
+        raise SystemExit(f"unknown cases: {', '.join(sorted(unknown))} (expected: {', '.join(CASES)})")
+    data_dir = Path(args.data_dir).resolve()
+    data_dir.mkdir(parents=True, exist_ok=True)
+
+    results = []
+    print(f"{'backend':11}{'size':>9}  {'case':20}{'iters':>7}{'p50 ms':>10}{'p95 ms':>10}"
+          f"{'p99 ms':>10}{'ops/s':>10}{'RSS MB':>9}")
+    for backend in backends:
+        for size in sizes:
+            config = _database_config(backend, size, data_dir)
+            prepare_dataset(config, size, args.workers)
+            environment = _environment(config, data_dir, args.cache)
+            for case in cases:
+                # One process per case: peak RSS is not carried over between cases
+                with ProcessPoolExecutor(1, mp_context=get_context('spawn')) as executor:
+                    result = executor.submit(run_case, case, size, environment, args.duration,
+                                             args.min_iterations, args.max_iterations,
+                                             args.export_format).result()
+                result = dict(backend=backend, size=size, case=case, **result)
+                results.append(result)
+                print(f"{backend:11}{size:>9}  {case:20}{result['iterations']:>7}{result['p50_ms']:>10.2f}"
+                      f"{result['p95_ms']:>10.2f}{result['p99_ms']:>10.2f}{result['ops_per_sec']:>10.1f}"
+                      f"{result['peak_rss_mb']:>9.0f}")
+
+    if args.output:
+        document = {
+            'meta': {
+                'commit': _git_commit(),
+                'timestamp': datetime.now(timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ'),
+                'python': platform.python_version(),
+                'platform': platform.platform(),
+                'cache': args.cache,
+                'export_format': args.export_format,
+                'duration': args.duration,
+            },
+            'results': results,
+        }
+        Path(args.output).write_text(json.dumps(document, indent=2, ensure_ascii=False), encoding='utf-8')
+        print(f"results saved: {args.output}")
+
+
+def compare(args) -> None:
+    def load(path: str) -> Dict[Tuple[str, int, str], Dict[str, Any]]:
+        document = json.loads(Path(path).read_text(encoding='utf-8'))
+        return {(r['backend'], r['size'], r['case']): r for r in document['results']}
+
+    baseline, current = load(args.baseline), load(args.current)
+    regressions = 0
+    print(f"{'backend':11}{'size':>9}  {'case':20}{'metric':13}{'baseline':>11}{'current':>11}{'change':>9}")
+    for key in sorted(baseline.keys() & current.keys()):
+        for metric, direction in COMPARED_METRICS:
+            old, new = baseline[key][metric], current[key][metric]
+            change = (new - old) / old if old else 0.0
+            regressed = change * direction > args.threshold
+            regressions += regressed
+            flag = '  REGRESSION' if regressed else ''
+            print(f"{key[0]:11}{key[1]:>9}  {key[2]:20}{metric:13}{old:>11.2f}{new:>11.2f}{change:>+9.1%}{flag}")
+    for key in sorted(baseline.keys() ^ current.keys()):
+        print(f"{key[0]:11}{key[1]:>9}  {key[2]:20}only in {'baseline' if key in baseline else 'current'}")
+    if regressions:
+        print(f"{regressions} regression(s) beyond {args.threshold:.0%}")
+        sys.exit(1)
+    print(f"no regressions beyond {args.threshold:.0%}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="API, database and export benchmark suite")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    run_parser = commands.add_parser('run', help="run the benchmarks")
+    run_parser.add_argument('--sizes', default=DEFAULT_SIZES,
+                            help=f"dataset sizes in tickets, comma-separated (default: {DEFAULT_SIZES})")
+    run_parser.add_argument('--backends', default='sqlite', help="sqlite and/or postgresql (default: sqlite)")
+    run_parser.add_argument('--cases', help=f"comma-separated subset of: {', '.join(CASES)}")
+    run_parser.add_argument('--duration', type=float, default=5.0, help="seconds per case (default: 5)")
+    run_parser.add_argument('--min-iterations', type=int, default=5, help="default: 5")
+    run_parser.add_argument('--max-iterations', type=int, default=10000, help="default: 10000")
+    run_parser.add_argument('--export-format', default='csv', help="format for /api/export (default: csv)")
+    run_parser.add_argument('--cache', action='store_true', help="enable the app's cache for index/export")
+    run_parser.add_argument('--data-dir', default=str(Path(tempfile.gettempdir()) / 'gaussdb_ops_bench'),
+                            help="where SQLite datasets are kept")
+    run_parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                            help="processes generating datasets")
+    run_parser.add_argument('-o', '--output', help="save results as JSON")
+
+    compare_parser = commands.add_parser('compare', help="diff results against a baseline")
+    compare_parser.add_argument('baseline')
+    compare_parser.add_argument('current')
+    compare_parser.add_argument('--threshold', type=float, default=0.1,
+                                help="relative change flagged as a regression (default: 0.1)")
+
+    args = parser.parse_args()
+    if args.command == 'run':
+        run(args)
+    else:
+        compare(args)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,92 @@
+"""Memory held by ticket summaries: TicketRow vs plain dicts.
+
+Loads every ticket summary (as ``get_ticket_list`` does) twice, once as
+TicketRow with interned facet strings and once as the dicts used before,
+and reports the memory each list retains and the time to build it.
+
+    python benchmarks/ticket_rows.py [--db gaussdb_ops.db]
+"""
+import argparse
+import gc
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from config import DATABASE_CONFIG  # noqa: E402
+from database import create_database  # noqa: E402
+
+
+def _summary_dict(row) -> dict:
+    """A summary in the previous representation: one dict per ticket."""
+    create_time = row[3]
+    return {
+        'processId': row[0],
+        'issueType': row[1],
+        'owner': row[2],
+        'createTime': create_time,
+        'updateTime': row[4] if row[4] else create_time,
+        'problem': row[5],
+        'score': row[6],
+        'hasReview': bool(row[7]),
+        'conclusion': row[8],
+        'reviewExpired': bool(row[9]),
+    }
+
+
+def measure(load):
+    """Return (result, bytes retained, seconds) for building ``load()``.
+
+    Timed without tracing (tracemalloc slows allocation down), then
+    built again under tracemalloc to count the retained bytes.
+    """
+    start = time.perf_counter()
+    load()
+    elapsed = time.perf_counter() - start
+    gc.collect()
+    tracemalloc.start()
+    base = tracemalloc.get_traced_memory()[0]
+    result = load()
+    gc.collect()
+    retained = tracemalloc.get_traced_memory()[0] - base
+    tracemalloc.stop()
+    return result, retained, elapsed
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Ticket summary memory benchmark")
+    parser.add_argument('--db', help="SQLite database path (default: DB_PATH)")
+    args = parser.parse_args()
+
+    config = dict(DATABASE_CONFIG, cache={'enabled': False})
+    if args.db:
+        config.update(type='sqlite', path=args.db)
+    db = create_database(config)
+    try:
+        # Warm the pool and the row type so neither is counted
+        db.get_ticket_list()
+
+        rows, row_bytes, row_time = measure(db.get_ticket_list)
+        count = len(rows)
+        del rows
+        # Same query, parsed the previous way
+        db._parse_ticket_summary = _summary_dict
+        dicts, dict_bytes, dict_time = measure(db.get_ticket_list)
+        del dicts
+    finally:
+        db.close()
+
+    if not count:
+        print("no tickets")
+        return
+    print(f"{count} ticket summaries")
+    print(f"{'':10}{'bytes/ticket':>14}{'total MB':>10}{'build ms':>10}")
+    for name, size, elapsed in (('dict', dict_bytes, dict_time), ('TicketRow', row_bytes, row_time)):
+        print(f"{name:10}{size / count:14.0f}{size / 2 ** 20:10.1f}{elapsed * 1000:10.0f}")
+    print(f"saving: {1 - row_bytes / dict_bytes:.0%}")
+
+
+if __name__ == '__main__':
+    main()
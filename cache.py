@@ -0,0 +1,332 @@
+"""In-process cache layer for any DatabaseInterface."""
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Iterator, List, Optional
+
+import coherence
+from database import DatabaseInterface, ReviewConflictError
+from pool import ConnectionPool
+from query import TicketQuery, TicketRow
+
+# Sentinel for "not cached" (None is a valid cached value, e.g. no review yet)
+MISSING = object()
+
+# More reviews changed at once than this drop the whole cache instead of
+# being re-read (matches the API's review batch limit)
+MAX_SYNC_REVIEWS = 1000
+
+
+class LRUCache:
+    """Thread-safe LRU cache with per-entry TTL and hit/miss counters."""
+
+    def __init__(self, max_entries: int = 10000, ttl: float = 300.0):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._data = OrderedDict()  # key -> (value, expires_at)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key, default=MISSING):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None or entry[1] < time.monotonic():
+                if entry is not None:
+                    del self._data[key]
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def set(self, key, value) -> None:
+        with self._lock:
+            self._data[key] = (value, time.monotonic() + self.ttl)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def pop(self, key) -> None:
+        with self._lock:
+            self._data.pop(key, None)
+
+    def items(self) -> List:
+        """Snapshot of (key, value) pairs, including expired ones."""
+        with self._lock:
+            return [(key, entry[0]) for key, entry in self._data.items()]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'entries': len(self._data),
+                'max_entries': self.max_entries,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+            }
+
+
+def _query_key(query: TicketQuery) -> tuple:
+    return (
+        query.type, query.owner, query.score, query.review, query.sort,
+        query.limit, query.cursor, tuple(query.fields) if query.fields else None
+    )
+
+
+def _apply_review(ticket: TicketRow, review: Dict[str, Any]) -> None:
+    """Update a cached ticket summary in place after a review save."""
+    if 'hasReview' in ticket:
+        ticket['hasReview'] = True
+    if 'conclusion' in ticket:
+        ticket['conclusion'] = review['conclusion']
+    if 'reviewExpired' in ticket:
+        ticket['reviewExpired'] = False
+
+
+class CachedDatabase(DatabaseInterface):
+    """Caching wrapper around a DatabaseInterface.
+
+    Caches the summary list, ticket details and validators, reviews, list
+    pages, counts, facets and stats with TTL and LRU eviction. A cheap change probe
+    (``get_data_version``) runs at most every ``probe_interval`` seconds and
+    drops everything when the ticket tables changed. Reviews saved through this wrapper are written
+    through: cached entries are patched in place rather than reloaded.
+
+    With a coherence channel, every read first applies the review changes
+    published by database triggers (saves from any worker process).
+    """
+
+    def __init__(self, db: DatabaseInterface, ttl: float = 300.0, max_entries: int = 10000,
+                 probe_interval: float = 5.0,
+                 channel: Optional[coherence.CoherenceChannel] = None):
+        self.db = db
+        self.channel = channel
+        self.ttl = ttl
+        self.probe_interval = probe_interval
+        self._pool = None
+        self._entries = LRUCache(max_entries=max_entries, ttl=ttl)
+        self._lock = threading.RLock()
+        self._summaries = None  # (expires_at, list, {processId: summary})
+        self._summary_hits = 0
+        self._summary_misses = 0
+        self._tickets_version = None
+        self._next_probe = 0.0
+        self._reloads = 0
+
+    @property
+    def dialect(self) -> str:
+        return self.db.dialect
+
+    def _create_pool(self) -> ConnectionPool:
+        # Uncached queries inherited from DatabaseInterface share the backend's pool
+        return self.db._get_pool()
+
+    def connect(self) -> None:
+        self.db.connect()
+
+    def close(self) -> None:
+        if self.channel:
+            self.channel.close()
+        self.db.close()
+
+    def invalidate(self) -> None:
+        """Drop every cached entry."""
+        with self._lock:
+            self._summaries = None
+            self._entries.clear()
+
+    def _sync_workers(self) -> None:
+        """Apply review changes published since the last read."""
+        changed = self.channel.poll()
+        if changed is coherence.ALL:
+            self.invalidate()
+            return
+        if not changed:
+            return
+        if len(changed) > MAX_SYNC_REVIEWS:
+            # A bulk change (e.g. an import): cheaper to reload on demand
+            self.invalidate()
+            return
+        # One query however many tickets a batch save touched
+        reviews = self.db.get_ticket_reviews(sorted(changed))
+        for process_id in changed - reviews.keys():
+            self._entries.pop(('review', process_id))
+            self._entries.pop(('validator', process_id))
+        if reviews:
+            self._write_through(reviews)
+
+    def _check_version(self) -> None:
+        """Sync with other workers, then run the change probe if due."""
+        if self.channel:
+            self._sync_workers()
+        now = time.monotonic()
+        if now < self._next_probe:
+            return
+        with self._lock:
+            if now < self._next_probe:
+                return
+            self._next_probe = now + self.probe_interval
+        self._apply_version(self.db.get_data_version()['tickets'])
+
+    def _apply_version(self, version) -> None:
+        """Drop everything if the tickets changed since the last probe."""
+        with self._lock:
+            if self._tickets_version is not None and version != self._tickets_version:
+                self._reloads += 1
+                self._summaries = None
+                self._entries.clear()
+            self._tickets_version = version
+
+    def get_data_version(self) -> Dict[str, Any]:
+        """Get the current data version; also serves as an immediate change probe.
+
+        Anything read from the cache afterwards is at least this fresh, so
+        validators derived from the version never outrun the cached data.
+        """
+        if self.channel:
+            self._sync_workers()
+        version = self.db.get_data_version()
+        self._apply_version(version['tickets'])
+        return version
+
+    def _cached(self, key, loader):
+        self._check_version()
+        value = self._entries.get(key)
+        if value is MISSING:
+            value = loader()
+            self._entries.set(key, value)
+        return value
+
+    def get_ticket_list(self) -> List[TicketRow]:
+        self._check_version()
+        with self._lock:
+            cached = self._summaries
+            if cached and cached[0] > time.monotonic():
+                self._summary_hits += 1
+                return cached[1]
+            self._summary_misses += 1
+        tickets = self.db.get_ticket_list()
+        with self._lock:
+            self._summaries = (
+                time.monotonic() + self.ttl,
+                tickets,
+                {t['processId']: t for t in tickets}
+            )
+        return tickets
+
+    def get_all_tickets(self) -> List[Dict[str, Any]]:
+        return self.db.get_all_tickets()
+
+    def _stream_cursor(self, conn):
+        # The backend's: PostgreSQL streams through a server-side cursor
+        return self.db._stream_cursor(conn)
+
+    def iter_tickets(self, query: TicketQuery, batch_size: int = 1000) -> Iterator[TicketRow]:
+        return self.db.iter_tickets(query, batch_size)
+
+    def get_ticket_by_id(self, process_id: str) -> Optional[Dict[str, Any]]:
+        return self._cached(('ticket', process_id), lambda: self.db.get_ticket_by_id(process_id))
+
+    def get_ticket_details(self, process_ids: List[str]) -> Dict[str, Dict[str, Any]]:
+        """Serve cached tickets and reviews; load the rest with one query."""
+        self._check_version()
+        details = {}
+        missing = []
+        for process_id in process_ids:
+            ticket = self._entries.get(('ticket', process_id))
+            review = self._entries.get(('review', process_id))
+            if ticket is MISSING or review is MISSING:
+                missing.append(process_id)
+            elif ticket is not None:
+                details[process_id] = {'ticket': ticket, 'review': review}
+        if missing:
+            loaded = self.db.get_ticket_details(missing)
+            for process_id in missing:
+                detail = loaded.get(process_id)
+                self._entries.set(('ticket', process_id), detail['ticket'] if detail else None)
+                if detail:
+                    self._entries.set(('review', process_id), detail['review'])
+                    details[process_id] = detail
+        return details
+
+    def get_ticket_validator(self, process_id: str) -> Optional[tuple]:
+        return self._cached(('validator', process_id), lambda: self.db.get_ticket_validator(process_id))
+
+    def get_ticket_review(self, process_id: str) -> Optional[Dict[str, Any]]:
+        return self._cached(('review', process_id), lambda: self.db.get_ticket_review(process_id))
+
+    def get_all_reviews(self) -> Dict[str, Dict[str, Any]]:
+        return self.db.get_all_reviews()
+
+    def get_ticket_page(self, query: TicketQuery) -> Dict[str, Any]:
+        return self._cached(('page', _query_key(query)), lambda: self.db.get_ticket_page(query))
+
+    def count_tickets(self, query: TicketQuery) -> int:
+        return self._cached(('count', _query_key(query)), lambda: self.db.count_tickets(query))
+
+    def get_facets(self) -> Dict[str, List[str]]:
+        return self._cached(('facets',), self.db.get_facets)
+
+    def get_ticket_stats(self) -> List[tuple]:
+        return self._cached(('stats',), self.db.get_ticket_stats)
+
+    def save_ticket_reviews(self, reviews: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        try:
+            saved = self.db.save_ticket_reviews(reviews)
+        except ReviewConflictError as e:
+            # Our copies of these reviews were stale; keep the current ones
+            current = {pid: review for pid, review in e.conflicts.items() if review is not None}
+            for process_id in e.conflicts.keys() - current.keys():
+                self._entries.pop(('review', process_id))
+                self._entries.pop(('validator', process_id))
+            if current:
+                self._write_through(current)
+            raise
+        # The other workers learn of the save from the invalidation its
+        # transaction wrote (see coherence.py); nothing can fail past the commit
+        self._write_through({review['processId']: review for review in saved})
+        return saved
+
+    def _write_through(self, reviews: Dict[str, Dict[str, Any]]) -> None:
+        """Patch cached entries affected by saved reviews (keyed by processId)."""
+        with self._lock:
+            for process_id, review in reviews.items():
+                self._entries.set(('review', process_id), review)
+                # Derived from the review's version
+                self._entries.pop(('validator', process_id))
+            # The tickets may have moved to another review status
+            self._entries.pop(('stats',))
+            if self._summaries:
+                for process_id, review in reviews.items():
+                    ticket = self._summaries[2].get(process_id)
+                    if ticket:
+                        _apply_review(ticket, review)
+            for key, value in self._entries.items():
+                kind = key[0]
+                if kind not in ('page', 'count'):
+                    continue
+                review_filter = key[1][3]
+                if review_filter != 'all':
+                    # Membership of review-filtered results may have changed
+                    self._entries.pop(key)
+                elif kind == 'page':
+                    for ticket in value['items']:
+                        review = reviews.get(ticket.get('processId'))
+                        if review:
+                            _apply_review(ticket, review)
+
+    def cache_stats(self) -> Dict[str, Any]:
+        """Get cache hit/miss counters."""
+        with self._lock:
+            stats = self._entries.stats()
+            stats['summary_hits'] = self._summary_hits
+            stats['summary_misses'] = self._summary_misses
+            stats['reloads'] = self._reloads
+            return stats
@@ -0,0 +1,164 @@
+"""Cross-worker cache coherence.
+
+Each uvicorn worker keeps its own CachedDatabase. Every review write
+publishes the ticket ID from a trigger, in the saving transaction (migration
+13), so an invalidation commits exactly when the review does and a save never
+fails after its commit. Workers poll the channel before serving cached data
+and refresh just the affected entries (the saving worker gets its own
+writes back too; re-reading them is harmless).
+
+- SQLite: an append-only ``cache_invalidation`` table in the same database
+  file. ``PRAGMA data_version`` tells, without reading any table, whether
+  another connection has committed since the last poll.
+- PostgreSQL: ``LISTEN/NOTIFY`` on a dedicated connection; polling reads
+  pending notifications from the socket without a round-trip.
+"""
+import os
+import threading
+import time
+from abc import ABC, abstractmethod
+from typing import Callable, Optional, Set
+
+CHANNEL = 'ticket_cache'
+
+# Returned by poll() when changes may have been missed and everything must go
+ALL = None
+
+
+class CoherenceChannel(ABC):
+    """Receives the IDs of changed tickets in each worker process."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pid = None
+
+    def _check_pid(self) -> bool:
+        """Reset per-process state after a fork. Returns True if it was reset."""
+        if self._pid == os.getpid():
+            return False
+        self._pid = os.getpid()
+        self._reset()
+        return True
+
+    @abstractmethod
+    def _reset(self) -> None:
+        """Drop connections and cursors inherited from another process."""
+        pass
+
+    @abstractmethod
+    def poll(self) -> Optional[Set[str]]:
+        """Return IDs changed since the last poll, or ALL."""
+        pass
+
+    @abstractmethod
+    def close(self) -> None:
+        pass
+
+
+class SQLiteCoherence(CoherenceChannel):
+    """Invalidation log stored in the SQLite database file."""
+
+    # Rows older than this are pruned; workers poll far more often
+    RETENTION = 3600.0
+
+    def __init__(self, db_path: str):
+        super().__init__()
+        self.db_path = db_path
+        self._conn = None
+        self._data_version = None
+        self._last_seq = 0
+        self._next_prune = 0.0
+
+    def _reset(self) -> None:
+        self._conn = None
+        self._data_version = None
+
+    def _get_conn(self):
+        import sqlite3
+        if self._check_pid() or self._conn is None:
+            self._conn = sqlite3.connect(self.db_path, check_same_thread=False, isolation_level=None)
+            row = self._conn.execute('SELECT MAX(seq) FROM cache_invalidation').fetchone()
+            self._last_seq = row[0] or 0
+            self._data_version = self._conn.execute('PRAGMA data_version').fetchone()[0]
+        return self._conn
+
+    def _prune(self, conn) -> None:
+        import sqlite3
+        now = time.time()
+        if now >= self._next_prune:
+            self._next_prune = now + self.RETENTION / 10
+            try:
+                conn.execute('DELETE FROM cache_invalidation WHERE created_at < ?', (now - self.RETENTION,))
+            except sqlite3.OperationalError:
+                # Busy writers: another poll will prune
+                pass
+
+    def poll(self) -> Optional[Set[str]]:
+        with self._lock:
+            conn = self._get_conn()
+            self._prune(conn)
+            # data_version only moves when another connection committed
+            data_version = conn.execute('PRAGMA data_version').fetchone()[0]
+            if data_version == self._data_version:
+                return set()
+            self._data_version = data_version
+            rows = conn.execute(
+                'SELECT seq, process_id FROM cache_invalidation WHERE seq > ? ORDER BY seq',
+                (self._last_seq,)
+            ).fetchall()
+            if rows and rows[0][0] > self._last_seq + 1 and self._last_seq:
+                # Gap: rows were pruned before we saw them
+                self._last_seq = rows[-1][0]
+                return ALL
+            if rows:
+                self._last_seq = rows[-1][0]
+            return {process_id for _, process_id in rows}
+
+    def close(self) -> None:
+        with self._lock:
+            if self._conn is not None and self._pid == os.getpid():
+                self._conn.close()
+            self._conn = None
+
+
+class PostgreSQLCoherence(CoherenceChannel):
+    """LISTEN/NOTIFY channel on a dedicated autocommit connection."""
+
+    def __init__(self, connect: Callable):
+        super().__init__()
+        self.connect = connect
+        self._conn = None
+
+    def _reset(self) -> None:
+        self._conn = None
+
+    def _get_conn(self) -> bool:
+        """Ensure the listening connection exists. Returns True if it was (re)opened."""
+        self._check_pid()
+        if self._conn is not None and not self._conn.closed:
+            return False
+        self._conn = self.connect()
+        self._conn.autocommit = True
+        self._conn.cursor().execute(f'LISTEN {CHANNEL}')
+        return True
+
+    def poll(self) -> Optional[Set[str]]:
+        with self._lock:
+            try:
+                if self._get_conn():
+                    # Notifications sent while we weren't listening are lost
+                    return ALL
+                self._conn.poll()
+            except Exception:
+                self._conn = None
+                return ALL
+            changed = set()
+            while self._conn.notifies:
+                changed.add(self._conn.notifies.pop(0).payload)
+            return changed
+
+    def close(self) -> None:
+        with self._lock:
+            if self._conn is not None and self._pid == os.getpid():
+                self._conn.close()
+            self._conn = None
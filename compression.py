@@ -0,0 +1,121 @@
+"""Response compression middleware.
+
+Responses are brotli-compressed when the optional ``brotli`` package is
+installed and the client accepts ``br``, gzip-compressed otherwise. Only
+text formats are compressed (JSON, HTML, CSV, NDJSON...): xlsx is already a
+zip and parquet/arrow are binary. Streaming responses are compressed chunk
+by chunk.
+"""
+import zlib
+from typing import Callable, Optional, Tuple
+
+from starlette.datastructures import Headers, MutableHeaders
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+COMPRESSIBLE_TYPES = {
+    'application/json', 'application/x-ndjson', 'application/javascript',
+    'text/html', 'text/csv', 'text/plain', 'text/css', 'text/javascript',
+}
+
+
+def choose_encoding(accept_encoding: str) -> Optional[str]:
+    """Pick 'br' or 'gzip' from an Accept-Encoding header, or None."""
+    accepted = set()
+    for item in accept_encoding.split(','):
+        name, _, params = item.strip().partition(';')
+        q = params.strip()
+        if q.startswith('q='):
+            try:
+                if float(q[2:]) <= 0:
+                    continue
+            except ValueError:
+                continue
+        accepted.add(name.strip().lower())
+    if brotli is not None and 'br' in accepted:
+        return 'br'
+    if 'gzip' in accepted:
+        return 'gzip'
+    return None
+
+
+def _compressor(encoding: str, gzip_level: int, brotli_quality: int) -> Tuple[Callable, Callable]:
+    """(compress chunk, finish) functions for an encoding."""
+    if encoding == 'br':
+        compressor = brotli.Compressor(quality=brotli_quality)
+        return compressor.process, compressor.finish
+    compressor = zlib.compressobj(gzip_level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    return compressor.compress, compressor.flush
+
+
+class CompressionMiddleware:
+    """ASGI middleware compressing text responses of at least ``minimum_size`` bytes."""
+
+    def __init__(self, app, minimum_size: int = 500, gzip_level: int = 6, brotli_quality: int = 5):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+
+    async def __call__(self, scope, receive, send) -> None:
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+        encoding = choose_encoding(Headers(scope=scope).get('accept-encoding', ''))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start = None
+        compress = finish = None
+
+        async def send_compressed(message) -> None:
+            nonlocal start, compress, finish
+            if message['type'] == 'http.response.start':
+                # Held until the first body chunk shows whether to compress
+                start = message
+                return
+            if message['type'] != 'http.response.body':
+                await send(message)
+                return
+
+            body = message.get('body', b'')
+            more_body = message.get('more_body', False)
+            if start is not None:
+                message_start, start = start, None
+                headers = MutableHeaders(raw=message_start['headers'])
+                media_type = headers.get('content-type', '').partition(';')[0].strip().lower()
+                if media_type not in COMPRESSIBLE_TYPES or 'content-encoding' in headers:
+                    await send(message_start)
+                    await send(message)
+                    return
+                headers.add_vary_header('Accept-Encoding')
+                if not more_body and len(body) < self.minimum_size:
+                    await send(message_start)
+                    await send(message)
+                    return
+                compress, finish = _compressor(encoding, self.gzip_level, self.brotli_quality)
+                headers['Content-Encoding'] = encoding
+                if more_body:
+                    del headers['Content-Length']
+                else:
+                    body = compress(body) + finish()
+                    headers['Content-Length'] = str(len(body))
+                    await send(message_start)
+                    await send({'type': 'http.response.body', 'body': body})
+                    return
+                await send(message_start)
+
+            if compress is None:
+                await send(message)
+                return
+            data = compress(body)
+            if not more_body:
+                data += finish()
+            if data or not more_body:
+                await send({'type': 'http.response.body', 'body': data, 'more_body': more_body})
+
+        await self.app(scope, receive, send_compressed)
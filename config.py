@@ -15,8 +15,77 @@ DATABASE_CONFIG = {
     'database': os.getenv('DB_NAME', 'gaussdb_ops'),
     'user': os.getenv('DB_USER', 'postgres'),
     'password': os.getenv('DB_PASSWORD', ''),
+
+    # Apply pending schema migrations when the app starts
+    'auto_migrate': os.getenv('DB_AUTO_MIGRATE', 'true').lower() in ('1', 'true', 'yes'),
+
+    # Threads per worker that run blocking database calls off the event loop
+    'executor_workers': int(os.getenv('DB_EXECUTOR_WORKERS', '8')),
+
+    # Connection pool settings (per uvicorn worker process)
+    'pool': {
+        'min_size': int(os.getenv('DB_POOL_MIN_SIZE', '1')),
+        'max_size': int(os.getenv('DB_POOL_MAX_SIZE', '10')),
+        'idle_timeout': float(os.getenv('DB_POOL_IDLE_TIMEOUT', '300')),
+        'acquire_timeout': float(os.getenv('DB_POOL_TIMEOUT', '30')),
+        'health_check_interval': float(os.getenv('DB_POOL_HEALTH_CHECK_INTERVAL', '30')),
+    },
+
+    # In-process ticket cache (per uvicorn worker process)
+    'cache': {
+        'enabled': os.getenv('CACHE_ENABLED', 'true').lower() in ('1', 'true', 'yes'),
+        'ttl': float(os.getenv('CACHE_TTL', '300')),
+        'max_entries': int(os.getenv('CACHE_MAX_ENTRIES', '10000')),
+        # Seconds between change probes (count/max(update_time)) against the database
+        'probe_interval': float(os.getenv('CACHE_PROBE_INTERVAL', '5')),
+        # Propagate review saves to the other uvicorn workers' caches
+        'coherence': os.getenv('CACHE_COHERENCE', 'true').lower() in ('1', 'true', 'yes'),
+    },
 }
 
+# Background export jobs (see jobs.py)
+EXPORT_CONFIG = {
+    # Local directory holding job state and cached export files
+    'directory': os.getenv('EXPORT_DIR', 'exports'),
+    # Export processes per uvicorn worker
+    'workers': int(os.getenv('EXPORT_WORKERS', '2')),
+    # Least recently used results are deleted beyond this size
+    'max_cache_bytes': int(float(os.getenv('EXPORT_CACHE_MB', '1024')) * 1024 * 1024),
+}
+
+# Response compression (see compression.py): brotli when installed, else gzip
+COMPRESSION_CONFIG = {
+    'enabled': os.getenv('COMPRESSION_ENABLED', 'true').lower() in ('1', 'true', 'yes'),
+    # Smaller responses are sent uncompressed
+    'minimum_size': int(os.getenv('COMPRESSION_MIN_SIZE', '500')),
+}
+
+# Prometheus metrics on /metrics (see metrics.py), summed over the uvicorn workers
+METRICS_CONFIG = {
+    'enabled': os.getenv('METRICS_ENABLED', 'true').lower() in ('1', 'true', 'yes'),
+    # Directory the workers share their metrics through; one per deployment
+    # (default: <tmp>/gaussdb_ops_metrics)
+    'directory': os.getenv('METRICS_DIR', ''),
+    # Seconds between writes of a worker's metrics (staleness seen by other workers' scrapes)
+    'flush_interval': float(os.getenv('METRICS_FLUSH_INTERVAL', '1')),
+}
+
+# Query tracing (off by default: it wraps every cursor)
+TRACING_CONFIG = {
+    'enabled': os.getenv('TRACE_ENABLED', 'false').lower() in ('1', 'true', 'yes'),
+    # Queries at least this slow are logged, with their plan if 'explain' is set
+    'slow_query_ms': float(os.getenv('TRACE_SLOW_QUERY_MS', '100')),
+    # Requests at least this slow are logged with all their queries
+    'slow_request_ms': float(os.getenv('TRACE_SLOW_REQUEST_MS', '500')),
+    # Run EXPLAIN (QUERY PLAN) for slow SELECTs
+    'explain': os.getenv('TRACE_EXPLAIN', 'false').lower() in ('1', 'true', 'yes'),
+    # Add a Server-Timing header (database, rendering and slowest queries) to responses
+    'server_timing': os.getenv('TRACE_SERVER_TIMING', 'true').lower() in ('1', 'true', 'yes'),
+}
+
+# Review history revisions older than this are thinned by `python history.py --compact`
+REVIEW_HISTORY_KEEP_DAYS = int(os.getenv('REVIEW_HISTORY_KEEP_DAYS', '90'))
+
 # Server configuration
 SERVER_HOST = os.getenv('SERVER_HOST', '127.0.0.1')
 SERVER_PORT = int(os.getenv('SERVER_PORT', '3011'))
@@ -1,7 +1,33 @@
 """Database abstraction layer."""
 from abc import ABC, abstractmethod
-from typing import List, Dict, Any, Optional
-import json
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Any, Optional, Callable, Iterator
+import asyncio
+import contextvars
+import functools
+
+import metrics
+import migrations
+import search
+import tracing
+from history import build_history_query
+from pool import ConnectionPool
+from query import (SUMMARY_FIELDS, TicketQuery, TicketRow, build_count_query, build_ticket_query,
+                   encode_cursor, parse_row)
+from rawjson import RawJSON
+from stats import build_stats_query
+
+
+class ReviewConflictError(Exception):
+    """A conditional review save found another version than the expected one.
+
+    ``conflicts`` maps each conflicting processId to its current review
+    (None if the ticket has no review).
+    """
+
+    def __init__(self, conflicts: Dict[str, Optional[Dict[str, Any]]]):
+        super().__init__(f"Review changed concurrently: {', '.join(conflicts)}")
+        self.conflicts = conflicts
 
 
 class DatabaseInterface(ABC):
@@ -18,7 +44,7 @@ class DatabaseInterface(ABC):
         pass
 
     @abstractmethod
-    def get_ticket_list(self) -> List[Dict[str, Any]]:
+    def get_ticket_list(self) -> List[TicketRow]:
         """Get ticket list with summary info only."""
         pass
 
@@ -43,36 +69,321 @@ class DatabaseInterface(ABC):
         pass
 
     @abstractmethod
-    def save_ticket_review(self, process_id: str, conclusion: str, content: str) -> Dict[str, Any]:
-        """Save or update review for a ticket. Returns the saved review."""
+    def save_ticket_reviews(self, reviews: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Save or update reviews in one transaction. Returns the saved reviews.
+
+        Each item has ``processId``, ``conclusion`` and ``content``, and
+        optionally the expected ``version`` (0: the ticket has no review
+        yet). Items with a version are compare-and-swap updates; if any
+        finds another version, nothing is saved and ReviewConflictError is
+        raised. A ticket listed twice is saved once, with its last values;
+        results follow the order in which tickets first appear.
+        """
         pass
 
-    def _parse_ticket_summary(self, row) -> Dict[str, Any]:
-        """Parse a database row into a ticket summary dictionary."""
-        create_time = row[3]
-        update_time = row[4] if row[4] else create_time
-        has_review = bool(row[7]) if len(row) > 7 else False
-        conclusion = row[8] if len(row) > 8 else None
-        review_time = row[9] if len(row) > 9 else None
+    def save_ticket_review(self, process_id: str, conclusion: str, content: str,
+                           version: Optional[int] = None) -> Dict[str, Any]:
+        """Save or update review for a ticket. Returns the saved review.
+
+        With ``version``, only saves if the review still has that version.
+        """
+        return self.save_ticket_reviews(
+            [{'processId': process_id, 'conclusion': conclusion, 'content': content, 'version': version}]
+        )[0]
+
+    @staticmethod
+    def _review_rows(reviews: List[Dict[str, Any]]) -> List[tuple]:
+        """(processId, conclusion, content, version) per distinct ticket, last values winning."""
+        rows = {}
+        for review in reviews:
+            # Ensure content is never None (NOT NULL constraint in database)
+            rows[review['processId']] = (
+                review.get('conclusion') or "", review.get('content') or "", review.get('version')
+            )
+        return [(process_id,) + values for process_id, values in rows.items()]
 
-        # Check if review is expired (review time < ticket update time)
-        review_expired = False
-        if has_review and review_time and update_time:
-            review_expired = str(review_time) < str(update_time)
+    @abstractmethod
+    def _create_pool(self) -> ConnectionPool:
+        """Create the connection pool for this backend."""
+        pass
+
+    def _get_pool(self) -> ConnectionPool:
+        if self._pool is None:
+            self._pool = self._create_pool()
+        return self._pool
+
+    def _connection(self):
+        """Check out a pooled connection (context manager)."""
+        return self._get_pool().connection()
+
+    def pool_stats(self) -> Dict[str, Any]:
+        """Get connection pool statistics."""
+        return self._get_pool().stats()
+
+    def get_ticket_page(self, query: TicketQuery) -> Dict[str, Any]:
+        """Get one keyset-paginated page of tickets matching the query.
 
+        Returns ``{'items': [...], 'nextCursor': str | None}``.
+        """
+        sql, params, fields, key_count = build_ticket_query(query, self.dialect)
+        with self._connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(sql, params)
+            rows = cursor.fetchall()
+
+        next_cursor = None
+        if query.limit is not None and len(rows) > query.limit:
+            rows = rows[:query.limit]
+            next_cursor = encode_cursor(query.sort, list(rows[-1][-key_count:]))
         return {
-            'processId': row[0],
-            'issueType': row[1],
-            'owner': row[2],
-            'createTime': create_time,
-            'updateTime': update_time,
-            'problem': row[5],
-            'score': row[6],
-            'hasReview': has_review,
-            'conclusion': conclusion,
-            'reviewExpired': review_expired
+            'items': [parse_row(row, fields) for row in rows],
+            'nextCursor': next_cursor
+        }
+
+    def query_tickets(self, query: TicketQuery) -> List[TicketRow]:
+        """Get all tickets matching the query's filters, in its sort order."""
+        sql, params, fields, _ = build_ticket_query(query, self.dialect)
+        with self._connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(sql, params)
+            return [parse_row(row, fields) for row in cursor.fetchall()]
+
+    def _stream_cursor(self, conn):
+        """Cursor for reading a large result incrementally."""
+        return conn.cursor()
+
+    def iter_tickets(self, query: TicketQuery, batch_size: int = 1000) -> Iterator[TicketRow]:
+        """Yield tickets matching the query, fetching ``batch_size`` rows at a time.
+
+        Holds a pooled connection until the generator is exhausted or closed.
+        """
+        sql, params, fields, _ = build_ticket_query(query, self.dialect)
+        with self._connection() as conn:
+            cursor = self._stream_cursor(conn)
+            try:
+                cursor.execute(sql, params)
+                while True:
+                    rows = cursor.fetchmany(batch_size)
+                    if not rows:
+                        break
+                    for row in rows:
+                        yield parse_row(row, fields)
+            finally:
+                cursor.close()
+
+    def search_tickets(self, q: str, query: TicketQuery, limit: int = 20,
+                       offset: int = 0) -> Dict[str, Any]:
+        """Full-text search within the tickets matching the query's filters.
+
+        Returns ``{'items': [...], 'nextOffset': int | None, 'truncated': bool}``,
+        best matches first; each item is a ticket summary plus
+        ``highlight``/``matchedField``. ``truncated`` is set when more than
+        ``search.SEARCH_CANDIDATES`` tickets match: only the most recent of
+        them are ranked and paged through.
+        """
+        terms = search.parse_terms(q)
+        if not terms:
+            return {'items': [], 'nextOffset': None, 'truncated': False}
+        sql, params, fields = search.build_search_query(terms, query, self.dialect, limit, offset)
+        truncated = False
+        with self._connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(sql, params)
+            rows = cursor.fetchall()
+            if rows and rows[0][-1] >= search.SEARCH_CANDIDATES:
+                cursor.execute(*search.build_overflow_query(terms, query, self.dialect))
+                truncated = cursor.fetchone() is not None
+
+        next_offset = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_offset = offset + limit
+        texts = slice(len(fields), len(fields) + len(search.SEARCH_COLUMNS))
+        items = [
+            search.decorate_result(parse_row(row, fields)._asdict(), list(row[texts]), terms)
+            for row in rows
+        ]
+        return {'items': items, 'nextOffset': next_offset, 'truncated': truncated}
+
+    def count_tickets(self, query: TicketQuery) -> int:
+        """Count tickets matching the query's filters."""
+        sql, params = build_count_query(query, self.dialect)
+        with self._connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(sql, params)
+            return cursor.fetchone()[0]
+
+    def get_review_history(self, process_id: str, limit: int = 20,
+                           before: Optional[int] = None) -> Dict[str, Any]:
+        """Get a page of a ticket's review revisions, newest first.
+
+        Returns ``{'items': [...], 'nextBefore': int | None}``; pass
+        ``nextBefore`` as ``before`` for the next page.
+        """
+        sql, params = build_history_query(self.dialect, limit, before)
+        with self._connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(sql, [process_id] + params)
+            rows = cursor.fetchall()
+
+        next_before = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_before = rows[-1][1]
+        items = []
+        for row in rows:
+            update_time = row[2]
+            if hasattr(update_time, 'strftime'):
+                update_time = update_time.strftime('%Y-%m-%dT%H:%M:%SZ')
+            items.append({
+                'processId': row[0],
+                'version': row[1],
+                'updateTime': update_time,
+                'conclusion': row[3],
+                'content': row[4]
+            })
+        return {'items': items, 'nextBefore': next_before}
+
+    def get_ticket_stats(self) -> List[tuple]:
+        """Get ticket counts per (issueType, owner, review status, score band).
+
+        Returns ``(issueType, owner, status, band, count)`` cells; see stats.py.
+        """
+        with self._connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(build_stats_query())
+            return [tuple(row) for row in cursor.fetchall()]
+
+    def get_facets(self) -> Dict[str, List[str]]:
+        """Get the distinct issue types and owners used by the filter dropdowns."""
+        with self._connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                SELECT DISTINCT "issueType" FROM ticket_classification_2512
+                WHERE "issueType" IS NOT NULL ORDER BY 1
+            ''')
+            issue_types = [row[0] for row in cursor.fetchall()]
+            cursor.execute('''
+                SELECT DISTINCT "owner" FROM ticket_classification_2512
+                WHERE "owner" IS NOT NULL ORDER BY 1
+            ''')
+            owners = [row[0] for row in cursor.fetchall()]
+        return {'issueTypes': issue_types, 'owners': owners}
+
+    def get_ticket_details(self, process_ids: List[str]) -> Dict[str, Dict[str, Any]]:
+        """Get several tickets with their reviews in one query.
+
+        Returns ``{processId: {'ticket': ..., 'review': ... or None}}``;
+        unknown IDs are left out.
+        """
+        if not process_ids:
+            return {}
+        p = '?' if self.dialect == 'sqlite' else '%s'
+        with self._connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(f'''
+                SELECT T2."流程ID", C."issueType", C."owner", T2.create_time, T2.update_time,
+                       T2."问题现象", T2."问题根因", T2."分析过程", T2."解决方案",
+                       T2.diff_score, T2."得分", T2."理由",
+                       R.id, R.processid, R.createtime, R.updatetime, R.conclusion, R.content, R.version
+                FROM operations_kb as T2
+                JOIN ticket_classification_2512 as C ON T2."流程ID" = C."processId"
+                LEFT JOIN ticket_review as R ON T2."流程ID" = R.processid
+                WHERE T2."流程ID" IN ({', '.join([p] * len(process_ids))})
+            ''', list(process_ids))
+            rows = cursor.fetchall()
+        return {
+            row[0]: {
+                'ticket': self._parse_ticket_row(row[:12]),
+                'review': self._parse_review(row[12:]) if row[12] is not None else None
+            }
+            for row in rows
+        }
+
+    def get_ticket_reviews(self, process_ids: List[str]) -> Dict[str, Dict[str, Any]]:
+        """Get the reviews of several tickets with one query, keyed by processId.
+
+        Tickets without a review are left out.
+        """
+        if not process_ids:
+            return {}
+        p = '?' if self.dialect == 'sqlite' else '%s'
+        with self._connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(f'''
+                SELECT id, processid, createtime, updatetime, conclusion, content, version
+                FROM ticket_review WHERE processid IN ({', '.join([p] * len(process_ids))})
+            ''', list(process_ids))
+            return {row[1]: self._parse_review(row) for row in cursor.fetchall()}
+
+    def get_ticket_validator(self, process_id: str) -> Optional[tuple]:
+        """Get what a ticket's HTTP validators derive from, without loading the ticket.
+
+        Returns ``(createTime, updateTime, issueType, owner, reviewVersion,
+        reviewUpdateTime)``, or None if there is no such ticket. A primary
+        key lookup in each table.
+        """
+        p = '?' if self.dialect == 'sqlite' else '%s'
+        with self._connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(f'''
+                SELECT T2.create_time, T2.update_time, S.issue_type, S.owner, R.version, R.updatetime
+                FROM operations_kb as T2
+                JOIN ticket_review_state as S ON T2."流程ID" = S.processid
+                LEFT JOIN ticket_review as R ON T2."流程ID" = R.processid
+                WHERE T2."流程ID" = {p}
+            ''', (process_id,))
+            row = cursor.fetchone()
+        return tuple(row) if row else None
+
+    def get_data_version(self) -> Dict[str, Any]:
+        """Get a cheap change stamp for ticket and review data.
+
+        Used to decide when cached data must be reloaded; each part only
+        changes when rows in the corresponding tables are added, updated or
+        deleted. The last element of each part is a data_generation counter
+        bumped by triggers on every write, so the stamp moves even when the
+        counts and (second-resolution) timestamps stay the same. The second
+        element is the latest modification time, for Last-Modified.
+        """
+        with self._connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                SELECT (SELECT COUNT(*) FROM operations_kb),
+                       (SELECT MAX(update_time) FROM operations_kb),
+                       (SELECT COUNT(*) FROM ticket_classification_2512),
+                       (SELECT generation FROM data_generation WHERE name = 'tickets'),
+                       (SELECT COUNT(*) FROM ticket_review),
+                       (SELECT MAX(updatetime) FROM ticket_review),
+                       (SELECT generation FROM data_generation WHERE name = 'reviews')
+            ''')
+            row = cursor.fetchone()
+        return {
+            'tickets': [row[0], row[1], row[2], row[3]],
+            'reviews': [row[4], str(row[5]) if row[5] else None, row[6]]
         }
 
+    def migrate(self) -> List[int]:
+        """Apply pending schema migrations. Returns the versions applied."""
+        with self._connection() as conn:
+            return migrations.migrate(conn, self.dialect)
+
+    def get_schema_version(self) -> int:
+        """Get the currently applied schema version."""
+        with self._connection() as conn:
+            return migrations.get_schema_version(conn)
+
+    def _parse_ticket_summary(self, row) -> TicketRow:
+        """Parse a database row into a ticket summary.
+
+        The row holds the SUMMARY_FIELDS, with the review's id for hasReview
+        and the ticket_review_state expired flag for reviewExpired.
+        """
+        values = list(row)
+        # update_time falls back to create_time
+        values[4] = values[4] or values[3]
+        return parse_row(values, SUMMARY_FIELDS)
+
     def _parse_ticket_row(self, row) -> Dict[str, Any]:
         """Parse a database row into a full ticket dictionary."""
         create_time = row[3]
@@ -85,8 +396,8 @@ class DatabaseInterface(ABC):
             'updateTime': update_time,
             'problem': row[5],
             'rootCause': row[6],
-            'analysis': json.loads(row[7]) if row[7] else [],
-            'solution': json.loads(row[8]) if row[8] else [],
+            'analysis': RawJSON(row[7] or '[]'),
+            'solution': RawJSON(row[8] or '[]'),
             'diffScore': row[9],
             'score': row[10],
             'reason': row[11]
@@ -96,68 +407,56 @@ class DatabaseInterface(ABC):
 class SQLiteDatabase(DatabaseInterface):
     """SQLite implementation."""
 
-    def __init__(self, db_path: str):
+    dialect = 'sqlite'
+
+    def __init__(self, db_path: str, pool_config: Optional[Dict[str, Any]] = None):
         self.db_path = db_path
-        self.conn = None
+        self.pool_config = pool_config or {}
+        self._pool = None
 
     def connect(self) -> None:
-        import sqlite3
-        self.conn = sqlite3.connect(self.db_path, check_same_thread=False)
-        self.conn.row_factory = sqlite3.Row
+        self._get_pool().open()
 
     def close(self) -> None:
-        if self.conn:
-            self.conn.close()
-            self.conn = None
+        if self._pool:
+            self._pool.close()
 
-    def _get_connection(self):
+    def _create_connection(self):
         import sqlite3
-        # Create new connection for each request (thread-safe)
-        conn = sqlite3.connect(self.db_path)
+        # Pooled connections move between executor threads, one thread at a time
+        conn = sqlite3.connect(self.db_path, check_same_thread=False)
         conn.row_factory = sqlite3.Row
-        return conn
+        # WAL (persistent in the database file): a long read such as a streamed
+        # export no longer holds a lock that makes review saves fail with
+        # "database is locked", and saves don't block readers
+        conn.execute('PRAGMA journal_mode=WAL')
+        return tracing.wrap_connection(conn, 'sqlite')
+
+    def _create_pool(self) -> ConnectionPool:
+        return ConnectionPool(
+            factory=self._create_connection,
+            health_check=lambda conn: conn.execute('SELECT 1').fetchone(),
+            reset=lambda conn: conn.rollback(),
+            **self.pool_config
+        )
 
-    def _ensure_review_table(self, conn):
-        """Create ticket_review table if not exists."""
-        cursor = conn.cursor()
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS ticket_review (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                processId TEXT NOT NULL UNIQUE,
-                createTime TEXT NOT NULL,
-                updateTime TEXT NOT NULL,
-                conclusion TEXT,
-                content TEXT NOT NULL
-            )
-        ''')
-        # Add conclusion column if not exists (for existing tables)
-        cursor.execute("PRAGMA table_info(ticket_review)")
-        columns = [row[1] for row in cursor.fetchall()]
-        if 'conclusion' not in columns:
-            cursor.execute('ALTER TABLE ticket_review ADD COLUMN conclusion TEXT')
-        conn.commit()
-
-    def get_ticket_list(self) -> List[Dict[str, Any]]:
-        conn = self._get_connection()
-        try:
-            self._ensure_review_table(conn)
+    def get_ticket_list(self) -> List[TicketRow]:
+        with self._connection() as conn:
             cursor = conn.cursor()
             cursor.execute('''
                 SELECT T2."流程ID", C."issueType", C."owner", T2.create_time, T2.update_time,
-                       T2."问题现象", T2."得分", R.id, R.conclusion, R.updateTime
+                       T2."问题现象", T2."得分", R.id, R.conclusion, S.expired
                 FROM operations_kb as T2
                 JOIN ticket_classification_2512 as C ON T2."流程ID" = C."processId"
+                JOIN ticket_review_state as S ON T2."流程ID" = S.processid
                 LEFT JOIN ticket_review as R ON T2."流程ID" = R.processId
                 ORDER BY T2.update_time DESC, T2.create_time DESC
             ''')
             rows = cursor.fetchall()
             return [self._parse_ticket_summary(row) for row in rows]
-        finally:
-            conn.close()
 
     def get_all_tickets(self) -> List[Dict[str, Any]]:
-        conn = self._get_connection()
-        try:
+        with self._connection() as conn:
             cursor = conn.cursor()
             cursor.execute('''
                 SELECT T2."流程ID", C."issueType", C."owner", T2.create_time, T2.update_time,
@@ -169,12 +468,9 @@ class SQLiteDatabase(DatabaseInterface):
             ''')
             rows = cursor.fetchall()
             return [self._parse_ticket_row(row) for row in rows]
-        finally:
-            conn.close()
 
     def get_ticket_by_id(self, process_id: str) -> Optional[Dict[str, Any]]:
-        conn = self._get_connection()
-        try:
+        with self._connection() as conn:
             cursor = conn.cursor()
             cursor.execute('''
                 SELECT T2."流程ID", C."issueType", C."owner", T2.create_time, T2.update_time,
@@ -185,159 +481,167 @@ class SQLiteDatabase(DatabaseInterface):
             ''', (process_id,))
             row = cursor.fetchone()
             return self._parse_ticket_row(row) if row else None
-        finally:
-            conn.close()
+
+    @staticmethod
+    def _parse_review(row) -> Dict[str, Any]:
+        return {
+            'id': row[0],
+            'processId': row[1],
+            'createTime': row[2],
+            'updateTime': row[3],
+            'conclusion': row[4],
+            'content': row[5],
+            'version': row[6]
+        }
 
     def get_ticket_review(self, process_id: str) -> Optional[Dict[str, Any]]:
-        conn = self._get_connection()
-        try:
-            self._ensure_review_table(conn)
+        with self._connection() as conn:
             cursor = conn.cursor()
             cursor.execute('''
-                SELECT id, processId, createTime, updateTime, conclusion, content
+                SELECT id, processId, createTime, updateTime, conclusion, content, version
                 FROM ticket_review WHERE processId = ?
             ''', (process_id,))
             row = cursor.fetchone()
-            if row:
-                return {
-                    'id': row[0],
-                    'processId': row[1],
-                    'createTime': row[2],
-                    'updateTime': row[3],
-                    'conclusion': row[4],
-                    'content': row[5]
-                }
-            return None
-        finally:
-            conn.close()
+            return self._parse_review(row) if row else None
 
     def get_all_reviews(self) -> Dict[str, Dict[str, Any]]:
-        conn = self._get_connection()
-        try:
-            self._ensure_review_table(conn)
+        with self._connection() as conn:
             cursor = conn.cursor()
             cursor.execute('''
-                SELECT id, processId, createTime, updateTime, conclusion, content
+                SELECT id, processId, createTime, updateTime, conclusion, content, version
                 FROM ticket_review
             ''')
-            result = {}
-            for row in cursor.fetchall():
-                result[row[1]] = {
-                    'id': row[0],
-                    'processId': row[1],
-                    'createTime': row[2],
-                    'updateTime': row[3],
-                    'conclusion': row[4],
-                    'content': row[5]
-                }
-            return result
-        finally:
-            conn.close()
-
-    def save_ticket_review(self, process_id: str, conclusion: str, content: str) -> Dict[str, Any]:
+            return {row[1]: self._parse_review(row) for row in cursor.fetchall()}
+
+    def save_ticket_reviews(self, reviews: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
         from datetime import datetime, timezone
-        conn = self._get_connection()
-        try:
-            self._ensure_review_table(conn)
+        now = datetime.now(timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ')
+        rows = self._review_rows(reviews)
+        saved = []
+        conflicts = []
+        with self._connection() as conn:
             cursor = conn.cursor()
-            now = datetime.now(timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ')
-
-            # Ensure content is never None (NOT NULL constraint in database)
-            if content is None:
-                content = ""
-            if conclusion is None:
-                conclusion = ""
-
-            # Check if review exists
-            cursor.execute('SELECT id, createTime FROM ticket_review WHERE processId = ?', (process_id,))
-            existing = cursor.fetchone()
-
-            if existing:
-                # Update existing
-                cursor.execute('''
-                    UPDATE ticket_review SET conclusion = ?, content = ?, updateTime = ? WHERE processId = ?
-                ''', (conclusion, content, now, process_id))
-                create_time = existing[1]
-                review_id = existing[0]
-            else:
-                # Insert new
-                cursor.execute('''
-                    INSERT INTO ticket_review (processId, createTime, updateTime, conclusion, content)
-                    VALUES (?, ?, ?, ?, ?)
-                ''', (process_id, now, now, conclusion, content))
-                create_time = now
-                review_id = cursor.lastrowid
-
+            # One statement per row, but all in one transaction (no round-trips in SQLite)
+            for process_id, conclusion, content, version in rows:
+                if version is None:
+                    cursor.execute('''
+                        INSERT INTO ticket_review (processId, createTime, updateTime, conclusion, content)
+                        VALUES (?, ?, ?, ?, ?)
+                        ON CONFLICT (processId) DO UPDATE SET
+                            conclusion = excluded.conclusion, content = excluded.content,
+                            updateTime = excluded.updateTime, version = ticket_review.version + 1
+                        RETURNING id, processId, createTime, updateTime, conclusion, content, version
+                    ''', (process_id, now, now, conclusion, content))
+                elif version == 0:
+                    # Create only: someone else may have created it meanwhile
+                    cursor.execute('''
+                        INSERT INTO ticket_review (processId, createTime, updateTime, conclusion, content)
+                        VALUES (?, ?, ?, ?, ?)
+                        ON CONFLICT (processId) DO NOTHING
+                        RETURNING id, processId, createTime, updateTime, conclusion, content, version
+                    ''', (process_id, now, now, conclusion, content))
+                else:
+                    cursor.execute('''
+                        UPDATE ticket_review
+                        SET conclusion = ?, content = ?, updateTime = ?, version = version + 1
+                        WHERE processId = ? AND version = ?
+                        RETURNING id, processId, createTime, updateTime, conclusion, content, version
+                    ''', (conclusion, content, now, process_id, version))
+                row = cursor.fetchone()
+                if row is None:
+                    conflicts.append(process_id)
+                else:
+                    saved.append(self._parse_review(row))
+
+            if conflicts:
+                conn.rollback()
+                cursor.execute(f'''
+                    SELECT id, processId, createTime, updateTime, conclusion, content, version
+                    FROM ticket_review WHERE processId IN ({', '.join(['?'] * len(conflicts))})
+                ''', conflicts)
+                current = {row[1]: self._parse_review(row) for row in cursor.fetchall()}
+                raise ReviewConflictError({pid: current.get(pid) for pid in conflicts})
             conn.commit()
-            return {
-                'id': review_id,
-                'processId': process_id,
-                'createTime': create_time,
-                'updateTime': now,
-                'conclusion': conclusion,
-                'content': content
-            }
-        finally:
-            conn.close()
+        return saved
 
 
 class PostgreSQLDatabase(DatabaseInterface):
     """PostgreSQL implementation."""
 
-    def __init__(self, host: str, port: int, database: str, user: str, password: str):
+    dialect = 'postgresql'
+
+    def __init__(self, host: str, port: int, database: str, user: str, password: str,
+                 pool_config: Optional[Dict[str, Any]] = None):
         self.host = host
         self.port = port
         self.database = database
         self.user = user
         self.password = password
-        self.conn = None
+        self.pool_config = pool_config or {}
+        self._pool = None
 
     def connect(self) -> None:
-        import psycopg2
-        self.conn = psycopg2.connect(
-            host=self.host,
-            port=self.port,
-            database=self.database,
-            user=self.user,
-            password=self.password
-        )
+        self._get_pool().open()
 
     def close(self) -> None:
-        if self.conn:
-            self.conn.close()
-            self.conn = None
+        if self._pool:
+            self._pool.close()
 
-    def _get_connection(self):
+    def _create_connection(self):
         import psycopg2
-        return psycopg2.connect(
+        conn = psycopg2.connect(
             host=self.host,
             port=self.port,
             database=self.database,
             user=self.user,
             password=self.password
         )
+        return tracing.wrap_connection(conn, 'postgresql')
+
+    @staticmethod
+    def _health_check(conn) -> None:
+        cursor = conn.cursor()
+        cursor.execute('SELECT 1')
+        cursor.fetchone()
+        conn.rollback()
+
+    @staticmethod
+    def _reset(conn) -> None:
+        if conn.closed:
+            raise RuntimeError("connection closed")
+        # Ends the implicit read transaction so the next borrower gets a fresh snapshot
+        conn.rollback()
+
+    def _stream_cursor(self, conn):
+        # A named (server-side) cursor; a plain psycopg2 cursor would pull the
+        # whole result into memory on execute()
+        return conn.cursor(name='ticket_stream')
+
+    def _create_pool(self) -> ConnectionPool:
+        return ConnectionPool(
+            factory=self._create_connection,
+            health_check=self._health_check,
+            reset=self._reset,
+            **self.pool_config
+        )
 
-    def get_ticket_list(self) -> List[Dict[str, Any]]:
-        conn = self._get_connection()
-        try:
-            self._ensure_review_table(conn)
+    def get_ticket_list(self) -> List[TicketRow]:
+        with self._connection() as conn:
             cursor = conn.cursor()
             cursor.execute('''
                 SELECT T2."流程ID", C."issueType", C."owner", T2.create_time, T2.update_time,
-                       T2."问题现象", T2."得分", R.id, R.conclusion, R.updatetime
+                       T2."问题现象", T2."得分", R.id, R.conclusion, S.expired
                 FROM operations_kb as T2
                 JOIN ticket_classification_2512 as C ON T2."流程ID" = C."processId"
+                JOIN ticket_review_state as S ON T2."流程ID" = S.processid
                 LEFT JOIN ticket_review as R ON T2."流程ID" = R.processid
                 ORDER BY T2.update_time DESC, T2.create_time DESC
             ''')
             rows = cursor.fetchall()
             return [self._parse_ticket_summary(row) for row in rows]
-        finally:
-            conn.close()
 
     def get_all_tickets(self) -> List[Dict[str, Any]]:
-        conn = self._get_connection()
-        try:
+        with self._connection() as conn:
             cursor = conn.cursor()
             cursor.execute('''
                 SELECT T2."流程ID", C."issueType", C."owner", T2.create_time, T2.update_time,
@@ -349,12 +653,9 @@ class PostgreSQLDatabase(DatabaseInterface):
             ''')
             rows = cursor.fetchall()
             return [self._parse_ticket_row(row) for row in rows]
-        finally:
-            conn.close()
 
     def get_ticket_by_id(self, process_id: str) -> Optional[Dict[str, Any]]:
-        conn = self._get_connection()
-        try:
+        with self._connection() as conn:
             cursor = conn.cursor()
             cursor.execute('''
                 SELECT T2."流程ID", C."issueType", C."owner", T2.create_time, T2.update_time,
@@ -365,137 +666,279 @@ class PostgreSQLDatabase(DatabaseInterface):
             ''', (process_id,))
             row = cursor.fetchone()
             return self._parse_ticket_row(row) if row else None
-        finally:
-            conn.close()
 
-    def _ensure_review_table(self, conn):
-        """Create ticket_review table if not exists."""
-        cursor = conn.cursor()
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS ticket_review (
-                id SERIAL PRIMARY KEY,
-                processid TEXT NOT NULL UNIQUE,
-                createtime TIMESTAMP NOT NULL,
-                updatetime TIMESTAMP NOT NULL,
-                conclusion TEXT,
-                content TEXT NOT NULL
-            )
-        ''')
-        # Add conclusion column if not exists (for existing tables)
-        cursor.execute('''
-            DO $$ BEGIN
-                ALTER TABLE ticket_review ADD COLUMN conclusion TEXT;
-            EXCEPTION WHEN duplicate_column THEN NULL;
-            END $$;
-        ''')
-        conn.commit()
+    @staticmethod
+    def _parse_review(row) -> Dict[str, Any]:
+        return {
+            'id': row[0],
+            'processId': row[1],
+            'createTime': row[2].strftime('%Y-%m-%dT%H:%M:%SZ') if row[2] else None,
+            'updateTime': row[3].strftime('%Y-%m-%dT%H:%M:%SZ') if row[3] else None,
+            'conclusion': row[4],
+            'content': row[5],
+            'version': row[6]
+        }
 
     def get_ticket_review(self, process_id: str) -> Optional[Dict[str, Any]]:
-        conn = self._get_connection()
-        try:
-            self._ensure_review_table(conn)
+        with self._connection() as conn:
             cursor = conn.cursor()
             cursor.execute('''
-                SELECT id, processid, createtime, updatetime, conclusion, content
+                SELECT id, processid, createtime, updatetime, conclusion, content, version
                 FROM ticket_review WHERE processid = %s
             ''', (process_id,))
             row = cursor.fetchone()
-            if row:
-                return {
-                    'id': row[0],
-                    'processId': row[1],
-                    'createTime': row[2].strftime('%Y-%m-%dT%H:%M:%SZ') if row[2] else None,
-                    'updateTime': row[3].strftime('%Y-%m-%dT%H:%M:%SZ') if row[3] else None,
-                    'conclusion': row[4],
-                    'content': row[5]
-                }
-            return None
-        finally:
-            conn.close()
+            return self._parse_review(row) if row else None
 
     def get_all_reviews(self) -> Dict[str, Dict[str, Any]]:
-        conn = self._get_connection()
-        try:
-            self._ensure_review_table(conn)
+        with self._connection() as conn:
             cursor = conn.cursor()
             cursor.execute('''
-                SELECT id, processid, createtime, updatetime, conclusion, content
+                SELECT id, processid, createtime, updatetime, conclusion, content, version
                 FROM ticket_review
             ''')
-            result = {}
-            for row in cursor.fetchall():
-                result[row[1]] = {
-                    'id': row[0],
-                    'processId': row[1],
-                    'createTime': row[2].strftime('%Y-%m-%dT%H:%M:%SZ') if row[2] else None,
-                    'updateTime': row[3].strftime('%Y-%m-%dT%H:%M:%SZ') if row[3] else None,
-                    'conclusion': row[4],
-                    'content': row[5]
-                }
-            return result
-        finally:
-            conn.close()
-
-    def save_ticket_review(self, process_id: str, conclusion: str, content: str) -> Dict[str, Any]:
+            return {row[1]: self._parse_review(row) for row in cursor.fetchall()}
+
+    def save_ticket_reviews(self, reviews: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
         from datetime import datetime, timezone
-        conn = self._get_connection()
-        try:
-            self._ensure_review_table(conn)
+        now = datetime.now(timezone.utc)
+        rows = self._review_rows(reviews)
+        if not rows:
+            return []
+        upserts = [row for row in rows if row[3] is None]
+        creates = [row for row in rows if row[3] == 0]
+        updates = [row for row in rows if row[3]]
+        returning = 'RETURNING id, processid, createtime, updatetime, conclusion, content, version'
+        saved = {}
+        with self._connection() as conn:
             cursor = conn.cursor()
-            now = datetime.now(timezone.utc)
+            # At most one multi-row statement per kind of save, whatever the batch size
+            if upserts:
+                cursor.execute(f'''
+                    INSERT INTO ticket_review (processid, createtime, updatetime, conclusion, content)
+                    VALUES {', '.join(['(%s, %s, %s, %s, %s)'] * len(upserts))}
+                    ON CONFLICT (processid) DO UPDATE SET
+                        conclusion = excluded.conclusion, content = excluded.content,
+                        updatetime = excluded.updatetime, version = ticket_review.version + 1
+                    {returning}
+                ''', [v for pid, conclusion, content, _ in upserts for v in (pid, now, now, conclusion, content)])
+                saved.update((row[1], self._parse_review(row)) for row in cursor.fetchall())
+            if creates:
+                cursor.execute(f'''
+                    INSERT INTO ticket_review (processid, createtime, updatetime, conclusion, content)
+                    VALUES {', '.join(['(%s, %s, %s, %s, %s)'] * len(creates))}
+                    ON CONFLICT (processid) DO NOTHING
+                    {returning}
+                ''', [v for pid, conclusion, content, _ in creates for v in (pid, now, now, conclusion, content)])
+                saved.update((row[1], self._parse_review(row)) for row in cursor.fetchall())
+            if updates:
+                # Compare-and-swap: row locks only; a concurrent writer makes the
+                # version check fail once it commits
+                cursor.execute(f'''
+                    UPDATE ticket_review AS R
+                    SET conclusion = v.conclusion, content = v.content, updatetime = %s,
+                        version = R.version + 1
+                    FROM (VALUES {', '.join(['(%s, %s, %s, %s)'] * len(updates))})
+                        AS v (processid, conclusion, content, version)
+                    WHERE R.processid = v.processid AND R.version = v.version
+                    RETURNING R.id, R.processid, R.createtime, R.updatetime, R.conclusion, R.content, R.version
+                ''', [now] + [v for row in updates for v in row])
+                saved.update((row[1], self._parse_review(row)) for row in cursor.fetchall())
+
+            conflicts = [row[0] for row in rows if row[0] not in saved]
+            if conflicts:
+                conn.rollback()
+                cursor.execute('''
+                    SELECT id, processid, createtime, updatetime, conclusion, content, version
+                    FROM ticket_review WHERE processid = ANY(%s)
+                ''', (conflicts,))
+                current = {row[1]: self._parse_review(row) for row in cursor.fetchall()}
+                raise ReviewConflictError({pid: current.get(pid) for pid in conflicts})
+            conn.commit()
+        # RETURNING order isn't guaranteed to follow VALUES
+        return [saved[row[0]] for row in rows]
 
-            # Ensure content is never None (NOT NULL constraint in database)
-            if content is None:
-                content = ""
-            if conclusion is None:
-                conclusion = ""
 
-            # Check if review exists
-            cursor.execute('SELECT id, createtime FROM ticket_review WHERE processid = %s', (process_id,))
-            existing = cursor.fetchone()
+def _page_rows(result: Dict[str, Any]) -> int:
+    return len(result['items'])
 
-            if existing:
-                # Update existing
-                cursor.execute('''
-                    UPDATE ticket_review SET conclusion = %s, content = %s, updatetime = %s WHERE processid = %s
-                ''', (conclusion, content, now, process_id))
-                create_time = existing[1]
-                review_id = existing[0]
-            else:
-                # Insert new
-                cursor.execute('''
-                    INSERT INTO ticket_review (processid, createtime, updatetime, conclusion, content)
-                    VALUES (%s, %s, %s, %s, %s) RETURNING id
-                ''', (process_id, now, now, conclusion, content))
-                create_time = now
-                review_id = cursor.fetchone()[0]
 
-            conn.commit()
-            return {
-                'id': review_id,
-                'processId': process_id,
-                'createTime': create_time.strftime('%Y-%m-%dT%H:%M:%SZ') if hasattr(create_time, 'strftime') else create_time,
-                'updateTime': now.strftime('%Y-%m-%dT%H:%M:%SZ'),
-                'conclusion': conclusion,
-                'content': content
-            }
-        finally:
-            conn.close()
+def _single_row(result: Any) -> int:
+    return 0 if result is None else 1
+
+
+# Rows in each method's result, for the db_rows_returned_total metric
+_ROW_COUNTS: Dict[str, Callable[[Any], int]] = {
+    'get_ticket_list': len, 'get_all_tickets': len, 'query_tickets': len, 'get_ticket_stats': len,
+    'get_all_reviews': len, 'get_ticket_details': len, 'get_ticket_reviews': len,
+    'save_ticket_reviews': len,
+    'get_ticket_page': _page_rows, 'search_tickets': _page_rows, 'get_review_history': _page_rows,
+    'get_ticket_by_id': _single_row, 'get_ticket_review': _single_row,
+    'get_ticket_validator': _single_row, 'save_ticket_review': _single_row,
+}
 
 
-def create_database(config: Dict[str, Any]) -> DatabaseInterface:
-    """Factory function to create database instance based on config."""
+def _measured(func: Callable, *args, **kwargs):
+    """Call a DatabaseInterface method, recording its duration and rows returned."""
+    if not metrics.enabled():
+        return func(*args, **kwargs)
+    method = func.__name__
+    with metrics.timer('db_query_duration_seconds', method=method):
+        result = func(*args, **kwargs)
+    row_count = _ROW_COUNTS.get(method)
+    if row_count is not None:
+        metrics.inc('db_rows_returned_total', row_count(result), method=method)
+    return result
+
+
+class AsyncDatabase:
+    """Async adapter that runs a blocking DatabaseInterface on a managed thread pool.
+
+    Every call is dispatched to a bounded executor so a slow query only ties up
+    one executor thread instead of the event loop. The request context is
+    copied into the worker thread so context variables keep working.
+    """
+
+    def __init__(self, db: DatabaseInterface, max_workers: int = 8):
+        self.db = db
+        self.max_workers = max_workers
+        self._executor = None
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(
+                max_workers=self.max_workers,
+                thread_name_prefix='db'
+            )
+        return self._executor
+
+    async def _run(self, func: Callable, *args, **kwargs):
+        loop = asyncio.get_running_loop()
+        ctx = contextvars.copy_context()
+        call = functools.partial(ctx.run, _measured, func, *args, **kwargs)
+        return await loop.run_in_executor(self._get_executor(), call)
+
+    async def connect(self) -> None:
+        await self._run(self.db.connect)
+
+    async def close(self) -> None:
+        if self._executor is not None:
+            await self._run(self.db.close)
+            self._executor.shutdown(wait=True)
+            self._executor = None
+
+    def pool_stats(self) -> Dict[str, Any]:
+        return self.db.pool_stats()
+
+    def cache_stats(self) -> Optional[Dict[str, Any]]:
+        stats = getattr(self.db, 'cache_stats', None)
+        return stats() if stats else None
+
+    async def get_data_version(self) -> Dict[str, Any]:
+        return await self._run(self.db.get_data_version)
+
+    async def migrate(self) -> List[int]:
+        return await self._run(self.db.migrate)
+
+    async def get_ticket_list(self) -> List[TicketRow]:
+        return await self._run(self.db.get_ticket_list)
+
+    async def get_all_tickets(self) -> List[Dict[str, Any]]:
+        return await self._run(self.db.get_all_tickets)
+
+    async def get_ticket_page(self, query: TicketQuery) -> Dict[str, Any]:
+        return await self._run(self.db.get_ticket_page, query)
+
+    async def query_tickets(self, query: TicketQuery) -> List[TicketRow]:
+        return await self._run(self.db.query_tickets, query)
+
+    def iter_tickets(self, query: TicketQuery, batch_size: int = 1000) -> Iterator[TicketRow]:
+        # Blocking generator: consume it from a worker thread (StreamingResponse
+        # iterates sync generators in the threadpool)
+        return self.db.iter_tickets(query, batch_size)
+
+    async def search_tickets(self, q: str, query: TicketQuery, limit: int = 20,
+                             offset: int = 0) -> Dict[str, Any]:
+        return await self._run(self.db.search_tickets, q, query, limit, offset)
+
+    async def count_tickets(self, query: TicketQuery) -> int:
+        return await self._run(self.db.count_tickets, query)
+
+    async def get_facets(self) -> Dict[str, List[str]]:
+        return await self._run(self.db.get_facets)
+
+    async def get_review_history(self, process_id: str, limit: int = 20,
+                                 before: Optional[int] = None) -> Dict[str, Any]:
+        return await self._run(self.db.get_review_history, process_id, limit, before)
+
+    async def get_ticket_stats(self) -> List[tuple]:
+        return await self._run(self.db.get_ticket_stats)
+
+    async def get_ticket_details(self, process_ids: List[str]) -> Dict[str, Dict[str, Any]]:
+        return await self._run(self.db.get_ticket_details, process_ids)
+
+    async def get_ticket_validator(self, process_id: str) -> Optional[tuple]:
+        return await self._run(self.db.get_ticket_validator, process_id)
+
+    async def get_ticket_by_id(self, process_id: str) -> Optional[Dict[str, Any]]:
+        return await self._run(self.db.get_ticket_by_id, process_id)
+
+    async def get_ticket_review(self, process_id: str) -> Optional[Dict[str, Any]]:
+        return await self._run(self.db.get_ticket_review, process_id)
+
+    async def get_all_reviews(self) -> Dict[str, Dict[str, Any]]:
+        return await self._run(self.db.get_all_reviews)
+
+    async def save_ticket_review(self, process_id: str, conclusion: str, content: str,
+                                 version: Optional[int] = None) -> Dict[str, Any]:
+        return await self._run(self.db.save_ticket_review, process_id, conclusion, content, version)
+
+    async def save_ticket_reviews(self, reviews: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        return await self._run(self.db.save_ticket_reviews, reviews)
+
+
+def create_database(config: Dict[str, Any], async_mode: bool = False):
+    """Factory function to create database instance based on config.
+
+    With ``config['cache']['enabled']`` the backend is wrapped in a
+    CachedDatabase. With ``async_mode=True`` the result is wrapped in an
+    AsyncDatabase whose methods are awaitable and never block the event loop.
+    """
     db_type = config.get('type', 'sqlite')
 
+    pool_config = config.get('pool', {})
+
     if db_type == 'sqlite':
-        return SQLiteDatabase(db_path=config.get('path', 'gaussdb_ops.db'))
+        db = SQLiteDatabase(db_path=config.get('path', 'gaussdb_ops.db'), pool_config=pool_config)
     elif db_type == 'postgresql':
-        return PostgreSQLDatabase(
+        db = PostgreSQLDatabase(
             host=config.get('host', 'localhost'),
             port=config.get('port', 5432),
             database=config.get('database', 'gaussdb_ops'),
             user=config.get('user', 'postgres'),
-            password=config.get('password', '')
+            password=config.get('password', ''),
+            pool_config=pool_config
         )
     else:
         raise ValueError(f"Unsupported database type: {db_type}")
+
+    cache_config = config.get('cache', {})
+    if cache_config.get('enabled'):
+        import coherence
+        from cache import CachedDatabase
+        channel = None
+        if cache_config.get('coherence', True):
+            if db_type == 'sqlite':
+                channel = coherence.SQLiteCoherence(db.db_path)
+            else:
+                channel = coherence.PostgreSQLCoherence(db._create_connection)
+        db = CachedDatabase(
+            db,
+            ttl=cache_config.get('ttl', 300.0),
+            max_entries=cache_config.get('max_entries', 10000),
+            probe_interval=cache_config.get('probe_interval', 5.0),
+            channel=channel
+        )
+
+    if async_mode:
+        return AsyncDatabase(db, max_workers=config.get('executor_workers', 8))
+    return db
@@ -0,0 +1,389 @@
+"""Streaming ticket export.
+
+Every format consumes the row iterator once and yields the file in chunks,
+so memory stays bounded no matter how many rows are exported.
+
+- xlsx: the worksheet XML is spooled to a temporary file while column
+  widths are measured, then the package is zipped straight into the response.
+- csv / ndjson: written row by row.
+- parquet / arrow: one row group / record batch per ``ARROW_BATCH_ROWS``
+  rows. Needs the optional ``pyarrow`` package.
+"""
+import csv
+import io
+import json
+import re
+import tempfile
+import zipfile
+from itertools import islice
+from typing import Any, Dict, Iterable, Iterator, List
+from xml.sax.saxutils import escape
+
+import metrics
+from query import BOOL_FIELDS, DETAIL_FIELDS, JSON_FIELDS, SUMMARY_FIELDS
+from rawjson import RawJSON, dumps
+
+# Fields needed for an export row (summary plus the review text)
+EXPORT_FIELDS = SUMMARY_FIELDS + ['reviewContent']
+# ... plus the ticket details, for full=true machine-readable exports
+FULL_EXPORT_FIELDS = EXPORT_FIELDS + [f for f in DETAIL_FIELDS if f not in EXPORT_FIELDS]
+
+XLSX_MEDIA_TYPE = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+
+# format -> (media type, file extension)
+EXPORT_FORMATS = {
+    'xlsx': (XLSX_MEDIA_TYPE, 'xlsx'),
+    'csv': ('text/csv; charset=utf-8', 'csv'),
+    'ndjson': ('application/x-ndjson', 'ndjson'),
+    'parquet': ('application/vnd.apache.parquet', 'parquet'),
+    'arrow': ('application/vnd.apache.arrow.stream', 'arrow'),
+}
+ARROW_FORMATS = {'parquet', 'arrow'}
+
+# Rows per yielded chunk for the text formats
+TEXT_BATCH_ROWS = 500
+# Rows per Parquet row group / Arrow record batch
+ARROW_BATCH_ROWS = 10000
+
+XLSX_HEADERS = ["工单ID", "URL", "问题类型", "负责人", "问题描述", "得分", "审核结论", "审核意见"]
+
+# Fixed width for 问题描述(E) and 审核意见(H); the others are fitted to content
+FIXED_WIDTHS = {4: 80, 7: 80}
+
+CHUNK_SIZE = 64 * 1024
+# Worksheet XML kept in memory before spilling to disk
+SPOOL_SIZE = 8 * 1024 * 1024
+
+# Characters that are not allowed in XML 1.0
+_ILLEGAL_XML_CHARS = re.compile('[\x00-\x08\x0b\x0c\x0e-\x1f]')
+
+_MAIN_NS = 'http://schemas.openxmlformats.org/spreadsheetml/2006/main'
+_REL_NS = 'http://schemas.openxmlformats.org/officeDocument/2006/relationships'
+_PKG_REL_NS = 'http://schemas.openxmlformats.org/package/2006/relationships'
+
+_CONTENT_TYPES = '''<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">
+<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>
+<Default Extension="xml" ContentType="application/xml"/>
+<Override PartName="/xl/workbook.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>
+<Override PartName="/xl/worksheets/sheet1.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>
+<Override PartName="/xl/styles.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.styles+xml"/>
+{table}</Types>'''
+
+_TABLE_CONTENT_TYPE = ('<Override PartName="/xl/tables/table1.xml" '
+                       'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.table+xml"/>\n')
+
+_ROOT_RELS = f'''<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<Relationships xmlns="{_PKG_REL_NS}">
+<Relationship Id="rId1" Type="{_REL_NS}/officeDocument" Target="xl/workbook.xml"/>
+</Relationships>'''
+
+_WORKBOOK = f'''<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<workbook xmlns="{_MAIN_NS}" xmlns:r="{_REL_NS}">
+<sheets><sheet name="工单列表" sheetId="1" r:id="rId1"/></sheets>
+</workbook>'''
+
+_WORKBOOK_RELS = f'''<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<Relationships xmlns="{_PKG_REL_NS}">
+<Relationship Id="rId1" Type="{_REL_NS}/worksheet" Target="worksheets/sheet1.xml"/>
+<Relationship Id="rId2" Type="{_REL_NS}/styles" Target="styles.xml"/>
+</Relationships>'''
+
+_SHEET_RELS = f'''<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<Relationships xmlns="{_PKG_REL_NS}">
+<Relationship Id="rId1" Type="{_REL_NS}/table" Target="../tables/table1.xml"/>
+</Relationships>'''
+
+# Style 1: blue, centered link cell
+_STYLES = f'''<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<styleSheet xmlns="{_MAIN_NS}">
+<fonts count="2">
+<font><sz val="11"/><name val="Calibri"/><family val="2"/></font>
+<font><sz val="11"/><color rgb="FF0563C1"/><name val="Calibri"/><family val="2"/></font>
+</fonts>
+<fills count="2"><fill><patternFill patternType="none"/></fill><fill><patternFill patternType="gray125"/></fill></fills>
+<borders count="1"><border><left/><right/><top/><bottom/><diagonal/></border></borders>
+<cellStyleXfs count="1"><xf numFmtId="0" fontId="0" fillId="0" borderId="0"/></cellStyleXfs>
+<cellXfs count="2">
+<xf numFmtId="0" fontId="0" fillId="0" borderId="0" xfId="0"/>
+<xf numFmtId="0" fontId="1" fillId="0" borderId="0" xfId="0" applyFont="1" applyAlignment="1"><alignment horizontal="center"/></xf>
+</cellXfs>
+<cellStyles count="1"><cellStyle name="Normal" xfId="0" builtinId="0"/></cellStyles>
+</styleSheet>'''
+
+_TABLE = f'''<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<table xmlns="{_MAIN_NS}" id="1" name="TicketTable" displayName="TicketTable" ref="{{ref}}">
+<autoFilter ref="{{ref}}"/>
+<tableColumns count="{len(XLSX_HEADERS)}">{{columns}}</tableColumns>
+<tableStyleInfo name="TableStyleMedium9" showFirstColumn="0" showLastColumn="0" showRowStripes="1" showColumnStripes="0"/>
+</table>'''
+
+
+def _column_letter(index: int) -> str:
+    """0-based column index -> Excel column letter."""
+    letters = ''
+    index += 1
+    while index:
+        index, rem = divmod(index - 1, 26)
+        letters = chr(65 + rem) + letters
+    return letters
+
+
+COLUMNS = [_column_letter(i) for i in range(len(XLSX_HEADERS))]
+
+
+def _text(value: Any) -> str:
+    return escape(_ILLEGAL_XML_CHARS.sub('', str(value)))
+
+
+def _string_cell(ref: str, value: Any) -> str:
+    text = _text(value)
+    space = ' xml:space="preserve"' if text != text.strip() or '\n' in text else ''
+    return f'<c r="{ref}" t="inlineStr"><is><t{space}>{text}</t></is></c>'
+
+
+def _number_cell(ref: str, value: Any) -> str:
+    return f'<c r="{ref}"><v>{value}</v></c>'
+
+
+def _link_cell(ref: str, url: str, label: str) -> str:
+    # A HYPERLINK formula keeps the sheet self-contained: per-cell hyperlinks
+    # would need one relationship per row, written outside the sheet stream
+    formula = escape('HYPERLINK("{}","{}")'.format(url.replace('"', '""'), label))
+    return f'<c r="{ref}" s="1" t="str"><f>{formula}</f><v>{escape(label)}</v></c>'
+
+
+def ticket_url(process_id: str, ticket_url_pattern: str) -> str:
+    if not ticket_url_pattern:
+        return ""
+    return ticket_url_pattern.replace("{processId}", process_id)
+
+
+def xlsx_values(ticket: Dict[str, Any], ticket_url_pattern: str) -> List[Any]:
+    """Cell values for one export row, in XLSX_HEADERS order."""
+    return [
+        ticket["processId"],
+        ticket_url(ticket["processId"], ticket_url_pattern),
+        ticket["issueType"],
+        ticket["owner"],
+        ticket["problem"],
+        ticket["score"],
+        (ticket.get("conclusion") or "") if ticket.get("hasReview") else "",
+        (ticket.get("reviewContent") or "") if ticket.get("hasReview") else "",
+    ]
+
+
+class _ChunkWriter(io.RawIOBase):
+    """Unseekable file object that collects writer output for the response."""
+
+    def __init__(self):
+        self._chunks = []
+        self._offset = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        self._chunks.append(bytes(data))
+        self._offset += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._offset
+
+    def drain(self) -> bytes:
+        data = b''.join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def stream_xlsx(tickets: Iterable[Dict[str, Any]], ticket_url_pattern: str = "") -> Iterator[bytes]:
+    """Render tickets as an xlsx workbook, yielding the file in chunks."""
+    widths = [len(h) for h in XLSX_HEADERS]
+    row_count = 1
+
+    with tempfile.SpooledTemporaryFile(max_size=SPOOL_SIZE) as sheet_data:
+        header = ''.join(_string_cell(f'{COLUMNS[i]}1', h) for i, h in enumerate(XLSX_HEADERS))
+        sheet_data.write(f'<row r="1">{header}</row>'.encode('utf-8'))
+
+        for ticket in tickets:
+            row_count += 1
+            cells = []
+            for i, value in enumerate(xlsx_values(ticket, ticket_url_pattern)):
+                if value is None or value == "":
+                    continue
+                ref = f'{COLUMNS[i]}{row_count}'
+                if i == 1:
+                    # URL column shows a link icon
+                    cells.append(_link_cell(ref, value, "🔗"))
+                    value = "🔗"
+                elif isinstance(value, (int, float)) and not isinstance(value, bool):
+                    cells.append(_number_cell(ref, value))
+                else:
+                    cells.append(_string_cell(ref, value))
+                length = len(str(value))
+                if length > widths[i]:
+                    widths[i] = length
+            sheet_data.write(f'<row r="{row_count}">{"".join(cells)}</row>'.encode('utf-8'))
+
+        last_ref = f'{COLUMNS[-1]}{row_count}'
+        has_table = row_count > 1
+        cols = ''.join(
+            f'<col min="{i + 1}" max="{i + 1}" width="{FIXED_WIDTHS.get(i, max(w + 2, 4))}" customWidth="1"/>'
+            for i, w in enumerate(widths)
+        )
+        sheet_head = (
+            '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+            f'<worksheet xmlns="{_MAIN_NS}" xmlns:r="{_REL_NS}">'
+            f'<dimension ref="A1:{last_ref}"/><cols>{cols}</cols><sheetData>'
+        ).encode('utf-8')
+        sheet_tail = '</sheetData>'
+        if has_table:
+            sheet_tail += '<tableParts count="1"><tablePart r:id="rId1"/></tableParts>'
+        sheet_tail = (sheet_tail + '</worksheet>').encode('utf-8')
+
+        out = _ChunkWriter()
+        with zipfile.ZipFile(out, 'w', compression=zipfile.ZIP_DEFLATED) as zf:
+            zf.writestr('[Content_Types].xml',
+                        _CONTENT_TYPES.format(table=_TABLE_CONTENT_TYPE if has_table else ''))
+            zf.writestr('_rels/.rels', _ROOT_RELS)
+            zf.writestr('xl/workbook.xml', _WORKBOOK)
+            zf.writestr('xl/_rels/workbook.xml.rels', _WORKBOOK_RELS)
+            zf.writestr('xl/styles.xml', _STYLES)
+            if has_table:
+                columns = ''.join(
+                    f'<tableColumn id="{i + 1}" name="{escape(h)}"/>' for i, h in enumerate(XLSX_HEADERS)
+                )
+                zf.writestr('xl/tables/table1.xml', _TABLE.format(ref=f'A1:{last_ref}', columns=columns))
+                zf.writestr('xl/worksheets/_rels/sheet1.xml.rels', _SHEET_RELS)
+            yield out.drain()
+
+            info = zipfile.ZipInfo('xl/worksheets/sheet1.xml')
+            info.compress_type = zipfile.ZIP_DEFLATED
+            # Known size lets zipfile pick the right (zip64 or not) header up front
+            info.file_size = len(sheet_head) + sheet_data.tell() + len(sheet_tail)
+            sheet_data.seek(0)
+            with zf.open(info, 'w') as sheet:
+                sheet.write(sheet_head)
+                while True:
+                    chunk = sheet_data.read(CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    sheet.write(chunk)
+                    data = out.drain()
+                    if data:
+                        yield data
+                sheet.write(sheet_tail)
+        yield out.drain()
+
+
+def _batched(iterable: Iterable, size: int) -> Iterator[List]:
+    iterator = iter(iterable)
+    while True:
+        batch = list(islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
+def _flat_value(name: str, value: Any) -> Any:
+    """Scalar value for flat formats: nested JSON fields become JSON text."""
+    if name in JSON_FIELDS:
+        # Stored JSON text is used as-is
+        return value.text if isinstance(value, RawJSON) else json.dumps(value, ensure_ascii=False)
+    return value
+
+
+def stream_csv(tickets: Iterable[Dict[str, Any]], fields: List[str]) -> Iterator[bytes]:
+    """Render tickets as CSV with a header row of field names."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(fields)
+    for batch in _batched(tickets, TEXT_BATCH_ROWS):
+        for ticket in batch:
+            row = []
+            for name in fields:
+                value = _flat_value(name, ticket.get(name))
+                if name in BOOL_FIELDS:
+                    value = 'true' if value else 'false'
+                row.append(value)
+            writer.writerow(row)
+        yield buffer.getvalue().encode('utf-8')
+        buffer.seek(0)
+        buffer.truncate()
+    data = buffer.getvalue()
+    if data:
+        yield data.encode('utf-8')
+
+
+def stream_ndjson(tickets: Iterable[Dict[str, Any]]) -> Iterator[bytes]:
+    """Render tickets as newline-delimited JSON, one object per line."""
+    for batch in _batched(tickets, TEXT_BATCH_ROWS):
+        yield b'\n'.join(dumps(ticket) for ticket in batch) + b'\n'
+
+
+def require_pyarrow() -> None:
+    """Raise ImportError with a helpful message when pyarrow is missing."""
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        raise ImportError("Parquet/Arrow export requires pyarrow (pip install pyarrow)")
+
+
+def _arrow_schema(fields: List[str]):
+    import pyarrow as pa
+    types = {'score': pa.float64(), 'diffScore': pa.float64()}
+    return pa.schema([
+        (name, pa.bool_() if name in BOOL_FIELDS else types.get(name, pa.string()))
+        for name in fields
+    ])
+
+
+def stream_arrow(tickets: Iterable[Dict[str, Any]], fields: List[str], fmt: str = 'parquet') -> Iterator[bytes]:
+    """Render tickets as Parquet or an Arrow IPC stream."""
+    import pyarrow as pa
+
+    schema = _arrow_schema(fields)
+    out = _ChunkWriter()
+    if fmt == 'parquet':
+        import pyarrow.parquet as pq
+        writer = pq.ParquetWriter(out, schema)
+    else:
+        writer = pa.ipc.new_stream(out, schema)
+    try:
+        for batch in _batched(tickets, ARROW_BATCH_ROWS):
+            columns = {name: [_flat_value(name, t.get(name)) for t in batch] for name in fields}
+            writer.write_table(pa.Table.from_pydict(columns, schema=schema))
+            yield out.drain()
+    finally:
+        writer.close()
+    yield out.drain()
+
+
+def _counted(tickets: Iterable[Dict[str, Any]], fmt: str) -> Iterator[Dict[str, Any]]:
+    rows = 0
+    try:
+        for ticket in tickets:
+            rows += 1
+            yield ticket
+    finally:
+        metrics.inc('export_rows_total', rows, format=fmt)
+
+
+def stream_export(tickets: Iterable[Dict[str, Any]], fmt: str, fields: List[str],
+                  ticket_url_pattern: str = "") -> Iterator[bytes]:
+    """Render tickets in one of EXPORT_FORMATS."""
+    if metrics.enabled():
+        tickets = _counted(tickets, fmt)
+    if fmt == 'xlsx':
+        chunks = stream_xlsx(tickets, ticket_url_pattern)
+    elif fmt == 'csv':
+        chunks = stream_csv(tickets, fields)
+    elif fmt == 'ndjson':
+        chunks = stream_ndjson(tickets)
+    elif fmt in ARROW_FORMATS:
+        chunks = stream_arrow(tickets, fields, fmt)
+    else:
+        raise ValueError(f"Unsupported export format: {fmt}")
+    # Time spent rendering (and reading rows), not sending the chunks
+    return metrics.timed_iter(chunks, 'export_render_seconds', format=fmt)
@@ -1,39 +1,34 @@
-import sqlite3
+"""Generate mock tickets for development and benchmarks.
+
+    python generate_mock_data.py                          # 10 tickets into DB_PATH
+    python generate_mock_data.py --count 1000000 --seed 42 --workers 4
+    python generate_mock_data.py --issue-types 慢SQL=5,备份恢复=3,日志管理=2 \\
+        --owners 张三=4,李四=1 --review-ratio 0.6 --stale-ratio 0.2
+    DB_TYPE=postgresql python generate_mock_data.py --count 100000
+
+Rows are generated in fixed-size chunks, each from its own seeded RNG, so
+the same ``--seed`` yields the same data whatever ``--workers`` and
+``--batch-size`` are. Rows are upserted in batches (``executemany`` on
+SQLite, ``COPY`` into a staging table on PostgreSQL), one transaction per
+batch; migrations beyond the ticket_review table run after the load, so
+indexes, the search index and review state are built once, set-based,
+instead of row by row.
+"""
+import argparse
+import csv
+import io
 import json
 import random
-from datetime import datetime, timedelta
-
-# 连接数据库（如果不存在会自动创建）
-conn = sqlite3.connect('gaussdb_ops.db')
-cursor = conn.cursor()
+import time
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import Iterator, List, Optional, Sequence, Tuple
 
-# 创建 ticket_classification_2512 表
-cursor.execute('''
-CREATE TABLE IF NOT EXISTS ticket_classification_2512 (
-    "processId" TEXT PRIMARY KEY,
-    "issueType" TEXT,
-    "owner" TEXT
-)
-''')
+import migrations
+from config import DATABASE_CONFIG
+from database import create_database
 
-# 创建 operations_kb 表
-cursor.execute('''
-CREATE TABLE IF NOT EXISTS operations_kb (
-    "流程ID" TEXT PRIMARY KEY,
-    "create_time" TEXT,
-    "update_time" TEXT,
-    "问题现象" TEXT,
-    "问题根因" TEXT,
-    "分析过程" TEXT,
-    "解决方案" TEXT,
-    "diff_score" REAL,
-    "得分" REAL,
-    "理由" TEXT,
-    FOREIGN KEY ("流程ID") REFERENCES ticket_classification_2512("processId")
-)
-''')
-
-# 模拟数据
+# 模拟数据 (默认均匀分布, 可用 --issue-types / --owners 指定权重)
 issue_types = ['慢SQL', '备份恢复', '日志管理']
 owners = ['张三', '李四', '王五', '赵六', '钱七']
 
@@ -174,96 +169,339 @@ score_reasons = {
     ]
 }
 
-# 生成10条记录
-base_time = datetime(2024, 12, 1, 9, 0, 0)
-records = []
-
-for i in range(10):
-    process_id = f'TICKET-{1001 + i}'
-    issue_type = random.choice(issue_types)
-    owner = random.choice(owners)
-
-    template = templates[issue_type]
-
-    create_time = base_time + timedelta(days=i*2, hours=random.randint(0, 8))
-    update_time = create_time + timedelta(hours=random.randint(2, 48))
-
-    problem = random.choice(template['问题现象'])
-    root_cause = random.choice(template['问题根因'])
-    analysis = json.dumps(random.choice(template['分析过程']), ensure_ascii=False)
-    solution = json.dumps(random.choice(template['解决方案']), ensure_ascii=False)
-
-    # 生成分数和理由
-    score = round(random.uniform(5, 10), 1)
-    diff_score = round(random.uniform(4, 10), 1)
-
-    if score >= 8:
-        reason = random.choice(score_reasons['high'])
-    elif score >= 6:
-        reason = random.choice(score_reasons['medium'])
-    else:
-        reason = random.choice(score_reasons['low'])
-
-    records.append({
-        'process_id': process_id,
-        'issue_type': issue_type,
-        'owner': owner,
-        'create_time': create_time.strftime('%Y-%m-%d %H:%M:%S'),
-        'update_time': update_time.strftime('%Y-%m-%d %H:%M:%S'),
-        'problem': problem,
-        'root_cause': root_cause,
-        'analysis': analysis,
-        'solution': solution,
-        'diff_score': diff_score,
-        'score': score,
-        'reason': reason
-    })
-
-# 插入数据
-for r in records:
-    cursor.execute('''
-        INSERT OR REPLACE INTO ticket_classification_2512 ("processId", "issueType", "owner")
-        VALUES (?, ?, ?)
-    ''', (r['process_id'], r['issue_type'], r['owner']))
 
+# 审核结论及其权重, 不通过/待定 的审核意见
+review_conclusions = {'通过': 6, '不通过': 2, '待定': 2}
+review_comments = [
+    '根因分析不充分，请补充诊断依据',
+    '解决方案缺少回退步骤',
+    '命令需要在测试环境验证后再归档',
+    '问题现象描述不完整，请补充报错信息',
+]
+
+BASE_TIME = int(datetime(2024, 12, 1, 9, 0, 0, tzinfo=timezone.utc).timestamp())
+DAY = 86400
+# Rows per RNG stream; fixed so output doesn't depend on workers or batch size
+CHUNK_SIZE = 10000
+
+TABLES = """
+CREATE TABLE IF NOT EXISTS ticket_classification_2512 (
+    "processId" TEXT PRIMARY KEY,
+    "issueType" TEXT,
+    "owner" TEXT
+);
+CREATE TABLE IF NOT EXISTS operations_kb (
+    "流程ID" TEXT PRIMARY KEY,
+    "create_time" TEXT,
+    "update_time" TEXT,
+    "问题现象" TEXT,
+    "问题根因" TEXT,
+    "分析过程" TEXT,
+    "解决方案" TEXT,
+    "diff_score" REAL,
+    "得分" REAL,
+    "理由" TEXT,
+    FOREIGN KEY ("流程ID") REFERENCES ticket_classification_2512("processId")
+)
+"""
+
+# (table, columns, conflict key); upserts rather than INSERT OR REPLACE:
+# REPLACE deletes the old row without firing delete triggers, which would
+# leave stale entries in the search index
+CLASSIFICATION = ('ticket_classification_2512', ['"processId"', '"issueType"', '"owner"'], '"processId"')
+TICKETS = ('operations_kb', [
+    '"流程ID"', '"create_time"', '"update_time"', '"问题现象"', '"问题根因"',
+    '"分析过程"', '"解决方案"', '"diff_score"', '"得分"', '"理由"',
+], '"流程ID"')
+REVIEWS = ('ticket_review', ['processId', 'createTime', 'updateTime', 'conclusion', 'content'], 'processId')
+
+
+@dataclass(frozen=True)
+class Options:
+    seed: int
+    issue_types: Tuple[Tuple[str, float], ...]
+    owners: Tuple[Tuple[str, float], ...]
+    review_ratio: float
+    stale_ratio: float
+    days: int
+
+
+def parse_weights(text: str, allowed: Optional[Sequence[str]] = None) -> Tuple[Tuple[str, float], ...]:
+    """Parse ``name=weight,name`` (weight defaults to 1) into (name, weight) pairs."""
+    weights = []
+    for item in text.split(','):
+        name, _, weight = item.strip().partition('=')
+        name = name.strip()
+        if not name:
+            continue
+        if allowed is not None and name not in allowed:
+            raise argparse.ArgumentTypeError(f"unknown value {name!r}, expected one of: {', '.join(allowed)}")
+        try:
+            value = float(weight) if weight else 1.0
+        except ValueError:
+            raise argparse.ArgumentTypeError(f"invalid weight for {name!r}: {weight!r}")
+        if value < 0:
+            raise argparse.ArgumentTypeError(f"negative weight for {name!r}")
+        weights.append((name, value))
+    if not weights or not any(value for _, value in weights):
+        raise argparse.ArgumentTypeError("at least one positive weight is required")
+    return tuple(weights)
+
+
+def _ratio(text: str) -> float:
+    value = float(text)
+    if not 0 <= value <= 1:
+        raise argparse.ArgumentTypeError(f"{text} is not between 0 and 1")
+    return value
+
+
+# 每种 issueType 的 (问题现象, 问题根因, 分析过程, 解决方案) 候选, JSON 只序列化一次
+_CHOICES = {
+    issue_type: (
+        template['问题现象'], template['问题根因'],
+        [json.dumps(item, ensure_ascii=False) for item in template['分析过程']],
+        [json.dumps(item, ensure_ascii=False) for item in template['解决方案']],
+    )
+    for issue_type, template in templates.items()
+}
+
+
+def _local(ts: int) -> str:
+    return time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime(ts))
+
+
+def _iso(ts: int) -> str:
+    return time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime(ts))
+
+
+def generate_chunk(options: Options, chunk: int, start: int, size: int) -> Tuple[list, list, list]:
+    """Generate tickets ``start .. start + size``: (classification, ticket, review) rows."""
+    rng = random.Random(f'{options.seed}:{chunk}')
+    rand = rng.random
+    issue_names, issue_weights = zip(*options.issue_types)
+    owner_names, owner_weights = zip(*options.owners)
+    conclusions = rng.choices(list(review_conclusions), list(review_conclusions.values()), k=size)
+    span = options.days * DAY
+    high, medium, low = score_reasons['high'], score_reasons['medium'], score_reasons['low']
+
+    classifications, tickets, reviews = [], [], []
+    types = rng.choices(issue_names, issue_weights, k=size)
+    assignees = rng.choices(owner_names, owner_weights, k=size)
+    for i in range(size):
+        process_id = f'TICKET-{1001 + start + i}'
+        issue_type = types[i]
+        problems, causes, analyses, solutions = _CHOICES[issue_type]
+
+        create_time = BASE_TIME + int(rand() * span)
+        update_time = create_time + 2 * 3600 + int(rand() * 46 * 3600)
+
+        # 生成分数和理由 (下标取值比 rng.choice 快得多, 百万行时可见)
+        score = round(5 + rand() * 5, 1)
+        diff_score = round(4 + rand() * 6, 1)
+        reasons = high if score >= 8 else medium if score >= 6 else low
+        reason = reasons[int(rand() * len(reasons))]
+
+        if rand() < options.review_ratio:
+            conclusion = conclusions[i]
+            content = '-' if conclusion == '通过' else review_comments[int(rand() * len(review_comments))]
+            if rand() < options.stale_ratio:
+                # Reviewed, then the ticket was updated on a later day. Stored
+                # times compare as text ('T' vs ' '), so keep the days apart
+                review_time = create_time + int(rand() * 3600)
+                update_time = max(update_time, review_time + DAY + int(rand() * DAY))
+            else:
+                review_time = update_time + 3600 + int(rand() * 7 * DAY)
+            reviewed = _iso(review_time)
+            reviews.append((process_id, reviewed, reviewed, conclusion, content))
+
+        classifications.append((process_id, issue_type, assignees[i]))
+        tickets.append((
+            process_id, _local(create_time), _local(update_time),
+            problems[int(rand() * len(problems))], causes[int(rand() * len(causes))],
+            analyses[int(rand() * len(analyses))], solutions[int(rand() * len(solutions))],
+            diff_score, score, reason,
+        ))
+    return classifications, tickets, reviews
+
+
+def _generate(args) -> Tuple[list, list, list]:
+    return generate_chunk(*args)
+
+
+def generate(options: Options, count: int, workers: int = 1) -> Iterator[Tuple[list, list, list]]:
+    """Yield generated chunks in order, built by ``workers`` processes."""
+    chunks = [(options, chunk, start, min(CHUNK_SIZE, count - start))
+              for chunk, start in enumerate(range(0, count, CHUNK_SIZE))]
+    if workers <= 1 or len(chunks) <= 1:
+        yield from map(_generate, chunks)
+        return
+    import multiprocessing
+    with multiprocessing.Pool(min(workers, len(chunks))) as pool:
+        yield from pool.imap(_generate, chunks)
+
+
+def _upsert_sql(table: str, columns: List[str], key: str, source: str, bump_version: bool) -> str:
+    updates = [f'{column} = excluded.{column}' for column in columns if column != key]
+    if bump_version:
+        # History rows are keyed on version, a changed review needs a new one
+        updates.append(f'version = {table}.version + 1')
+    return (f'INSERT INTO {table} ({", ".join(columns)}) {source} '
+            f'ON CONFLICT ({key}) DO UPDATE SET {", ".join(updates)}')
+
+
+class SQLiteLoader:
+    """Batched ``executemany`` upserts."""
+
+    def __init__(self, conn, bump_version: bool):
+        self.conn = conn
+        self.statements = []
+        for table, columns, key in (CLASSIFICATION, TICKETS, REVIEWS):
+            values = f'VALUES ({", ".join("?" * len(columns))})'
+            self.statements.append(_upsert_sql(table, columns, key, values, bump_version and table == 'ticket_review'))
+        # Durability is pointless for a bulk load that can simply be rerun
+        conn.execute('PRAGMA synchronous = OFF')
+
+    def load(self, chunk: Tuple[list, list, list]) -> None:
+        for sql, rows in zip(self.statements, chunk):
+            if rows:
+                self.conn.executemany(sql, rows)
+
+
+class PostgreSQLLoader:
+    """``COPY`` into temporary staging tables, then upsert from them."""
+
+    def __init__(self, conn, bump_version: bool):
+        self.conn = conn
+        self.tables = []
+        cursor = conn.cursor()
+        for table, columns, key in (CLASSIFICATION, TICKETS, REVIEWS):
+            staging = f'staging_{table}'
+            cursor.execute(f'CREATE TEMP TABLE IF NOT EXISTS {staging} (LIKE {table})')
+            copy = f'COPY {staging} ({", ".join(columns)}) FROM STDIN WITH (FORMAT csv)'
+            select = f'SELECT {", ".join(columns)} FROM {staging}'
+            upsert = _upsert_sql(table, columns, key, select, bump_version and table == 'ticket_review')
+            self.tables.append((staging, copy, upsert))
+        conn.commit()
+
+    def load(self, chunk: Tuple[list, list, list]) -> None:
+        cursor = self.conn.cursor()
+        for (staging, copy, upsert), rows in zip(self.tables, chunk):
+            if not rows:
+                continue
+            cursor.execute(f'TRUNCATE {staging}')
+            buffer = io.StringIO()
+            csv.writer(buffer).writerows(rows)
+            buffer.seek(0)
+            cursor.copy_expert(copy, buffer)
+            cursor.execute(upsert)
+
+
+def load(conn, dialect: str, chunks: Iterator[Tuple[list, list, list]], batch_size: int) -> Tuple[int, int]:
+    """Upsert generated chunks, committing every ``batch_size`` tickets.
+
+    Returns (tickets, reviews) written.
+    """
+    cursor = conn.cursor()
+    for statement in TABLES.split(';'):
+        cursor.execute(statement)
+    conn.commit()
+    # Only ticket_review is needed for the load; the later migrations index
+    # and backfill the loaded rows in one pass each
+    migrations.migrate(conn, dialect, target=1)
+    bump_version = migrations.get_schema_version(conn) >= 10
+    loader = (SQLiteLoader if dialect == 'sqlite' else PostgreSQLLoader)(conn, bump_version)
+
+    tickets = reviews = pending = 0
+    for chunk in chunks:
+        loader.load(chunk)
+        tickets += len(chunk[1])
+        reviews += len(chunk[2])
+        pending += len(chunk[1])
+        if pending >= batch_size:
+            conn.commit()
+            pending = 0
+    conn.commit()
+    return tickets, reviews
+
+
+def show(conn, limit: int) -> None:
+    """Print the ``limit`` most recently updated tickets."""
+    cursor = conn.cursor()
     cursor.execute('''
-        INSERT OR REPLACE INTO operations_kb
-        ("流程ID", "create_time", "update_time", "问题现象", "问题根因", "分析过程", "解决方案", "diff_score", "得分", "理由")
-        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-    ''', (r['process_id'], r['create_time'], r['update_time'], r['problem'],
-          r['root_cause'], r['analysis'], r['solution'], r['diff_score'], r['score'], r['reason']))
-
-conn.commit()
-
-# 验证数据
-print("=== 数据生成完成 ===\n")
-
-cursor.execute('''
-    SELECT T2."流程ID", C."issueType", C."owner", T2.create_time, T2.update_time,
-           T2."问题现象", T2."问题根因", T2."分析过程", T2."解决方案", T2.diff_score, T2."得分", T2."理由"
-    FROM operations_kb as T2, ticket_classification_2512 as C
-    WHERE T2."流程ID" = C."processId"
-    ORDER BY T2.update_time DESC, T2.create_time DESC
-''')
-
-rows = cursor.fetchall()
-print(f"共查询到 {len(rows)} 条记录:\n")
-
-for row in rows:
-    print(f"{'='*60}")
-    print(f"流程ID: {row[0]}")
-    print(f"问题类型: {row[1]}")
-    print(f"负责人: {row[2]}")
-    print(f"创建时间: {row[3]}")
-    print(f"更新时间: {row[4]}")
-    print(f"问题现象: {row[5]}")
-    print(f"问题根因: {row[6]}")
-    print(f"分析过程: {row[7][:80]}...")
-    print(f"解决方案: {row[8][:80]}...")
-    print(f"diff_score: {row[9]}")
-    print(f"得分: {row[10]}")
-    print(f"理由: {row[11]}")
-    print()
-
-conn.close()
-print(f"\n数据库文件已保存: gaussdb_ops.db")
+        SELECT T2."流程ID", C."issueType", C."owner", T2.create_time, T2.update_time,
+               T2."问题现象", T2."问题根因", T2."分析过程", T2."解决方案", T2.diff_score, T2."得分", T2."理由"
+        FROM operations_kb as T2, ticket_classification_2512 as C
+        WHERE T2."流程ID" = C."processId"
+        ORDER BY T2.update_time DESC, T2.create_time DESC
+        LIMIT {}
+    '''.format(int(limit)))
+
+    for row in cursor.fetchall():
+        print(f"{'='*60}")
+        print(f"流程ID: {row[0]}")
+        print(f"问题类型: {row[1]}")
+        print(f"负责人: {row[2]}")
+        print(f"创建时间: {row[3]}")
+        print(f"更新时间: {row[4]}")
+        print(f"问题现象: {row[5]}")
+        print(f"问题根因: {row[6]}")
+        print(f"分析过程: {row[7][:80]}...")
+        print(f"解决方案: {row[8][:80]}...")
+        print(f"diff_score: {row[9]}")
+        print(f"得分: {row[10]}")
+        print(f"理由: {row[11]}")
+        print()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Generate mock tickets")
+    parser.add_argument('--count', type=int, default=10, help="number of tickets (default: 10)")
+    parser.add_argument('--seed', type=int, default=0, help="random seed (default: 0)")
+    parser.add_argument('--issue-types', type=lambda text: parse_weights(text, list(templates)),
+                        default=tuple((name, 1.0) for name in issue_types),
+                        help="issue type weights, e.g. 慢SQL=5,备份恢复=3,日志管理=2 (default: uniform)")
+    parser.add_argument('--owners', type=parse_weights, default=tuple((name, 1.0) for name in owners),
+                        help="owner weights, e.g. 张三=4,李四=1 (default: 5 owners, uniform)")
+    parser.add_argument('--review-ratio', type=_ratio, default=0.5,
+                        help="share of tickets with a review (default: 0.5)")
+    parser.add_argument('--stale-ratio', type=_ratio, default=0.1,
+                        help="share of reviews older than the ticket's last update (default: 0.1)")
+    parser.add_argument('--days', type=int, default=365,
+                        help="tickets are created over this many days from 2024-12-01 (default: 365)")
+    parser.add_argument('--db-type', choices=['sqlite', 'postgresql'], help="backend (default: DB_TYPE)")
+    parser.add_argument('--db', help="SQLite database path (default: DB_PATH)")
+    parser.add_argument('--batch-size', type=int, default=100000, help="tickets per transaction (default: 100000)")
+    parser.add_argument('--workers', type=int, default=1, help="generator processes (default: 1)")
+    parser.add_argument('--show', type=int, default=10, help="print this many of the newest tickets (default: 10)")
+    args = parser.parse_args()
+    if args.count < 0 or args.days < 1 or args.batch_size < 1:
+        parser.error("--count, --days and --batch-size must be positive")
+
+    config = dict(DATABASE_CONFIG, cache={'enabled': False})
+    if args.db_type:
+        config['type'] = args.db_type
+    if args.db:
+        config['path'] = args.db
+    db = create_database(config)
+    options = Options(args.seed, args.issue_types, args.owners, args.review_ratio, args.stale_ratio, args.days)
+
+    started = time.perf_counter()
+    with db._connection() as conn:
+        tickets, reviews = load(conn, db.dialect, generate(options, args.count, args.workers), args.batch_size)
+        loaded = time.perf_counter()
+        print(f"=== 数据生成完成: {tickets} 条工单, {reviews} 条审核, 用时 {loaded - started:.1f}s ===")
+        applied = migrations.migrate(conn, db.dialect)
+        if applied:
+            print(f"applied migrations: {', '.join(str(v) for v in applied)} "
+                  f"({time.perf_counter() - loaded:.1f}s)")
+        if args.show:
+            print()
+            show(conn, args.show)
+    db.close()
+
+    if db.dialect == 'sqlite':
+        print(f"数据库文件已保存: {config['path']}")
+
+
+if __name__ == '__main__':
+    main()
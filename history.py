@@ -0,0 +1,118 @@
+"""Review history.
+
+Every save that changes a review's conclusion or content appends a
+revision to ``ticket_review_history`` (triggers from migration 11, in the
+saving transaction). Revisions are keyed by (processId, version) and
+returned newest first.
+
+Old revisions are thinned by a compaction job, meant to run from cron:
+
+    python history.py --compact                 # REVIEW_HISTORY_KEEP_DAYS
+    python history.py --compact --keep-days 30
+
+Revisions newer than the retention window are all kept. Older ones are
+reduced to the last revision of each ticket per day, plus every revision
+that changed the conclusion, so verdict changes are never lost.
+"""
+from datetime import datetime, timedelta, timezone
+from typing import Any, List, Optional, Tuple
+
+MAX_HISTORY_PAGE_SIZE = 100
+
+
+def build_history_query(dialect: str, limit: int,
+                        before: Optional[int] = None) -> Tuple[str, List[Any]]:
+    """Build the SELECT for one page of a ticket's revisions, newest first.
+
+    The processId is the first parameter; ``before`` continues below a version.
+    """
+    p = '?' if dialect == 'sqlite' else '%s'
+    sql = f'''
+        SELECT processid, version, updatetime, conclusion, content
+        FROM ticket_review_history
+        WHERE processid = {p}
+    '''
+    params = []
+    if before is not None:
+        sql += f' AND version < {p}'
+        params.append(before)
+    # One extra row tells whether another page exists
+    sql += f' ORDER BY version DESC LIMIT {int(limit) + 1}'
+    return sql, params
+
+
+def build_compact_query(dialect: str) -> str:
+    """Build the DELETE that thins revisions older than the cutoff parameter."""
+    if dialect == 'sqlite':
+        day = 'substr(updatetime, 1, 10)'
+        same_conclusion = 'prev_conclusion IS conclusion'
+        p = '?'
+    elif dialect == 'postgresql':
+        day = 'CAST(updatetime AS DATE)'
+        same_conclusion = 'prev_conclusion IS NOT DISTINCT FROM conclusion'
+        p = '%s'
+    else:
+        raise ValueError(f"Unsupported database type: {dialect}")
+    # A revision goes if a later one exists the same day and it didn't change
+    # the verdict (the first revision has no previous one and always stays)
+    return f'''
+        DELETE FROM ticket_review_history
+        WHERE (processid, version) IN (
+            SELECT processid, version FROM (
+                SELECT processid, version, updatetime, conclusion,
+                       {day} AS day,
+                       LEAD({day}) OVER w AS next_day,
+                       LAG(version) OVER w AS prev_version,
+                       LAG(conclusion) OVER w AS prev_conclusion
+                FROM ticket_review_history
+                WINDOW w AS (PARTITION BY processid ORDER BY version)
+            ) AS H
+            WHERE updatetime < {p} AND next_day = day
+              AND prev_version IS NOT NULL AND {same_conclusion}
+        )
+    '''
+
+
+def compact_history(db, keep_days: int) -> int:
+    """Thin out revisions older than ``keep_days``. Returns the number deleted."""
+    cutoff = datetime.now(timezone.utc) - timedelta(days=keep_days)
+    if db.dialect == 'sqlite':
+        cutoff = cutoff.strftime('%Y-%m-%dT%H:%M:%SZ')
+    else:
+        cutoff = cutoff.replace(tzinfo=None)
+    with db._connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(build_compact_query(db.dialect), (cutoff,))
+        deleted = cursor.rowcount
+        conn.commit()
+    return deleted
+
+
+def main() -> None:
+    import argparse
+    from config import DATABASE_CONFIG, REVIEW_HISTORY_KEEP_DAYS
+    from database import create_database
+
+    parser = argparse.ArgumentParser(description="Ticket review history")
+    parser.add_argument('--compact', action='store_true', help="thin out old revisions")
+    parser.add_argument('--keep-days', type=int, default=REVIEW_HISTORY_KEEP_DAYS,
+                        help="keep every revision newer than this (default: %(default)s)")
+    parser.add_argument('process_id', nargs='?', help="print the history of this ticket")
+    args = parser.parse_args()
+
+    db = create_database(dict(DATABASE_CONFIG, cache={'enabled': False}))
+    try:
+        if args.compact:
+            deleted = compact_history(db, args.keep_days)
+            print(f"deleted {deleted} revisions older than {args.keep_days} days")
+        if args.process_id:
+            page = db.get_review_history(args.process_id, limit=MAX_HISTORY_PAGE_SIZE)
+            for revision in page['items']:
+                print(f"v{revision['version']}\t{revision['updateTime']}\t"
+                      f"{revision['conclusion']}\t{revision['content']}")
+    finally:
+        db.close()
+
+
+if __name__ == '__main__':
+    main()
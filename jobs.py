@@ -0,0 +1,252 @@
+"""Background export jobs.
+
+Exports are rendered on a process pool so that large xlsx files don't
+compete with API requests for the GIL. Results are cached on local disk,
+keyed by the filters, sort, format and the database's data version, so
+repeated downloads of an unchanged export are served straight from disk.
+
+Job state lives next to the result as ``<job_id>.json``, so any uvicorn
+worker can answer progress and download requests, whichever worker
+submitted the job. The job ID is the cache key; submitting the same export
+twice returns the same job.
+"""
+import hashlib
+import json
+import multiprocessing
+import os
+import time
+from concurrent.futures import Future, ProcessPoolExecutor
+from datetime import datetime
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+
+import metrics
+from export import EXPORT_FORMATS, stream_export
+from query import TicketQuery
+
+QUEUED = 'queued'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+
+# Seconds between progress updates written by a running job
+PROGRESS_INTERVAL = 1.0
+
+
+def _write_json(path: str, data: Dict[str, Any]) -> None:
+    """Atomically replace a JSON file (readers never see a partial write)."""
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False)
+    os.replace(tmp, path)
+
+
+def _read_json(path: str) -> Optional[Dict[str, Any]]:
+    try:
+        with open(path, encoding='utf-8') as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return None
+
+
+def _pid_alive(pid: Optional[int]) -> bool:
+    if not pid:
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def _track_progress(tickets: Iterable[Dict[str, Any]], state: Dict[str, Any],
+                    state_path: str) -> Iterator[Dict[str, Any]]:
+    next_update = time.monotonic() + PROGRESS_INTERVAL
+    for ticket in tickets:
+        state['rows'] += 1
+        yield ticket
+        if time.monotonic() >= next_update:
+            next_update = time.monotonic() + PROGRESS_INTERVAL
+            _write_json(state_path, state)
+
+
+def run_export(db_config: Dict[str, Any], state: Dict[str, Any], result_path: str,
+               state_path: str, ticket_url_pattern: str) -> int:
+    """Render one export to ``result_path``. Runs in a pool process.
+
+    Returns the size of the written file.
+    """
+    from database import create_database
+
+    # One short-lived connection; the API workers' caches are of no use here
+    config = dict(db_config, cache={'enabled': False},
+                  pool=dict(db_config.get('pool', {}), min_size=0, max_size=1))
+    db = create_database(config)
+    try:
+        query = TicketQuery(**state['query'])
+        state.update(status=RUNNING, pid=os.getpid(), rows=0, total=db.count_tickets(query))
+        _write_json(state_path, state)
+
+        tickets = _track_progress(db.iter_tickets(query), state, state_path)
+        tmp_path = f"{result_path}.{os.getpid()}.tmp"
+        try:
+            with open(tmp_path, 'wb') as f:
+                for chunk in stream_export(tickets, state['format'], state['query']['fields'],
+                                           ticket_url_pattern):
+                    f.write(chunk)
+            os.replace(tmp_path, result_path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+    finally:
+        db.close()
+
+    size = os.path.getsize(result_path)
+    state.update(status=DONE, size=size, finished_at=time.time())
+    _write_json(state_path, state)
+    return size
+
+
+class ExportJobManager:
+    """Submits export jobs to a process pool and serves their cached results."""
+
+    def __init__(self, db_config: Dict[str, Any], directory: str = 'exports', workers: int = 2,
+                 max_cache_bytes: int = 1024 * 1024 * 1024, ticket_url_pattern: str = '',
+                 metrics_config: Optional[Dict[str, Any]] = None):
+        self.db_config = db_config
+        self.directory = directory
+        self.workers = workers
+        self.max_cache_bytes = max_cache_bytes
+        self.ticket_url_pattern = ticket_url_pattern
+        self.metrics_config = metrics_config or {'enabled': False}
+        self._executor = None
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            os.makedirs(self.directory, exist_ok=True)
+            # spawn: forking a process that runs DB and event-loop threads is unsafe
+            # Export processes report render times to the same /metrics
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context('spawn'),
+                initializer=metrics.configure,
+                initargs=(self.metrics_config['enabled'], self.metrics_config.get('directory', ''),
+                          self.metrics_config.get('flush_interval', 1.0))
+            )
+        return self._executor
+
+    def close(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    def job_key(self, query: TicketQuery, fmt: str, data_version: Dict[str, Any]) -> str:
+        """Cache key for an export: filters, sort, format, fields and data version."""
+        payload = json.dumps(
+            [query.type, query.owner, query.score, query.review, query.sort, query.fields,
+             fmt, data_version, self.ticket_url_pattern],
+            ensure_ascii=False, sort_keys=True, default=str
+        )
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()[:32]
+
+    def _state_path(self, job_id: str) -> str:
+        return os.path.join(self.directory, f"{job_id}.json")
+
+    def result_path(self, state: Dict[str, Any]) -> str:
+        """Path of a job's result file."""
+        return os.path.join(self.directory, f"{state['id']}.{EXPORT_FORMATS[state['format']][1]}")
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """Current state of a job, or None if unknown (or evicted)."""
+        if not job_id.isalnum():
+            return None
+        state = _read_json(self._state_path(job_id))
+        if state is None:
+            return None
+        if state['status'] in (QUEUED, RUNNING) and not _pid_alive(state.get('pid')):
+            # The worker that owned the job died before finishing it
+            state.update(status=FAILED, error='export worker exited')
+        if state['status'] == DONE and not os.path.exists(self.result_path(state)):
+            return None
+        return state
+
+    def submit(self, query: TicketQuery, fmt: str, data_version: Dict[str, Any]) -> Dict[str, Any]:
+        """Start an export unless an identical one is cached or in progress."""
+        job_id = self.job_key(query, fmt, data_version)
+        state = self.get(job_id)
+        if state is not None and state['status'] != FAILED:
+            if state['status'] == DONE:
+                self.touch(state)
+            return state
+
+        executor = self._get_executor()
+        created = datetime.now()
+        state = {
+            'id': job_id,
+            'status': QUEUED,
+            'format': fmt,
+            'query': {
+                'type': query.type, 'owner': query.owner, 'score': query.score,
+                'review': query.review, 'sort': query.sort, 'fields': query.fields,
+            },
+            'filename': f"tickets_export_{created.strftime('%Y%m%d_%H%M%S')}.{EXPORT_FORMATS[fmt][1]}",
+            'created_at': created.timestamp(),
+            'pid': os.getpid(),
+            'rows': 0,
+            'total': None,
+        }
+        state_path = self._state_path(job_id)
+        _write_json(state_path, state)
+        future = executor.submit(run_export, self.db_config, state, self.result_path(state),
+                                 state_path, self.ticket_url_pattern)
+        future.add_done_callback(lambda f: self._finished(f, state))
+        return state
+
+    def _finished(self, future: Future, state: Dict[str, Any]) -> None:
+        error = None if future.cancelled() else future.exception()
+        if future.cancelled() or error is not None:
+            state.update(status=FAILED, error=str(error) if error else 'cancelled')
+            _write_json(self._state_path(state['id']), state)
+            return
+        self.evict(keep=state['id'])
+
+    def evict(self, keep: Optional[str] = None) -> List[str]:
+        """Delete least recently used results until the cache fits in max_cache_bytes.
+
+        ``keep`` (the job that just finished) is never evicted, even when it
+        alone exceeds the limit. Returns the evicted job IDs.
+        """
+        results = []
+        for name in os.listdir(self.directory):
+            job_id, ext = os.path.splitext(name)
+            if ext in ('.json', '.tmp') or not job_id.isalnum():
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            results.append((stat.st_mtime, stat.st_size, job_id, path))
+
+        total = sum(size for _, size, _, _ in results)
+        results = [r for r in results if r[2] != keep]
+        evicted = []
+        for _, size, job_id, path in sorted(results):
+            if total <= self.max_cache_bytes:
+                break
+            for victim in (path, self._state_path(job_id)):
+                try:
+                    os.remove(victim)
+                except FileNotFoundError:
+                    pass
+            total -= size
+            evicted.append(job_id)
+        return evicted
+
+    def touch(self, state: Dict[str, Any]) -> None:
+        """Mark a cached result as recently used (eviction is LRU by mtime)."""
+        try:
+            os.utime(self.result_path(state))
+        except FileNotFoundError:
+            pass
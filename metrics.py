@@ -0,0 +1,320 @@
+"""Prometheus metrics, aggregated over all uvicorn worker processes.
+
+Each process records into its own in-memory registry and writes it to
+``<directory>/<pid>.json`` every ``flush_interval`` seconds. ``/metrics``
+is answered by whichever worker receives the scrape: it sums its own
+registry with the files of the other live processes (counters and
+histograms add up; gauges are totals over the workers). A process that
+exits drops out of the sum, which Prometheus treats as a counter reset.
+
+Recording is a no-op until ``configure`` is called (the app and the export
+processes do), so command-line tools sharing this code don't report.
+"""
+import atexit
+import json
+import os
+import tempfile
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+COUNTER = 'counter'
+GAUGE = 'gauge'
+HISTOGRAM = 'histogram'
+
+# name -> (type, help)
+METRICS = {
+    'http_requests_total': (COUNTER, 'HTTP requests by method, route and status'),
+    'http_request_duration_seconds': (HISTOGRAM, 'HTTP request latency by method and route'),
+    'http_requests_in_progress': (GAUGE, 'HTTP requests being served'),
+    'db_query_duration_seconds': (HISTOGRAM, 'Database calls by DatabaseInterface method'),
+    'db_rows_returned_total': (COUNTER, 'Rows returned by DatabaseInterface method'),
+    'db_pool_acquire_seconds': (HISTOGRAM, 'Time to check out a pooled database connection'),
+    'db_pool_connections': (GAUGE, 'Pooled database connections by state'),
+    'json_render_seconds': (HISTOGRAM, 'JSON response encoding time'),
+    'export_render_seconds': (HISTOGRAM, 'Export rendering time by format'),
+    'export_rows_total': (COUNTER, 'Exported rows by format'),
+}
+
+# Upper bounds in seconds; +Inf is implied
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+_BUCKET_LABELS = [f'le="{bound}"' for bound in BUCKETS]
+_INF_LABEL = 'le="+Inf"'
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+Key = Tuple[str, Tuple[Tuple[str, str], ...]]
+
+_lock = threading.Lock()
+_values: Dict[Key, Any] = {}
+_collectors: List[Callable[[], None]] = []
+_directory: Optional[str] = None
+_flush_interval = 1.0
+_flusher: Optional[threading.Thread] = None
+
+
+def default_directory() -> str:
+    return os.path.join(tempfile.gettempdir(), 'gaussdb_ops_metrics')
+
+
+def configure(enabled: bool = True, directory: str = '', flush_interval: float = 1.0) -> None:
+    """Start recording in this process, sharing ``directory`` with the other workers."""
+    global _directory, _flush_interval, _flusher
+    if not enabled:
+        _directory = None
+        return
+    _directory = directory or default_directory()
+    _flush_interval = flush_interval
+    os.makedirs(_directory, exist_ok=True)
+    if _flusher is None:
+        _flusher = threading.Thread(target=_flush_loop, name='metrics-flush', daemon=True)
+        _flusher.start()
+        atexit.register(_remove_own_file)
+
+
+def enabled() -> bool:
+    return _directory is not None
+
+
+def add_collector(collector: Callable[[], None]) -> None:
+    """Register a callable that refreshes gauges before each flush and scrape."""
+    _collectors.append(collector)
+
+
+def _key(name: str, labels: Dict[str, Any]) -> Key:
+    return name, tuple(sorted((label, str(value)) for label, value in labels.items()))
+
+
+def inc(name: str, amount: float = 1.0, **labels) -> None:
+    """Add to a counter, or to a gauge (negative amounts decrease it)."""
+    if _directory is None:
+        return
+    key = _key(name, labels)
+    with _lock:
+        _values[key] = _values.get(key, 0.0) + amount
+
+
+def set_gauge(name: str, value: float, **labels) -> None:
+    if _directory is None:
+        return
+    with _lock:
+        _values[_key(name, labels)] = float(value)
+
+
+def observe(name: str, seconds: float, **labels) -> None:
+    """Record one observation in a histogram."""
+    if _directory is None:
+        return
+    key = _key(name, labels)
+    with _lock:
+        histogram = _values.get(key)
+        if histogram is None:
+            # Per-bucket counts (not cumulative), then +Inf, sum and count
+            histogram = _values[key] = [0] * (len(BUCKETS) + 1) + [0.0, 0]
+        histogram[bisect_left(BUCKETS, seconds)] += 1
+        histogram[-2] += seconds
+        histogram[-1] += 1
+
+
+@contextmanager
+def timer(name: str, **labels) -> Iterator[None]:
+    """Observe the duration of a ``with`` block."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(name, time.perf_counter() - start, **labels)
+
+
+def timed_iter(iterable: Iterable, name: str, **labels) -> Iterator:
+    """Yield from ``iterable``, observing the time spent producing its items.
+
+    Time the consumer spends between items (e.g. sending them to a slow
+    client) is not counted.
+    """
+    if _directory is None:
+        yield from iterable
+        return
+    spent = 0.0
+    iterator = iter(iterable)
+    try:
+        while True:
+            start = time.perf_counter()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                spent += time.perf_counter() - start
+                break
+            spent += time.perf_counter() - start
+            yield item
+    finally:
+        observe(name, spent, **labels)
+
+
+def _snapshot() -> Dict[Key, Any]:
+    for collector in _collectors:
+        try:
+            collector()
+        except Exception:
+            pass
+    with _lock:
+        return {key: list(value) if isinstance(value, list) else value for key, value in _values.items()}
+
+
+def _own_path() -> str:
+    return os.path.join(_directory, f'{os.getpid()}.json')
+
+
+def flush() -> None:
+    """Write this process's registry for the other workers to read."""
+    if _directory is None:
+        return
+    values = [[name, labels, value] for (name, labels), value in _snapshot().items()]
+    path = _own_path()
+    tmp = f'{path}.tmp'
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(values, f)
+    os.replace(tmp, path)
+
+
+def _flush_loop() -> None:
+    while True:
+        time.sleep(_flush_interval)
+        try:
+            flush()
+        except OSError:
+            pass
+
+
+def _remove_own_file() -> None:
+    if _directory is not None:
+        try:
+            os.remove(_own_path())
+        except OSError:
+            pass
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def _read_others() -> Iterator[Tuple[Key, Any]]:
+    """Values flushed by the other live processes; files of dead ones are removed."""
+    own_pid = os.getpid()
+    for entry in os.scandir(_directory):
+        name, _, extension = entry.name.partition('.')
+        if extension != 'json' or not name.isdigit() or int(name) == own_pid:
+            continue
+        if not _pid_alive(int(name)):
+            try:
+                os.remove(entry.path)
+            except OSError:
+                pass
+            continue
+        try:
+            with open(entry.path, encoding='utf-8') as f:
+                values = json.load(f)
+        except (OSError, ValueError):
+            continue
+        for metric, labels, value in values:
+            yield (metric, tuple(tuple(pair) for pair in labels)), value
+
+
+def collect() -> Dict[Key, Any]:
+    """This process's values summed with those of the other live workers."""
+    merged = _snapshot()
+    for key, value in _read_others():
+        current = merged.get(key)
+        if current is None:
+            merged[key] = value
+        elif isinstance(current, list):
+            merged[key] = [a + b for a, b in zip(current, value)]
+        else:
+            merged[key] = current + value
+    return merged
+
+
+def _escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(labels: Tuple[Tuple[str, str], ...], extra: str = '') -> str:
+    parts = [f'{name}="{_escape(value)}"' for name, value in labels]
+    if extra:
+        parts.append(extra)
+    return '{' + ','.join(parts) + '}' if parts else ''
+
+
+def _number(value: float) -> str:
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+def render() -> str:
+    """All workers' metrics in the Prometheus text exposition format."""
+    values = collect()
+    by_name: Dict[str, List[Tuple[Tuple[Tuple[str, str], ...], Any]]] = {}
+    for (name, labels), value in values.items():
+        by_name.setdefault(name, []).append((labels, value))
+
+    lines = []
+    for name, (kind, help_text) in METRICS.items():
+        series = sorted(by_name.get(name, []))
+        if not series:
+            continue
+        lines.append(f'# HELP {name} {help_text}')
+        lines.append(f'# TYPE {name} {kind}')
+        for labels, value in series:
+            if kind != HISTOGRAM:
+                lines.append(f'{name}{_labels(labels)} {_number(value)}')
+                continue
+            cumulative = 0
+            for le, count in zip(_BUCKET_LABELS, value):
+                cumulative += count
+                lines.append(f'{name}_bucket{_labels(labels, le)} {cumulative}')
+            lines.append(f'{name}_bucket{_labels(labels, _INF_LABEL)} {value[-1]}')
+            lines.append(f'{name}_sum{_labels(labels)} {_number(value[-2])}')
+            lines.append(f'{name}_count{_labels(labels)} {value[-1]}')
+    return '\n'.join(lines) + '\n'
+
+
+class MetricsMiddleware:
+    """ASGI middleware recording request counts, latency and requests in progress per route."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send) -> None:
+        if scope['type'] != 'http' or _directory is None:
+            await self.app(scope, receive, send)
+            return
+
+        method = scope['method']
+        status = 500
+
+        async def send_with_status(message) -> None:
+            nonlocal status
+            if message['type'] == 'http.response.start':
+                status = message['status']
+            await send(message)
+
+        inc('http_requests_in_progress', method=method)
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            elapsed = time.perf_counter() - start
+            inc('http_requests_in_progress', -1, method=method)
+            # The route template, not the path: one series per endpoint
+            route = scope.get('route')
+            path = getattr(route, 'path', '<unmatched>')
+            observe('http_request_duration_seconds', elapsed, method=method, route=path)
+            inc('http_requests_total', method=method, route=path, status=status)
@@ -0,0 +1,755 @@
+"""Versioned schema migrations.
+
+Migrations run once at startup (see ``DB_AUTO_MIGRATE``) or from the command line:
+
+    python migrations.py            # apply pending migrations
+    python migrations.py --status   # show applied schema version
+
+Each migration is a list of SQL statements (or callables taking a cursor) per
+dialect. Applied versions are recorded in the ``schema_version`` table, so
+request paths never need to run DDL.
+"""
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List, Optional, Tuple, Union
+
+Step = Union[str, Callable[[Any], None]]
+
+# Arbitrary key for pg_advisory_xact_lock, serializes concurrent workers
+PG_LOCK_KEY = 7302514
+
+
+def _sqlite_add_review_conclusion(cursor) -> None:
+    """Add conclusion column to ticket_review tables created before it existed."""
+    cursor.execute("PRAGMA table_info(ticket_review)")
+    columns = [row[1] for row in cursor.fetchall()]
+    if 'conclusion' not in columns:
+        cursor.execute('ALTER TABLE ticket_review ADD COLUMN conclusion TEXT')
+
+
+# Effective review status of one ticket: 'pending' (no review), 'expired'
+# (review older than the ticket's last update) or the review conclusion
+_REVIEW_STATE_SELECT = {
+    'sqlite': (
+        'SELECT T2."流程ID", '
+        "CASE WHEN R.id IS NULL THEN 'pending' WHEN {expired} THEN 'expired' "
+        "ELSE COALESCE(R.conclusion, '') END, "
+        'CASE WHEN {expired} THEN 1 ELSE 0 END '
+        'FROM operations_kb as T2 LEFT JOIN ticket_review as R ON T2."流程ID" = R.processid'
+    ).format(expired="(R.id IS NOT NULL AND R.updatetime < COALESCE(T2.update_time, T2.create_time))"),
+    'postgresql': (
+        'SELECT T2."流程ID", '
+        "CASE WHEN R.id IS NULL THEN 'pending' WHEN {expired} THEN 'expired' "
+        "ELSE COALESCE(R.conclusion, '') END, "
+        'CASE WHEN {expired} THEN 1 ELSE 0 END '
+        'FROM operations_kb as T2 LEFT JOIN ticket_review as R ON T2."流程ID" = R.processid'
+    ).format(expired="(R.id IS NOT NULL AND "
+                     "CAST(R.updatetime AS TEXT) < COALESCE(T2.update_time, T2.create_time))"),
+}
+
+
+def _sqlite_refresh_review_state(key: str) -> str:
+    return (f'INSERT OR REPLACE INTO ticket_review_state (processId, status, expired) '
+            f'{_REVIEW_STATE_SELECT["sqlite"]} WHERE T2."流程ID" = {key};')
+
+
+# Facets of one classified ticket, as stored in ticket_review_state from
+# migration 9 on: status and expired flag as above, plus issue type, owner
+# and score band (the bands of query.SCORE_BANDS)
+_TICKET_FACETS_SELECT = {
+    dialect: (
+        'SELECT T2."流程ID", '
+        "CASE WHEN R.id IS NULL THEN 'pending' WHEN {expired} THEN 'expired' "
+        "ELSE COALESCE(R.conclusion, '') END, "
+        'CASE WHEN {expired} THEN 1 ELSE 0 END, '
+        'C."issueType", C."owner", '
+        'CASE WHEN T2."得分" >= 8 THEN \'high\' WHEN T2."得分" >= 6 THEN \'medium\' '
+        'WHEN T2."得分" < 6 THEN \'low\' END '
+        'FROM operations_kb as T2 '
+        'JOIN ticket_classification_2512 as C ON T2."流程ID" = C."processId" '
+        'LEFT JOIN ticket_review as R ON T2."流程ID" = R.processid'
+    ).format(expired=expired)
+    for dialect, expired in (
+        ('sqlite', "(R.id IS NOT NULL AND R.updatetime < COALESCE(T2.update_time, T2.create_time))"),
+        ('postgresql', "(R.id IS NOT NULL AND "
+                       "CAST(R.updatetime AS TEXT) < COALESCE(T2.update_time, T2.create_time))"),
+    )
+}
+
+_TICKET_FACETS_COLUMNS = 'processId, status, expired, issue_type, owner, score_band'
+
+
+def _sqlite_refresh_ticket_facets(key: str) -> str:
+    # Delete and re-insert: the row goes away when the ticket loses its classification
+    return (f'DELETE FROM ticket_review_state WHERE processId = {key}; '
+            f'INSERT INTO ticket_review_state ({_TICKET_FACETS_COLUMNS}) '
+            f'{_TICKET_FACETS_SELECT["sqlite"]} WHERE T2."流程ID" = {key};')
+
+
+def sqlite_json_values(column: str) -> str:
+    """SQL for the text of a JSON step list without its keys (strings and numbers).
+
+    Invalid JSON is taken as plain text. Indexed by migration 7, so the
+    search doesn't match the step keys (操作, 现象, ...) of every ticket.
+    """
+    return (f"CASE WHEN json_valid({column}) THEN COALESCE((SELECT group_concat(value, ' ') "
+            f"FROM json_tree({column}) WHERE type IN ('text', 'integer', 'real')), '') "
+            f"ELSE COALESCE({column}, '') END")
+
+
+def _sqlite_fts_values(row: str) -> str:
+    analysis = sqlite_json_values(f'{row}."分析过程"')
+    solution = sqlite_json_values(f'{row}."解决方案"')
+    return f'{row}."问题现象", {row}."问题根因", {analysis}, {solution}'
+
+
+_FTS_COLUMNS = '"问题现象", "问题根因", "分析过程", "解决方案"'
+
+# Fills the (contentless) search index of migration 7; also used by search.rebuild_index
+SQLITE_FTS_FILL = (f'INSERT INTO ticket_fts (rowid, {_FTS_COLUMNS}) '
+                   f'SELECT rowid, {_sqlite_fts_values("operations_kb")} FROM operations_kb')
+
+# Tables whose writes bump each data_generation counter (migration 12)
+_GENERATION_TABLES = (
+    ('operations_kb', 'tickets'),
+    ('ticket_classification_2512', 'tickets'),
+    ('ticket_review', 'reviews'),
+)
+
+
+# (version, description, {dialect: [steps]})
+MIGRATIONS: List[Tuple[int, str, Dict[str, List[Step]]]] = [
+    (1, 'create ticket_review', {
+        'sqlite': [
+            '''
+            CREATE TABLE IF NOT EXISTS ticket_review (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                processId TEXT NOT NULL UNIQUE,
+                createTime TEXT NOT NULL,
+                updateTime TEXT NOT NULL,
+                conclusion TEXT,
+                content TEXT NOT NULL
+            )
+            ''',
+            _sqlite_add_review_conclusion,
+        ],
+        'postgresql': [
+            '''
+            CREATE TABLE IF NOT EXISTS ticket_review (
+                id SERIAL PRIMARY KEY,
+                processid TEXT NOT NULL UNIQUE,
+                createtime TIMESTAMP NOT NULL,
+                updatetime TIMESTAMP NOT NULL,
+                conclusion TEXT,
+                content TEXT NOT NULL
+            )
+            ''',
+            'ALTER TABLE ticket_review ADD COLUMN IF NOT EXISTS conclusion TEXT',
+        ],
+    }),
+    # ticket_review(processId) is already indexed by its UNIQUE constraint
+    (2, 'index hot ticket queries', {
+        'sqlite': [
+            'CREATE INDEX IF NOT EXISTS idx_operations_kb_update_create '
+            'ON operations_kb (update_time DESC, create_time DESC)',
+            'CREATE INDEX IF NOT EXISTS idx_ticket_classification_process '
+            'ON ticket_classification_2512 ("processId")',
+        ],
+        'postgresql': [
+            'CREATE INDEX IF NOT EXISTS idx_operations_kb_update_create '
+            'ON operations_kb (update_time DESC, create_time DESC)',
+            'CREATE INDEX IF NOT EXISTS idx_ticket_classification_process '
+            'ON ticket_classification_2512 ("processId")',
+        ],
+    }),
+    # Match the keyset sort expressions in query.SORT_KEYS
+    (3, 'index keyset sort orders', {
+        dialect: [
+            'CREATE INDEX IF NOT EXISTS idx_operations_kb_sort_update ON operations_kb '
+            '((COALESCE(update_time, create_time, \'\')), (COALESCE(create_time, \'\')), "流程ID")',
+            'CREATE INDEX IF NOT EXISTS idx_operations_kb_sort_create ON operations_kb '
+            '((COALESCE(create_time, \'\')), "流程ID")',
+            'CREATE INDEX IF NOT EXISTS idx_operations_kb_sort_score ON operations_kb '
+            '((COALESCE("得分", 0)), "流程ID")',
+        ]
+        for dialect in ('sqlite', 'postgresql')
+    }),
+    # Narrow indexes so the filter dropdowns' DISTINCT queries skip the wide rows
+    (4, 'index ticket facets', {
+        dialect: [
+            'CREATE INDEX IF NOT EXISTS idx_ticket_classification_type '
+            'ON ticket_classification_2512 ("issueType")',
+            'CREATE INDEX IF NOT EXISTS idx_ticket_classification_owner '
+            'ON ticket_classification_2512 ("owner")',
+        ]
+        for dialect in ('sqlite', 'postgresql')
+    }),
+    # MAX(updatetime) is part of the cache change probe
+    (5, 'index review update time', {
+        dialect: [
+            'CREATE INDEX IF NOT EXISTS idx_ticket_review_updatetime ON ticket_review (updatetime)',
+        ]
+        for dialect in ('sqlite', 'postgresql')
+    }),
+    # Cross-worker cache invalidation log (PostgreSQL uses LISTEN/NOTIFY instead),
+    # written by the triggers of migration 13
+    (6, 'create cache_invalidation', {
+        'sqlite': [
+            '''
+            CREATE TABLE IF NOT EXISTS cache_invalidation (
+                seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                origin TEXT NOT NULL,
+                process_id TEXT,
+                created_at REAL NOT NULL
+            )
+            ''',
+            'CREATE INDEX IF NOT EXISTS idx_cache_invalidation_created ON cache_invalidation (created_at)',
+        ],
+        'postgresql': [],
+    }),
+    # Full-text search (see search.py) over the text of each ticket, with the
+    # analysis/solution step lists reduced to their values (not their JSON
+    # keys). SQLite: a contentless FTS5 table fed the flattened text by
+    # triggers (its 'delete' entries recompute the same text from the old
+    # row). PostgreSQL: a trigram index over ticket_search_text().
+    (7, 'create ticket search index', {
+        'sqlite': [
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS ticket_fts USING fts5({_FTS_COLUMNS}, content='', tokenize='trigram')",
+            f'''
+            CREATE TRIGGER IF NOT EXISTS operations_kb_fts_insert AFTER INSERT ON operations_kb BEGIN
+                INSERT INTO ticket_fts (rowid, {_FTS_COLUMNS})
+                VALUES (new.rowid, {_sqlite_fts_values('new')});
+            END
+            ''',
+            f'''
+            CREATE TRIGGER IF NOT EXISTS operations_kb_fts_delete AFTER DELETE ON operations_kb BEGIN
+                INSERT INTO ticket_fts (ticket_fts, rowid, {_FTS_COLUMNS})
+                VALUES ('delete', old.rowid, {_sqlite_fts_values('old')});
+            END
+            ''',
+            f'''
+            CREATE TRIGGER IF NOT EXISTS operations_kb_fts_update
+            AFTER UPDATE OF {_FTS_COLUMNS} ON operations_kb BEGIN
+                INSERT INTO ticket_fts (ticket_fts, rowid, {_FTS_COLUMNS})
+                VALUES ('delete', old.rowid, {_sqlite_fts_values('old')});
+                INSERT INTO ticket_fts (rowid, {_FTS_COLUMNS})
+                VALUES (new.rowid, {_sqlite_fts_values('new')});
+            END
+            ''',
+            SQLITE_FTS_FILL,
+        ],
+        'postgresql': [
+            'CREATE EXTENSION IF NOT EXISTS pg_trgm',
+            '''
+            CREATE OR REPLACE FUNCTION ticket_search_text(doc TEXT) RETURNS TEXT AS $$
+            BEGIN
+                RETURN COALESCE((
+                    SELECT string_agg(v #>> '{}', ' ')
+                    FROM jsonb_path_query(doc::jsonb,
+                        'strict $.** ? (@.type() == "string" || @.type() == "number")') AS v
+                ), '');
+            EXCEPTION WHEN others THEN
+                -- Not JSON: plain text
+                RETURN COALESCE(doc, '');
+            END
+            $$ LANGUAGE plpgsql IMMUTABLE
+            ''',
+            'CREATE INDEX IF NOT EXISTS idx_operations_kb_search ON operations_kb USING gin ('
+            '(COALESCE("问题现象", \'\') || \' \' || COALESCE("问题根因", \'\') || \' \' || '
+            'ticket_search_text("分析过程") || \' \' || ticket_search_text("解决方案")) gin_trgm_ops)',
+        ],
+    }),
+    # Materialized review status (see query.build_filters), maintained by
+    # triggers on review saves and ticket updates so status filters and
+    # counts are index lookups
+    (8, 'create ticket_review_state', {
+        'sqlite': [
+            '''
+            CREATE TABLE IF NOT EXISTS ticket_review_state (
+                processId TEXT PRIMARY KEY,
+                status TEXT NOT NULL,
+                expired INTEGER NOT NULL DEFAULT 0
+            )
+            ''',
+            'CREATE INDEX IF NOT EXISTS idx_ticket_review_state_status ON ticket_review_state (status)',
+            f'''
+            CREATE TRIGGER IF NOT EXISTS ticket_review_state_review_insert
+            AFTER INSERT ON ticket_review BEGIN
+                {_sqlite_refresh_review_state('new.processId')}
+            END
+            ''',
+            f'''
+            CREATE TRIGGER IF NOT EXISTS ticket_review_state_review_update
+            AFTER UPDATE ON ticket_review BEGIN
+                {_sqlite_refresh_review_state('old.processId')}
+                {_sqlite_refresh_review_state('new.processId')}
+            END
+            ''',
+            f'''
+            CREATE TRIGGER IF NOT EXISTS ticket_review_state_review_delete
+            AFTER DELETE ON ticket_review BEGIN
+                {_sqlite_refresh_review_state('old.processId')}
+            END
+            ''',
+            f'''
+            CREATE TRIGGER IF NOT EXISTS ticket_review_state_ticket_insert
+            AFTER INSERT ON operations_kb BEGIN
+                {_sqlite_refresh_review_state('new."流程ID"')}
+            END
+            ''',
+            f'''
+            CREATE TRIGGER IF NOT EXISTS ticket_review_state_ticket_update
+            AFTER UPDATE OF "流程ID", create_time, update_time ON operations_kb BEGIN
+                DELETE FROM ticket_review_state WHERE processId = old."流程ID";
+                {_sqlite_refresh_review_state('new."流程ID"')}
+            END
+            ''',
+            '''
+            CREATE TRIGGER IF NOT EXISTS ticket_review_state_ticket_delete
+            AFTER DELETE ON operations_kb BEGIN
+                DELETE FROM ticket_review_state WHERE processId = old."流程ID";
+            END
+            ''',
+            'DELETE FROM ticket_review_state',
+            f'INSERT INTO ticket_review_state (processId, status, expired) {_REVIEW_STATE_SELECT["sqlite"]}',
+        ],
+        'postgresql': [
+            '''
+            CREATE TABLE IF NOT EXISTS ticket_review_state (
+                processid TEXT PRIMARY KEY,
+                status TEXT NOT NULL,
+                expired INTEGER NOT NULL DEFAULT 0
+            )
+            ''',
+            'CREATE INDEX IF NOT EXISTS idx_ticket_review_state_status ON ticket_review_state (status)',
+            f'''
+            CREATE OR REPLACE FUNCTION refresh_ticket_review_state(pid TEXT) RETURNS void AS $$
+            BEGIN
+                INSERT INTO ticket_review_state (processid, status, expired)
+                {_REVIEW_STATE_SELECT["postgresql"]} WHERE T2."流程ID" = pid
+                ON CONFLICT (processid) DO UPDATE SET status = excluded.status, expired = excluded.expired;
+            END
+            $$ LANGUAGE plpgsql
+            ''',
+            '''
+            CREATE OR REPLACE FUNCTION ticket_review_state_on_review() RETURNS trigger AS $$
+            BEGIN
+                IF TG_OP IN ('UPDATE', 'DELETE') THEN
+                    PERFORM refresh_ticket_review_state(OLD.processid);
+                END IF;
+                IF TG_OP IN ('INSERT', 'UPDATE') THEN
+                    PERFORM refresh_ticket_review_state(NEW.processid);
+                END IF;
+                RETURN NULL;
+            END
+            $$ LANGUAGE plpgsql
+            ''',
+            '''
+            CREATE OR REPLACE FUNCTION ticket_review_state_on_ticket() RETURNS trigger AS $$
+            BEGIN
+                IF TG_OP IN ('UPDATE', 'DELETE') THEN
+                    DELETE FROM ticket_review_state WHERE processid = OLD."流程ID";
+                END IF;
+                IF TG_OP IN ('INSERT', 'UPDATE') THEN
+                    PERFORM refresh_ticket_review_state(NEW."流程ID");
+                END IF;
+                RETURN NULL;
+            END
+            $$ LANGUAGE plpgsql
+            ''',
+            'DROP TRIGGER IF EXISTS ticket_review_state_review ON ticket_review',
+            'CREATE TRIGGER ticket_review_state_review '
+            'AFTER INSERT OR UPDATE OR DELETE ON ticket_review '
+            'FOR EACH ROW EXECUTE PROCEDURE ticket_review_state_on_review()',
+            'DROP TRIGGER IF EXISTS ticket_review_state_ticket ON operations_kb',
+            'CREATE TRIGGER ticket_review_state_ticket '
+            'AFTER INSERT OR DELETE OR UPDATE OF "流程ID", create_time, update_time ON operations_kb '
+            'FOR EACH ROW EXECUTE PROCEDURE ticket_review_state_on_ticket()',
+            'TRUNCATE ticket_review_state',
+            f'INSERT INTO ticket_review_state (processid, status, expired) {_REVIEW_STATE_SELECT["postgresql"]}',
+        ],
+    }),
+    # Issue type, owner and score band next to the review status, so the
+    # /api/stats cube is one index-only GROUP BY (see stats.py). Rows now
+    # exist only for classified tickets, like the rows the ticket queries return.
+    (9, 'add facets to ticket_review_state', {
+        'sqlite': [
+            'ALTER TABLE ticket_review_state ADD COLUMN issue_type TEXT',
+            'ALTER TABLE ticket_review_state ADD COLUMN owner TEXT',
+            'ALTER TABLE ticket_review_state ADD COLUMN score_band TEXT',
+            'CREATE INDEX IF NOT EXISTS idx_ticket_review_state_facets '
+            'ON ticket_review_state (issue_type, owner, status, score_band)',
+            'DROP TRIGGER IF EXISTS ticket_review_state_review_insert',
+            f'''
+            CREATE TRIGGER ticket_review_state_review_insert
+            AFTER INSERT ON ticket_review BEGIN
+                {_sqlite_refresh_ticket_facets('new.processId')}
+            END
+            ''',
+            'DROP TRIGGER IF EXISTS ticket_review_state_review_update',
+            f'''
+            CREATE TRIGGER ticket_review_state_review_update
+            AFTER UPDATE ON ticket_review BEGIN
+                {_sqlite_refresh_ticket_facets('old.processId')}
+                {_sqlite_refresh_ticket_facets('new.processId')}
+            END
+            ''',
+            'DROP TRIGGER IF EXISTS ticket_review_state_review_delete',
+            f'''
+            CREATE TRIGGER ticket_review_state_review_delete
+            AFTER DELETE ON ticket_review BEGIN
+                {_sqlite_refresh_ticket_facets('old.processId')}
+            END
+            ''',
+            'DROP TRIGGER IF EXISTS ticket_review_state_ticket_insert',
+            f'''
+            CREATE TRIGGER ticket_review_state_ticket_insert
+            AFTER INSERT ON operations_kb BEGIN
+                {_sqlite_refresh_ticket_facets('new."流程ID"')}
+            END
+            ''',
+            'DROP TRIGGER IF EXISTS ticket_review_state_ticket_update',
+            f'''
+            CREATE TRIGGER ticket_review_state_ticket_update
+            AFTER UPDATE OF "流程ID", create_time, update_time, "得分" ON operations_kb BEGIN
+                DELETE FROM ticket_review_state WHERE processId = old."流程ID";
+                {_sqlite_refresh_ticket_facets('new."流程ID"')}
+            END
+            ''',
+            'DROP TRIGGER IF EXISTS ticket_review_state_classification_insert',
+            f'''
+            CREATE TRIGGER ticket_review_state_classification_insert
+            AFTER INSERT ON ticket_classification_2512 BEGIN
+                {_sqlite_refresh_ticket_facets('new."processId"')}
+            END
+            ''',
+            f'''
+            CREATE TRIGGER IF NOT EXISTS ticket_review_state_classification_update
+            AFTER UPDATE OF "processId", "issueType", "owner" ON ticket_classification_2512 BEGIN
+                {_sqlite_refresh_ticket_facets('old."processId"')}
+                {_sqlite_refresh_ticket_facets('new."processId"')}
+            END
+            ''',
+            'DROP TRIGGER IF EXISTS ticket_review_state_classification_delete',
+            f'''
+            CREATE TRIGGER ticket_review_state_classification_delete
+            AFTER DELETE ON ticket_classification_2512 BEGIN
+                {_sqlite_refresh_ticket_facets('old."processId"')}
+            END
+            ''',
+            'DELETE FROM ticket_review_state',
+            f'INSERT INTO ticket_review_state ({_TICKET_FACETS_COLUMNS}) {_TICKET_FACETS_SELECT["sqlite"]}',
+        ],
+        'postgresql': [
+            'ALTER TABLE ticket_review_state ADD COLUMN IF NOT EXISTS issue_type TEXT',
+            'ALTER TABLE ticket_review_state ADD COLUMN IF NOT EXISTS owner TEXT',
+            'ALTER TABLE ticket_review_state ADD COLUMN IF NOT EXISTS score_band TEXT',
+            'CREATE INDEX IF NOT EXISTS idx_ticket_review_state_facets '
+            'ON ticket_review_state (issue_type, owner, status, score_band)',
+            f'''
+            CREATE OR REPLACE FUNCTION refresh_ticket_review_state(pid TEXT) RETURNS void AS $$
+            BEGIN
+                DELETE FROM ticket_review_state WHERE processid = pid;
+                INSERT INTO ticket_review_state ({_TICKET_FACETS_COLUMNS})
+                {_TICKET_FACETS_SELECT["postgresql"]} WHERE T2."流程ID" = pid;
+            END
+            $$ LANGUAGE plpgsql
+            ''',
+            '''
+            CREATE OR REPLACE FUNCTION ticket_review_state_on_classification() RETURNS trigger AS $$
+            BEGIN
+                IF TG_OP IN ('UPDATE', 'DELETE') THEN
+                    PERFORM refresh_ticket_review_state(OLD."processId");
+                END IF;
+                IF TG_OP IN ('INSERT', 'UPDATE') THEN
+                    PERFORM refresh_ticket_review_state(NEW."processId");
+                END IF;
+                RETURN NULL;
+            END
+            $$ LANGUAGE plpgsql
+            ''',
+            'DROP TRIGGER IF EXISTS ticket_review_state_ticket ON operations_kb',
+            'CREATE TRIGGER ticket_review_state_ticket '
+            'AFTER INSERT OR DELETE OR UPDATE OF "流程ID", create_time, update_time, "得分" ON operations_kb '
+            'FOR EACH ROW EXECUTE PROCEDURE ticket_review_state_on_ticket()',
+            'DROP TRIGGER IF EXISTS ticket_review_state_classification ON ticket_classification_2512',
+            'CREATE TRIGGER ticket_review_state_classification '
+            'AFTER INSERT OR DELETE OR UPDATE OF "processId", "issueType", "owner" '
+            'ON ticket_classification_2512 '
+            'FOR EACH ROW EXECUTE PROCEDURE ticket_review_state_on_classification()',
+            'TRUNCATE ticket_review_state',
+            f'INSERT INTO ticket_review_state ({_TICKET_FACETS_COLUMNS}) {_TICKET_FACETS_SELECT["postgresql"]}',
+        ],
+    }),
+    # Optimistic concurrency: each save bumps the version; conditional saves
+    # compare it (see DatabaseInterface.save_ticket_reviews)
+    (10, 'add ticket_review version', {
+        'sqlite': [
+            'ALTER TABLE ticket_review ADD COLUMN version INTEGER NOT NULL DEFAULT 1',
+        ],
+        'postgresql': [
+            'ALTER TABLE ticket_review ADD COLUMN IF NOT EXISTS version INTEGER NOT NULL DEFAULT 1',
+        ],
+    }),
+    # Append-only review history, written by triggers in the saving
+    # transaction. Clustered by (processId, version): one narrow B-tree insert
+    # per save, and a ticket's history is a single range scan.
+    (11, 'create ticket_review_history', {
+        'sqlite': [
+            '''
+            CREATE TABLE IF NOT EXISTS ticket_review_history (
+                processId TEXT NOT NULL,
+                version INTEGER NOT NULL,
+                updateTime TEXT NOT NULL,
+                conclusion TEXT,
+                content TEXT NOT NULL,
+                PRIMARY KEY (processId, version)
+            ) WITHOUT ROWID
+            ''',
+            '''
+            CREATE TRIGGER IF NOT EXISTS ticket_review_history_insert
+            AFTER INSERT ON ticket_review BEGIN
+                INSERT OR IGNORE INTO ticket_review_history (processId, version, updateTime, conclusion, content)
+                VALUES (new.processId, new.version, new.updateTime, new.conclusion, new.content);
+            END
+            ''',
+            # Saves that change nothing don't add a revision
+            '''
+            CREATE TRIGGER IF NOT EXISTS ticket_review_history_update
+            AFTER UPDATE OF conclusion, content ON ticket_review
+            WHEN old.conclusion IS NOT new.conclusion OR old.content IS NOT new.content BEGIN
+                INSERT OR IGNORE INTO ticket_review_history (processId, version, updateTime, conclusion, content)
+                VALUES (new.processId, new.version, new.updateTime, new.conclusion, new.content);
+            END
+            ''',
+            'INSERT OR IGNORE INTO ticket_review_history (processId, version, updateTime, conclusion, content) '
+            'SELECT processId, version, updateTime, conclusion, content FROM ticket_review',
+        ],
+        'postgresql': [
+            '''
+            CREATE TABLE IF NOT EXISTS ticket_review_history (
+                processid TEXT NOT NULL,
+                version INTEGER NOT NULL,
+                updatetime TIMESTAMP NOT NULL,
+                conclusion TEXT,
+                content TEXT NOT NULL,
+                PRIMARY KEY (processid, version)
+            )
+            ''',
+            '''
+            CREATE OR REPLACE FUNCTION ticket_review_history_on_save() RETURNS trigger AS $$
+            BEGIN
+                IF TG_OP = 'INSERT' OR OLD.conclusion IS DISTINCT FROM NEW.conclusion
+                        OR OLD.content IS DISTINCT FROM NEW.content THEN
+                    INSERT INTO ticket_review_history (processid, version, updatetime, conclusion, content)
+                    VALUES (NEW.processid, NEW.version, NEW.updatetime, NEW.conclusion, NEW.content)
+                    ON CONFLICT DO NOTHING;
+                END IF;
+                RETURN NULL;
+            END
+            $$ LANGUAGE plpgsql
+            ''',
+            'DROP TRIGGER IF EXISTS ticket_review_history ON ticket_review',
+            'CREATE TRIGGER ticket_review_history AFTER INSERT OR UPDATE ON ticket_review '
+            'FOR EACH ROW EXECUTE PROCEDURE ticket_review_history_on_save()',
+            'INSERT INTO ticket_review_history (processid, version, updatetime, conclusion, content) '
+            'SELECT processid, version, updatetime, conclusion, content FROM ticket_review '
+            'ON CONFLICT DO NOTHING',
+        ],
+    }),
+    # Change counters for the data version stamp (DatabaseInterface.get_data_version):
+    # bumped by triggers on every write, so the stamp moves even when counts
+    # and the second-resolution timestamps don't
+    (12, 'create data_generation', {
+        'sqlite': [
+            '''
+            CREATE TABLE IF NOT EXISTS data_generation (
+                name TEXT PRIMARY KEY,
+                generation INTEGER NOT NULL
+            )
+            ''',
+            "INSERT OR IGNORE INTO data_generation (name, generation) VALUES ('tickets', 0), ('reviews', 0)",
+        ] + [
+            f'''
+            CREATE TRIGGER IF NOT EXISTS data_generation_{table}_{operation.lower()}
+            AFTER {operation} ON {table} BEGIN
+                UPDATE data_generation SET generation = generation + 1 WHERE name = '{name}';
+            END
+            '''
+            for table, name in _GENERATION_TABLES
+            for operation in ('INSERT', 'UPDATE', 'DELETE')
+        ],
+        'postgresql': [
+            '''
+            CREATE TABLE IF NOT EXISTS data_generation (
+                name TEXT PRIMARY KEY,
+                generation BIGINT NOT NULL
+            )
+            ''',
+            "INSERT INTO data_generation (name, generation) VALUES ('tickets', 0), ('reviews', 0) "
+            "ON CONFLICT DO NOTHING",
+            '''
+            CREATE OR REPLACE FUNCTION data_generation_bump() RETURNS trigger AS $$
+            BEGIN
+                UPDATE data_generation SET generation = generation + 1 WHERE name = TG_ARGV[0];
+                RETURN NULL;
+            END
+            $$ LANGUAGE plpgsql
+            ''',
+        ] + [
+            step
+            for table, name in _GENERATION_TABLES
+            for step in (
+                f'DROP TRIGGER IF EXISTS data_generation ON {table}',
+                # Once per statement: a batch save bumps the counter once
+                f'CREATE TRIGGER data_generation AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON {table} '
+                f"FOR EACH STATEMENT EXECUTE PROCEDURE data_generation_bump('{name}')",
+            )
+        ],
+    }),
+    # Cache invalidations written by triggers in the saving transaction (see
+    # coherence.py): they commit, or roll back, together with the review, and
+    # also cover reviews changed outside the app. The origin column is unused.
+    (13, 'publish cache invalidations from triggers', {
+        'sqlite': [
+            f'''
+            CREATE TRIGGER IF NOT EXISTS cache_invalidation_review_{operation.lower()}
+            AFTER {operation} ON ticket_review BEGIN
+                INSERT INTO cache_invalidation (origin, process_id, created_at)
+                VALUES ('', {row}.processId, (julianday('now') - 2440587.5) * 86400.0);
+            END
+            '''
+            for operation, row in (('INSERT', 'new'), ('UPDATE', 'new'), ('DELETE', 'old'))
+        ],
+        'postgresql': [
+            # Notifications are delivered on commit only; channel coherence.CHANNEL
+            '''
+            CREATE OR REPLACE FUNCTION cache_invalidation_notify() RETURNS trigger AS $$
+            BEGIN
+                IF TG_OP = 'DELETE' THEN
+                    PERFORM pg_notify('ticket_cache', OLD.processid);
+                ELSE
+                    PERFORM pg_notify('ticket_cache', NEW.processid);
+                END IF;
+                RETURN NULL;
+            END
+            $$ LANGUAGE plpgsql
+            ''',
+            'DROP TRIGGER IF EXISTS cache_invalidation ON ticket_review',
+            'CREATE TRIGGER cache_invalidation AFTER INSERT OR UPDATE OR DELETE ON ticket_review '
+            'FOR EACH ROW EXECUTE PROCEDURE cache_invalidation_notify()',
+        ],
+    }),
+]
+
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+
+def _run_step(cursor, step: Step) -> None:
+    if callable(step):
+        step(cursor)
+    else:
+        cursor.execute(step)
+
+
+def _ensure_version_table(cursor) -> None:
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS schema_version (
+            version INTEGER PRIMARY KEY,
+            description TEXT NOT NULL,
+            applied_at TEXT NOT NULL
+        )
+    ''')
+
+
+def get_schema_version(conn) -> int:
+    """Return the highest applied migration version (0 if none)."""
+    cursor = conn.cursor()
+    try:
+        cursor.execute('SELECT MAX(version) FROM schema_version')
+    except Exception:
+        conn.rollback()
+        return 0
+    row = cursor.fetchone()
+    return row[0] or 0
+
+
+def migrate(conn, dialect: str, target: Optional[int] = None) -> List[int]:
+    """Apply pending migrations (up to ``target``, default all) in a single locked transaction.
+
+    Returns the list of versions applied by this call. Concurrent callers
+    (e.g. several uvicorn workers starting together) are serialized, and the
+    ones that lose the race find nothing left to do.
+    """
+    if dialect == 'sqlite':
+        # Take the write lock up front so two workers can't both see version 0
+        isolation_level = conn.isolation_level
+        conn.isolation_level = None
+        cursor = conn.cursor()
+        cursor.execute('BEGIN IMMEDIATE')
+    elif dialect == 'postgresql':
+        cursor = conn.cursor()
+        cursor.execute('SELECT pg_advisory_xact_lock(%s)', (PG_LOCK_KEY,))
+    else:
+        raise ValueError(f"Unsupported database type: {dialect}")
+
+    applied = []
+    try:
+        _ensure_version_table(cursor)
+        cursor.execute('SELECT MAX(version) FROM schema_version')
+        current = cursor.fetchone()[0] or 0
+        placeholder = '?' if dialect == 'sqlite' else '%s'
+
+        for version, description, steps in MIGRATIONS:
+            if version <= current or (target is not None and version > target):
+                continue
+            for step in steps[dialect]:
+                _run_step(cursor, step)
+            cursor.execute(
+                f'INSERT INTO schema_version (version, description, applied_at) '
+                f'VALUES ({placeholder}, {placeholder}, {placeholder})',
+                (version, description, datetime.now(timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ'))
+            )
+            applied.append(version)
+
+        if dialect == 'sqlite':
+            cursor.execute('COMMIT')
+        else:
+            conn.commit()
+    except Exception:
+        if dialect == 'sqlite':
+            cursor.execute('ROLLBACK')
+        else:
+            conn.rollback()
+        raise
+    finally:
+        if dialect == 'sqlite':
+            conn.isolation_level = isolation_level
+    return applied
+
+
+def main() -> None:
+    import argparse
+    from config import DATABASE_CONFIG
+    from database import create_database
+
+    parser = argparse.ArgumentParser(description="Apply database schema migrations")
+    parser.add_argument('--status', action='store_true', help="show schema version and exit")
+    args = parser.parse_args()
+
+    db = create_database(DATABASE_CONFIG)
+    try:
+        if args.status:
+            version = db.get_schema_version()
+            print(f"schema version: {version} (latest: {LATEST_VERSION})")
+            return
+        applied = db.migrate()
+        if applied:
+            print(f"applied migrations: {', '.join(str(v) for v in applied)}")
+        else:
+            print(f"schema is up to date (version {LATEST_VERSION})")
+    finally:
+        db.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,199 @@
+"""Bounded, thread-safe connection pool shared by the database backends."""
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Optional
+
+import metrics
+
+
+class PoolTimeoutError(Exception):
+    """Raised when no connection becomes available within the acquire timeout."""
+
+
+class ConnectionPool:
+    """Per-process connection pool with min/max size, idle timeout and health checks.
+
+    Connections are created by ``factory`` and validated with ``health_check``
+    when they have been idle longer than ``health_check_interval`` seconds.
+    The pool is re-created transparently after a fork so each uvicorn worker
+    owns its own connections.
+    """
+
+    def __init__(
+        self,
+        factory: Callable[[], Any],
+        health_check: Optional[Callable[[Any], None]] = None,
+        reset: Optional[Callable[[Any], None]] = None,
+        min_size: int = 1,
+        max_size: int = 10,
+        idle_timeout: float = 300.0,
+        acquire_timeout: float = 30.0,
+        health_check_interval: float = 30.0,
+    ):
+        if max_size < 1:
+            raise ValueError("max_size must be at least 1")
+        self.factory = factory
+        self.health_check = health_check
+        self.reset = reset
+        self.min_size = min(min_size, max_size)
+        self.max_size = max_size
+        self.idle_timeout = idle_timeout
+        self.acquire_timeout = acquire_timeout
+        self.health_check_interval = health_check_interval
+        self._init_state()
+
+    def _init_state(self) -> None:
+        self._pid = os.getpid()
+        self._cond = threading.Condition(threading.Lock())
+        self._idle = deque()  # (connection, last_used)
+        self._size = 0
+        self._closed = False
+        self._stats = {
+            'created': 0,
+            'closed': 0,
+            'acquired': 0,
+            'released': 0,
+            'waits': 0,
+            'timeouts': 0,
+            'health_check_failures': 0,
+            'acquire_time_total': 0.0,
+        }
+
+    def _check_pid(self) -> None:
+        # Connections must not be shared across processes; drop inherited ones
+        if self._pid != os.getpid():
+            self._init_state()
+
+    def _close_raw(self, conn) -> None:
+        try:
+            conn.close()
+        except Exception:
+            pass
+        self._stats['closed'] += 1
+
+    def open(self) -> None:
+        """Pre-fill the pool up to ``min_size`` connections."""
+        self._check_pid()
+        with self._cond:
+            self._closed = False
+            while self._size < self.min_size:
+                self._idle.append((self.factory(), time.monotonic()))
+                self._size += 1
+                self._stats['created'] += 1
+
+    def close(self) -> None:
+        """Close all idle connections; in-use connections are closed on release."""
+        with self._cond:
+            self._closed = True
+            while self._idle:
+                conn, _ = self._idle.popleft()
+                self._size -= 1
+                self._close_raw(conn)
+            self._cond.notify_all()
+
+    def _prune_idle(self, now: float) -> None:
+        # Oldest connections sit at the left; keep at least min_size around
+        while self._idle and self._size > self.min_size:
+            conn, last_used = self._idle[0]
+            if now - last_used < self.idle_timeout:
+                break
+            self._idle.popleft()
+            self._size -= 1
+            self._close_raw(conn)
+
+    def acquire(self):
+        """Check out a connection, waiting up to ``acquire_timeout`` seconds."""
+        self._check_pid()
+        start = time.monotonic()
+        deadline = start + self.acquire_timeout
+        conn = None
+        with self._cond:
+            self._closed = False
+            while True:
+                now = time.monotonic()
+                self._prune_idle(now)
+                if self._idle:
+                    # LIFO keeps a small hot set and lets the rest time out
+                    conn, last_used = self._idle.pop()
+                    if self.health_check and now - last_used >= self.health_check_interval:
+                        try:
+                            self.health_check(conn)
+                        except Exception:
+                            self._stats['health_check_failures'] += 1
+                            self._size -= 1
+                            self._close_raw(conn)
+                            conn = None
+                            continue
+                    break
+                if self._size < self.max_size:
+                    # Reserve a slot; the connection is opened outside the lock
+                    self._size += 1
+                    break
+                remaining = deadline - now
+                if remaining <= 0:
+                    self._stats['timeouts'] += 1
+                    raise PoolTimeoutError(
+                        f"No database connection available within {self.acquire_timeout}s "
+                        f"(max_size={self.max_size})"
+                    )
+                self._stats['waits'] += 1
+                self._cond.wait(remaining)
+
+        created = conn is None
+        if created:
+            try:
+                conn = self.factory()
+            except Exception:
+                with self._cond:
+                    self._size -= 1
+                    self._cond.notify()
+                raise
+
+        waited = time.monotonic() - start
+        with self._cond:
+            if created:
+                self._stats['created'] += 1
+            self._stats['acquired'] += 1
+            self._stats['acquire_time_total'] += waited
+        metrics.observe('db_pool_acquire_seconds', waited)
+        return conn
+
+    def release(self, conn, discard: bool = False) -> None:
+        """Return a connection to the pool, or close it if ``discard`` is set."""
+        if not discard and self.reset:
+            try:
+                self.reset(conn)
+            except Exception:
+                discard = True
+        with self._cond:
+            self._stats['released'] += 1
+            if discard or self._closed or self._pid != os.getpid():
+                self._size -= 1
+                self._close_raw(conn)
+            else:
+                self._idle.append((conn, time.monotonic()))
+            self._cond.notify()
+
+    @contextmanager
+    def connection(self):
+        """Context manager that checks out a connection and always returns it."""
+        conn = self.acquire()
+        try:
+            yield conn
+        finally:
+            # reset() rolls back any open transaction and discards broken connections
+            self.release(conn)
+
+    def stats(self) -> Dict[str, Any]:
+        """Return a snapshot of pool counters and current occupancy."""
+        with self._cond:
+            stats = dict(self._stats)
+            stats['size'] = self._size
+            stats['idle'] = len(self._idle)
+            stats['in_use'] = self._size - len(self._idle)
+            stats['min_size'] = self.min_size
+            stats['max_size'] = self.max_size
+            return stats
@@ -0,0 +1,301 @@
+"""Ticket query builder shared by the list API and the export.
+
+Translates the viewer's filters (type/owner/score/review) and sort keys into
+SQL for both backends, with keyset pagination and field projection.
+"""
+import base64
+import dataclasses
+import functools
+import json
+import sys
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Tuple
+
+from rawjson import RawJSON
+
+# Effective update time: update_time falls back to create_time
+UPDATE_TIME_SQL = "COALESCE(T2.update_time, T2.create_time, '')"
+
+# Tickets joined with their review and materialized review state. The state
+# table (migration 8) holds each ticket's review status: 'pending', 'expired'
+# (review older than the ticket's last update) or the review conclusion.
+TICKET_JOINS = '''
+        JOIN ticket_classification_2512 as C ON T2."流程ID" = C."processId"
+        JOIN ticket_review_state as S ON T2."流程ID" = S.processid
+        LEFT JOIN ticket_review as R ON T2."流程ID" = R.processid
+'''
+
+# Score filter value -> condition (migration 9 materializes the same bands for /api/stats)
+SCORE_BANDS = {
+    'high': 'T2."得分" >= 8',
+    'medium': 'T2."得分" >= 6 AND T2."得分" < 8',
+    'low': 'T2."得分" < 6',
+}
+
+# Response field -> SQL expression
+FIELDS = {
+    'processId': 'T2."流程ID"',
+    'issueType': 'C."issueType"',
+    'owner': 'C."owner"',
+    'createTime': 'T2.create_time',
+    'updateTime': 'COALESCE(T2.update_time, T2.create_time)',
+    'problem': 'T2."问题现象"',
+    'rootCause': 'T2."问题根因"',
+    'analysis': 'T2."分析过程"',
+    'solution': 'T2."解决方案"',
+    'diffScore': 'T2.diff_score',
+    'score': 'T2."得分"',
+    'reason': 'T2."理由"',
+    'hasReview': 'CASE WHEN R.id IS NOT NULL THEN 1 ELSE 0 END',
+    'conclusion': 'R.conclusion',
+    'reviewContent': 'R.content',
+    'reviewExpired': 'S.expired',
+}
+
+SUMMARY_FIELDS = [
+    'processId', 'issueType', 'owner', 'createTime', 'updateTime',
+    'problem', 'score', 'hasReview', 'conclusion', 'reviewExpired'
+]
+
+DETAIL_FIELDS = [
+    'processId', 'issueType', 'owner', 'createTime', 'updateTime',
+    'problem', 'rootCause', 'analysis', 'solution', 'diffScore', 'score', 'reason'
+]
+
+JSON_FIELDS = {'analysis', 'solution'}
+BOOL_FIELDS = {'hasReview', 'reviewExpired'}
+# Low-cardinality text shared by many rows, stored once per process
+INTERNED_FIELDS = {'issueType', 'owner', 'conclusion'}
+
+# Sort field -> keyset columns (the process ID is always the final tiebreaker)
+SORT_KEYS = {
+    'updateTime': [UPDATE_TIME_SQL, "COALESCE(T2.create_time, '')"],
+    'createTime': ["COALESCE(T2.create_time, '')"],
+    'score': ['COALESCE(T2."得分", 0)'],
+    'id': [],
+}
+
+DEFAULT_SORT = 'updateTime-desc'
+MAX_PAGE_SIZE = 500
+
+
+@dataclass
+class TicketQuery:
+    """Filter, sort and paging options for a ticket query."""
+    type: str = 'all'
+    owner: str = 'all'
+    score: str = 'all'
+    review: str = 'all'
+    sort: str = DEFAULT_SORT
+    limit: Optional[int] = None
+    cursor: Optional[str] = None
+    fields: Optional[List[str]] = None
+
+    def __post_init__(self):
+        # The one check of filter values, so the list, count, search, stats and
+        # export endpoints all reject the same ones. Other filters are compared
+        # with stored values (an unknown one simply matches nothing).
+        if self.score != 'all' and self.score not in SCORE_BANDS:
+            raise ValueError(f"Unknown score filter: {self.score} (all, {', '.join(SCORE_BANDS)})")
+
+    def sort_spec(self) -> Tuple[str, bool]:
+        """Return (sort field, descending)."""
+        sort_field, sort_order = self.sort.split("-", 1) if "-" in self.sort else (self.sort, "desc")
+        if sort_field not in SORT_KEYS:
+            sort_field, sort_order = DEFAULT_SORT.split("-")
+        return sort_field, sort_order != "asc"
+
+    def projected_fields(self) -> List[str]:
+        fields = self.fields or SUMMARY_FIELDS
+        unknown = [f for f in fields if f not in FIELDS]
+        if unknown:
+            raise ValueError(f"Unknown fields: {', '.join(unknown)}")
+        return list(fields)
+
+
+def parse_fields(value: Optional[str]) -> Optional[List[str]]:
+    """Parse a comma separated ``fields`` parameter ('summary'/'detail' are aliases)."""
+    if not value:
+        return None
+    if value == 'summary':
+        return list(SUMMARY_FIELDS)
+    if value == 'detail':
+        return list(DETAIL_FIELDS)
+    return [f.strip() for f in value.split(',') if f.strip()]
+
+
+def encode_cursor(sort: str, values: List[Any]) -> str:
+    payload = json.dumps({'s': sort, 'k': values}, ensure_ascii=False, separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor: str, sort: str) -> List[Any]:
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+        values = payload['k']
+    except (ValueError, KeyError, TypeError):
+        raise ValueError("Invalid cursor")
+    if payload.get('s') != sort or not isinstance(values, list):
+        raise ValueError("Cursor does not match sort order")
+    return values
+
+
+def build_filters(query: TicketQuery, dialect: str) -> Tuple[List[str], List[Any]]:
+    """Build WHERE clauses and parameters for the query filters."""
+    p = '?' if dialect == 'sqlite' else '%s'
+    where = []
+    params = []
+
+    if query.type != "all":
+        where.append(f'C."issueType" = {p}')
+        params.append(query.type)
+    if query.owner != "all":
+        where.append(f'C."owner" = {p}')
+        params.append(query.owner)
+    if query.score != "all":
+        where.append(SCORE_BANDS[query.score])
+    if query.review != "all":
+        # pending/expired/通过/不通过/待定 are all values of the state's status
+        where.append(f'S.status = {p}')
+        params.append(query.review)
+    return where, params
+
+
+def build_ticket_query(query: TicketQuery, dialect: str) -> Tuple[str, List[Any], List[str], int]:
+    """Build the SELECT for a ticket query.
+
+    Returns (sql, params, fields, key_count). Each row holds the projected
+    fields followed by ``key_count`` keyset columns used to build the cursor.
+    """
+    p = '?' if dialect == 'sqlite' else '%s'
+    fields = query.projected_fields()
+    sort_field, descending = query.sort_spec()
+    keys = SORT_KEYS[sort_field] + ['T2."流程ID"']
+
+    select = [FIELDS[f] for f in fields] + keys
+    where, params = build_filters(query, dialect)
+
+    if query.cursor:
+        values = decode_cursor(query.cursor, query.sort)
+        if len(values) != len(keys):
+            raise ValueError("Invalid cursor")
+        op = '<' if descending else '>'
+        # The redundant bound on the leading key lets SQLite seek the sort index
+        where.append(f"{keys[0]} {op}= {p}")
+        params.append(values[0])
+        where.append(f"({', '.join(keys)}) {op} ({', '.join([p] * len(keys))})")
+        params.extend(values)
+
+    direction = 'DESC' if descending else 'ASC'
+    sql = f'''
+        SELECT {', '.join(select)}
+        FROM operations_kb as T2
+    ''' + TICKET_JOINS
+    if where:
+        sql += ' WHERE ' + ' AND '.join(where)
+    sql += ' ORDER BY ' + ', '.join(f'{k} {direction}' for k in keys)
+    if query.limit is not None:
+        # One extra row tells whether another page exists
+        sql += f' LIMIT {int(query.limit) + 1}'
+    return sql, params, fields, len(keys)
+
+
+def build_count_query(query: TicketQuery, dialect: str) -> Tuple[str, List[Any]]:
+    """Build a COUNT(*) over the tickets matching the query's filters."""
+    where, params = build_filters(query, dialect)
+    # Filters only read C and S; the review itself isn't needed to count
+    sql = '''
+        SELECT COUNT(*)
+        FROM operations_kb as T2
+        JOIN ticket_classification_2512 as C ON T2."流程ID" = C."processId"
+        JOIN ticket_review_state as S ON T2."流程ID" = S.processid
+    '''
+    if where:
+        sql += ' WHERE ' + ' AND '.join(where)
+    return sql, params
+
+
+class TicketRow:
+    """Compact ticket record: a slots dataclass per projection instead of a dict.
+
+    Subclasses are made by ``ticket_row_type``. Rows support the dict
+    operations the cache and export use (``row[name]``, ``get``, ``in``,
+    assigning an existing field); ``_asdict()`` builds the dict for JSON
+    encoding.
+    """
+
+    __slots__ = ()
+    _fields: Tuple[str, ...] = ()
+    _field_set = frozenset()
+    _converters = ()
+
+    def __getitem__(self, name: str) -> Any:
+        if name not in self._field_set:
+            raise KeyError(name)
+        return getattr(self, name)
+
+    def __setitem__(self, name: str, value: Any) -> None:
+        if name not in self._field_set:
+            raise KeyError(name)
+        setattr(self, name, value)
+
+    def __contains__(self, name) -> bool:
+        return name in self._field_set
+
+    def get(self, name: str, default: Any = None) -> Any:
+        return getattr(self, name) if name in self._field_set else default
+
+    def keys(self) -> Tuple[str, ...]:
+        return self._fields
+
+    def _asdict(self) -> Dict[str, Any]:
+        return {name: getattr(self, name) for name in self._fields}
+
+    def __reduce__(self):
+        # Row types are made at runtime, so pickle by projection rather than by class
+        return _make_row, (self._fields, tuple(getattr(self, name) for name in self._fields))
+
+
+@functools.lru_cache(maxsize=64)
+def ticket_row_type(fields: Tuple[str, ...]) -> type:
+    """TicketRow dataclass with a slot for each of ``fields``."""
+    cls = dataclasses.make_dataclass('TicketRow', fields, bases=(TicketRow,), slots=True)
+    cls._fields = fields
+    cls._field_set = frozenset(fields)
+    # (position, conversion) for the columns parse_row converts
+    cls._converters = tuple(
+        (i, _CONVERTERS[name]) for i, name in enumerate(fields) if name in _CONVERTERS
+    )
+    return cls
+
+
+def _make_row(fields: Tuple[str, ...], values) -> TicketRow:
+    return ticket_row_type(fields)(*values)
+
+
+def _json_value(value: Optional[str]) -> RawJSON:
+    return RawJSON(value or '[]')
+
+
+def _interned(value: Optional[str]) -> Optional[str]:
+    return sys.intern(value) if value is not None else None
+
+
+_CONVERTERS = dict(
+    [(name, _json_value) for name in JSON_FIELDS]
+    + [(name, bool) for name in BOOL_FIELDS]
+    + [(name, _interned) for name in INTERNED_FIELDS]
+)
+
+
+def parse_row(row, fields: List[str]) -> TicketRow:
+    """Convert a projected row (extra trailing columns are ignored) into a ticket.
+
+    JSON columns stay undecoded (RawJSON) until something reads their value.
+    """
+    cls = ticket_row_type(tuple(fields))
+    values = list(row[:len(fields)])
+    for i, convert in cls._converters:
+        values[i] = convert(values[i])
+    return cls(*values)
@@ -0,0 +1,123 @@
+"""Pass stored JSON columns through to responses without decoding them.
+
+The 分析过程/解决方案 columns hold JSON text. Ticket rows carry them as
+RawJSON, and ``dumps`` copies that text into the encoded body as-is. The
+text is decoded only if code reads ``RawJSON.value``.
+
+Responses are encoded with orjson when it is installed (optional) and with
+the standard library otherwise.
+"""
+import datetime
+import decimal
+import json
+import re
+from typing import Any, List
+
+from fastapi.responses import JSONResponse
+
+import metrics
+import tracing
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+_UNDECODED = object()
+
+# RawJSON stand-in while encoding: encoders escape NUL, so a placeholder
+# appears in the body as "\u0000rawjson:<n>\u0000"
+_PLACEHOLDER = '\x00rawjson:{}\x00'
+_PLACEHOLDER_RE = re.compile(rb'"\\u0000rawjson:(\d+)\\u0000"')
+
+
+class RawJSON:
+    """JSON text from the database, decoded on first access to ``value``."""
+
+    __slots__ = ('text', '_value')
+
+    def __init__(self, text: str):
+        self.text = text
+        self._value = _UNDECODED
+
+    @property
+    def value(self) -> Any:
+        if self._value is _UNDECODED:
+            self._value = json.loads(self.text)
+        return self._value
+
+    def __eq__(self, other) -> bool:
+        return isinstance(other, RawJSON) and other.text == self.text
+
+    def __hash__(self) -> int:
+        return hash(self.text)
+
+    def __repr__(self) -> str:
+        return f'RawJSON({self.text!r})'
+
+
+def jsonable(obj: Any) -> Any:
+    """``default`` hook for the values database rows hold that JSON encoders don't.
+
+    Ticket rows become dicts, dates ISO strings and decimals numbers (as
+    jsonable_encoder does); RawJSON is decoded.
+    """
+    if hasattr(obj, '_asdict'):
+        return obj._asdict()
+    if isinstance(obj, (datetime.date, datetime.time)):
+        return obj.isoformat()
+    if isinstance(obj, decimal.Decimal):
+        return int(obj) if obj.as_tuple().exponent >= 0 else float(obj)
+    if isinstance(obj, RawJSON):
+        return obj.value
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+def _encode(content: Any, default) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(content, default=default)
+    return json.dumps(content, ensure_ascii=False, allow_nan=False, separators=(',', ':'),
+                      default=default).encode('utf-8')
+
+
+def dumps(content: Any) -> bytes:
+    """Encode ``content`` as compact UTF-8 JSON, splicing RawJSON text in verbatim."""
+    if orjson is not None and hasattr(orjson, 'Fragment'):
+        # orjson >= 3.9 splices raw JSON itself
+        return orjson.dumps(content, default=lambda obj: orjson.Fragment(obj.text)
+                            if isinstance(obj, RawJSON) else jsonable(obj))
+
+    raw: List[str] = []
+
+    def default(obj):
+        if isinstance(obj, RawJSON):
+            raw.append(obj.text)
+            return _PLACEHOLDER.format(len(raw) - 1)
+        return jsonable(obj)
+
+    body = _encode(content, default)
+    if not raw:
+        return body
+
+    def splice(match):
+        index = int(match.group(1))
+        return raw[index].encode('utf-8') if index < len(raw) else match.group(0)
+
+    body, count = _PLACEHOLDER_RE.subn(splice, body)
+    if count != len(raw):
+        # A string value looked like a placeholder: decode the raw values instead
+        return _encode(content, jsonable)
+    return body
+
+
+class RawJSONResponse(JSONResponse):
+    """JSON response rendered with ``dumps``.
+
+    Return it directly from endpoints whose content holds RawJSON values or
+    ticket rows: FastAPI's jsonable_encoder, applied to returned dicts, does
+    not know them.
+    """
+
+    def render(self, content: Any) -> bytes:
+        with metrics.timer('json_render_seconds'), tracing.span('json'):
+            return dumps(content)
@@ -0,0 +1,297 @@
+"""Full-text search over ticket content.
+
+Searches 问题现象 / 问题根因 / 分析过程 / 解决方案 for every whitespace
+separated term (all terms must match).
+
+Only the values of the analysis/solution JSON step lists are searched, not
+their keys (操作, 现象, ... appear in every ticket).
+
+- SQLite: the contentless ``ticket_fts`` FTS5 table (trigram tokenizer, so
+  Chinese text and codes like ``GS-00512`` match as substrings). Terms
+  shorter than three characters (most two-character Chinese words) can't
+  use the trigram index: alongside a longer term they only filter its
+  matches, on their own they are a LIKE scan from the newest ticket until
+  ``SEARCH_CANDIDATES`` matches are found (the whole table if there are
+  fewer).
+- PostgreSQL: ILIKE over the concatenated text, served by a pg_trgm GIN
+  index; the same limit applies to terms under three characters. (The
+  built-in tsvector parsers don't segment Chinese, so trigrams are used
+  here as well.)
+
+Results are ranked by which fields contain the terms (problem first), then
+by recency. Only the ``SEARCH_CANDIDATES`` most recent matches are ranked:
+bm25 needs per-term document counts, which means reading every match, and
+that can't stay fast for terms found in a large share of the tickets.
+Results say when more matches exist (``truncated``).
+
+Both indexes are created by migration 7 and kept in sync by the
+database. Highlighting and snippets are done here, so both backends return
+the same markup. Rebuild the SQLite index after a VACUUM (which may renumber
+the rowids it refers to) with ``python search.py --rebuild``.
+"""
+import html
+import json
+import re
+from typing import Any, Dict, List, Optional, Tuple
+
+from migrations import SQLITE_FTS_FILL, sqlite_json_values
+from query import FIELDS, SUMMARY_FIELDS, TICKET_JOINS, UPDATE_TIME_SQL, TicketQuery, build_filters
+
+# Response field -> column, in snippet priority order
+SEARCH_COLUMNS = {
+    'problem': 'T2."问题现象"',
+    'rootCause': 'T2."问题根因"',
+    'analysis': 'T2."分析过程"',
+    'solution': 'T2."解决方案"',
+}
+
+# Searched text of each column (SEARCH_COLUMNS order): JSON step lists without their keys
+SEARCH_TEXT = {
+    'sqlite': [
+        SEARCH_COLUMNS['problem'], SEARCH_COLUMNS['rootCause'],
+        sqlite_json_values(SEARCH_COLUMNS['analysis']), sqlite_json_values(SEARCH_COLUMNS['solution']),
+    ],
+    'postgresql': [
+        SEARCH_COLUMNS['problem'], SEARCH_COLUMNS['rootCause'],
+        f"ticket_search_text({SEARCH_COLUMNS['analysis']})",
+        f"ticket_search_text({SEARCH_COLUMNS['solution']})",
+    ],
+}
+
+# Rank weight of a term hit in each column (SEARCH_COLUMNS order)
+RANK_WEIGHTS = (4, 3, 1, 2)
+
+# Shortest term the trigram index can serve
+MIN_INDEXED_TERM = 3
+MAX_TERMS = 8
+MAX_SEARCH_PAGE_SIZE = 100
+# Most recent matches that are ranked (and paged through) per search
+SEARCH_CANDIDATES = 1000
+
+# Must match the expression of idx_operations_kb_search (migration 7)
+PG_SEARCH_DOC = (
+    '(COALESCE(T2."问题现象", \'\') || \' \' || COALESCE(T2."问题根因", \'\') || \' \' || '
+    'ticket_search_text(T2."分析过程") || \' \' || ticket_search_text(T2."解决方案"))'
+)
+
+SNIPPET_BEFORE = 20
+SNIPPET_LENGTH = 80
+
+
+def parse_terms(q: str) -> List[str]:
+    """Split a search string into distinct terms."""
+    terms = []
+    for term in q.split():
+        if term not in terms:
+            terms.append(term)
+    return terms[:MAX_TERMS]
+
+
+def _like_pattern(term: str) -> str:
+    return '%' + term.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+
+
+def _fts_phrase(term: str) -> str:
+    return '"' + term.replace('"', '""') + '"'
+
+
+def _match_query(terms: List[str], query: TicketQuery, dialect: str) -> Tuple[str, List[Any]]:
+    """SELECT of the IDs of tickets matching all terms and the filters, newest first."""
+    p = '?' if dialect == 'sqlite' else '%s'
+    where = []
+    params = []
+
+    if dialect == 'sqlite':
+        indexed = [t for t in terms if len(t) >= MIN_INDEXED_TERM]
+        short = [t for t in terms if len(t) < MIN_INDEXED_TERM]
+        if indexed:
+            source = 'ticket_fts JOIN operations_kb as T2 ON T2.rowid = ticket_fts.rowid'
+            where.append(f'ticket_fts MATCH {p}')
+            params.append(' '.join(_fts_phrase(t) for t in indexed))
+            # FTS5 walks its doclists backwards without sorting
+            recency = 'ticket_fts.rowid DESC'
+        else:
+            source = 'operations_kb as T2'
+            recency = 'T2.rowid DESC'
+        for term in short:
+            pattern = _like_pattern(term)
+            matches = []
+            for column, text in zip(SEARCH_COLUMNS.values(), SEARCH_TEXT[dialect]):
+                if text != column and '"' not in term and '\\' not in term:
+                    # The raw JSON holds every value as written (JSON escapes only
+                    # quotes and backslashes): a cheap test before flattening it
+                    matches.append(f"({column} LIKE {p} ESCAPE '\\' AND {text} LIKE {p} ESCAPE '\\')")
+                    params.extend([pattern, pattern])
+                else:
+                    matches.append(f"{text} LIKE {p} ESCAPE '\\'")
+                    params.append(pattern)
+            where.append('(' + ' OR '.join(matches) + ')')
+    elif dialect == 'postgresql':
+        source = 'operations_kb as T2'
+        for term in terms:
+            where.append(f"{PG_SEARCH_DOC} ILIKE {p} ESCAPE '\\'")
+            params.append(_like_pattern(term))
+        recency = f'{UPDATE_TIME_SQL} DESC'
+    else:
+        raise ValueError(f"Unsupported database type: {dialect}")
+
+    filters, filter_params = build_filters(query, dialect)
+    where += filters
+    params += filter_params
+
+    sql = f'''
+        SELECT T2."流程ID" AS process_id
+        FROM {source}
+        {TICKET_JOINS}
+        WHERE {' AND '.join(where)}
+        ORDER BY {recency}
+    '''
+    return sql, params
+
+
+def build_search_query(terms: List[str], query: TicketQuery, dialect: str,
+                       limit: int, offset: int = 0) -> Tuple[str, List[Any], List[str]]:
+    """Build the ranked search SELECT.
+
+    The index yields the ``SEARCH_CANDIDATES`` most recent tickets matching
+    all terms and the filters; only those are ranked, so the cost stays flat
+    for terms that match a large share of the table. Returns (sql, params,
+    fields); rows hold the summary fields, the searched columns, the rank and
+    the number of candidates.
+    """
+    p = '?' if dialect == 'sqlite' else '%s'
+    like = 'LIKE' if dialect == 'sqlite' else 'ILIKE'
+    match_sql, params = _match_query(terms, query, dialect)
+
+    # Weighted count of (field, term) hits
+    rank = []
+    rank_params = []
+    for weight, text in zip(RANK_WEIGHTS, SEARCH_TEXT[dialect]):
+        for term in terms:
+            rank.append(f"CASE WHEN {text} {like} {p} ESCAPE '\\' THEN {weight} ELSE 0 END")
+            rank_params.append(_like_pattern(term))
+
+    fields = list(SUMMARY_FIELDS)
+    select = [FIELDS[f] for f in fields]
+    select += list(SEARCH_COLUMNS.values())
+    select.append(f"({' + '.join(rank)}) AS search_rank")
+    select.append('COUNT(*) OVER () AS candidates')
+
+    sql = f'''
+        SELECT {', '.join(select)}
+        FROM ({match_sql} LIMIT {SEARCH_CANDIDATES}) AS M
+        JOIN operations_kb as T2 ON T2."流程ID" = M.process_id
+        {TICKET_JOINS}
+        ORDER BY search_rank DESC, {UPDATE_TIME_SQL} DESC, T2."流程ID"
+        LIMIT {int(limit) + 1} OFFSET {int(offset)}
+    '''
+    return sql, rank_params + params, fields
+
+
+def build_overflow_query(terms: List[str], query: TicketQuery, dialect: str) -> Tuple[str, List[Any]]:
+    """SELECT returning a row if more than ``SEARCH_CANDIDATES`` tickets match.
+
+    Run only when the candidates are full, so the ranked results are a
+    truncated set; reads at most one more match than the search itself.
+    """
+    match_sql, params = _match_query(terms, query, dialect)
+    return f'{match_sql} LIMIT 1 OFFSET {SEARCH_CANDIDATES}', params
+
+
+def _terms_regex(terms: List[str]):
+    # Longest first so overlapping terms highlight the longer match
+    alternatives = sorted(terms, key=len, reverse=True)
+    return re.compile('|'.join(re.escape(t) for t in alternatives), re.IGNORECASE)
+
+
+def highlight(text: str, terms: List[str], start: int = 0, end: Optional[int] = None) -> str:
+    """HTML-escape ``text[start:end]`` and wrap term matches in <mark>."""
+    text = text[start:end]
+    parts = []
+    last = 0
+    for match in _terms_regex(terms).finditer(text):
+        parts.append(html.escape(text[last:match.start()]))
+        parts.append(f'<mark>{html.escape(match.group())}</mark>')
+        last = match.end()
+    parts.append(html.escape(text[last:]))
+    return ''.join(parts)
+
+
+def _plain_text(field: str, value: Optional[str]) -> str:
+    """Searchable text of a column; JSON step lists are flattened to their values."""
+    if not value:
+        return ''
+    if field in ('analysis', 'solution'):
+        try:
+            steps = json.loads(value)
+        except ValueError:
+            return value
+        if isinstance(steps, list):
+            return '；'.join(
+                ' '.join(str(v) for v in step.values()) if isinstance(step, dict) else str(step)
+                for step in steps
+            )
+    return value
+
+
+def snippet(text: str, terms: List[str]) -> Optional[str]:
+    """Highlighted excerpt around the first term match, or None if no term matches."""
+    match = _terms_regex(terms).search(text)
+    if not match:
+        return None
+    start = max(0, match.start() - SNIPPET_BEFORE)
+    end = start + SNIPPET_LENGTH
+    prefix = '…' if start > 0 else ''
+    suffix = '…' if end < len(text) else ''
+    return prefix + highlight(text, terms, start, end) + suffix
+
+
+def decorate_result(ticket: Dict[str, Any], texts: List[Optional[str]], terms: List[str]) -> Dict[str, Any]:
+    """Add ``highlight`` (HTML) and ``matchedField`` to a search result."""
+    ticket['highlight'] = None
+    ticket['matchedField'] = None
+    for field, value in zip(SEARCH_COLUMNS, texts):
+        excerpt = snippet(_plain_text(field, value), terms)
+        if excerpt is not None:
+            ticket['highlight'] = excerpt
+            ticket['matchedField'] = field
+            break
+    return ticket
+
+
+def rebuild_index(db) -> None:
+    """Rebuild the SQLite FTS index from operations_kb."""
+    if db.dialect != 'sqlite':
+        return
+    with db._connection() as conn:
+        # Contentless table: 'rebuild' can't read the text back, so refill it
+        conn.execute("INSERT INTO ticket_fts(ticket_fts) VALUES ('delete-all')")
+        conn.execute(SQLITE_FTS_FILL)
+        conn.commit()
+
+
+def main() -> None:
+    import argparse
+    from config import DATABASE_CONFIG
+    from database import create_database
+
+    parser = argparse.ArgumentParser(description="Ticket full-text search")
+    parser.add_argument('--rebuild', action='store_true', help="rebuild the SQLite search index")
+    parser.add_argument('q', nargs='*', help="search terms")
+    args = parser.parse_args()
+
+    db = create_database(dict(DATABASE_CONFIG, cache={'enabled': False}))
+    try:
+        if args.rebuild:
+            rebuild_index(db)
+            print("search index rebuilt")
+        if args.q:
+            result = db.search_tickets(' '.join(args.q), TicketQuery(), limit=20)
+            for ticket in result['items']:
+                print(f"{ticket['processId']}\t{ticket['matchedField']}\t{ticket['highlight']}")
+    finally:
+        db.close()
+
+
+if __name__ == '__main__':
+    main()
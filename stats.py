@@ -0,0 +1,64 @@
+"""Ticket counts per issue type × owner × review status × score band.
+
+A single GROUP BY over the materialized ticket_review_state yields the
+whole cube. It is small (types × owners × statuses × score bands), so the
+cache layer keeps it until the data changes, and the counts for any filter
+combination are summed from its cells here without another query.
+"""
+from typing import Any, Dict, List, Optional, Tuple
+
+from query import TicketQuery
+
+# (TicketQuery filter, response key), in cell column order
+STATS_DIMENSIONS = (
+    ('type', 'issueType'),
+    ('owner', 'owner'),
+    ('review', 'review'),
+    ('score', 'score'),
+)
+
+Cell = Tuple[Optional[str], Optional[str], str, Optional[str], int]
+
+
+def build_stats_query() -> str:
+    """Build the GROUP BY returning (issueType, owner, status, score band, count) cells.
+
+    ticket_review_state holds all four per classified ticket (migration 9),
+    so this is a scan of its facets index.
+    """
+    return '''
+        SELECT issue_type, owner, status, score_band, COUNT(*)
+        FROM ticket_review_state
+        GROUP BY issue_type, owner, status, score_band
+    '''
+
+
+def facet_counts(cells: List[Cell], query: TicketQuery) -> Dict[str, Any]:
+    """Sum the cube cells for the query's filters.
+
+    ``facets`` holds, for each dimension, the count per value with the
+    other dimensions' filters applied (what each dropdown option would
+    show); ``groups`` lists the cells matching all filters.
+    """
+    filters = [getattr(query, name) for name, _ in STATS_DIMENSIONS]
+    facets = {key: {} for _, key in STATS_DIMENSIONS}
+    groups = []
+    total = 0
+    filtered = 0
+
+    for cell in cells:
+        values, count = cell[:4], cell[4]
+        total += count
+        mismatched = [i for i, (want, value) in enumerate(zip(filters, values))
+                      if want != 'all' and want != value]
+        if not mismatched:
+            filtered += count
+            groups.append(dict(zip([key for _, key in STATS_DIMENSIONS], values), count=count))
+        if len(mismatched) > 1:
+            continue
+        for i, (_, key) in enumerate(STATS_DIMENSIONS):
+            if values[i] is None or (mismatched and mismatched != [i]):
+                continue
+            facets[key][values[i]] = facets[key].get(values[i], 0) + count
+
+    return {'total': total, 'filtered': filtered, 'facets': facets, 'groups': groups}
@@ -0,0 +1,370 @@
+"""Opt-in query tracing: slow-query log, EXPLAIN capture and Server-Timing.
+
+With tracing enabled, backend connections are wrapped so every cursor
+``execute`` is timed together with the fetches that follow it (SQLite does
+most of a query's work while rows are fetched). Each query is recorded on
+the current request's trace: SQL, parameter shape (types, never values),
+duration and rows. Queries slower than ``slow_query_ms`` are logged, with
+their plan (EXPLAIN QUERY PLAN / EXPLAIN) when ``explain`` is set; so are
+requests slower than ``slow_request_ms``, with all their queries.
+
+TracingMiddleware adds a ``Server-Timing`` header (database total, template
+and JSON rendering, slowest queries), which browser devtools show in the
+request's Timing tab.
+"""
+import contextvars
+import logging
+import re
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional
+
+from starlette.datastructures import MutableHeaders
+
+logger = logging.getLogger('gaussdb_ops.tracing')
+
+# Slowest queries listed individually in Server-Timing
+SERVER_TIMING_QUERIES = 5
+# Logged SQL is cut to this many characters
+MAX_SQL_LENGTH = 2000
+
+_config: Optional[Dict[str, Any]] = None
+_current: contextvars.ContextVar[Optional['RequestTrace']] = contextvars.ContextVar('trace', default=None)
+
+_WHITESPACE_RE = re.compile(r'\s+')
+_TABLE_RE = re.compile(r'\b(?:FROM|INTO|UPDATE|TABLE)\s+("?[\w.]+"?)', re.IGNORECASE)
+
+
+def configure(enabled: bool = False, slow_query_ms: float = 100.0, slow_request_ms: float = 500.0,
+              explain: bool = False, server_timing: bool = True) -> None:
+    """Turn tracing on for connections created from now on in this process."""
+    global _config
+    if not enabled:
+        _config = None
+        return
+    _config = {'slow_query_ms': slow_query_ms, 'slow_request_ms': slow_request_ms,
+               'explain': explain, 'server_timing': server_timing}
+    if not logger.handlers and not logging.getLogger().handlers:
+        handler = logging.StreamHandler()
+        handler.setFormatter(logging.Formatter('%(asctime)s %(levelname)s %(name)s: %(message)s'))
+        logger.addHandler(handler)
+        logger.setLevel(logging.INFO)
+
+
+def enabled() -> bool:
+    return _config is not None
+
+
+def params_shape(params: Any) -> str:
+    """Parameter types, e.g. ``(str, int)``; values are never recorded."""
+    if params is None:
+        return '()'
+    if isinstance(params, dict):
+        return '{' + ', '.join(f'{key}: {type(value).__name__}' for key, value in params.items()) + '}'
+    params = list(params)
+    types = [type(value).__name__ for value in params[:10]]
+    if len(params) > 10:
+        types.append(f'... {len(params)} params')
+    return '(' + ', '.join(types) + ')'
+
+
+def _statement(sql: str) -> str:
+    return _WHITESPACE_RE.sub(' ', sql).strip()
+
+
+class QueryRecord:
+    """One statement and the fetches of its results."""
+
+    __slots__ = ('sql', 'shape', 'duration', 'rows', 'plan', 'finished', 'trace')
+
+    def __init__(self, sql: str, shape: str, trace: Optional['RequestTrace']):
+        self.sql = _statement(sql)
+        self.shape = shape
+        self.duration = 0.0
+        self.rows = 0
+        self.plan: Optional[List[str]] = None
+        self.finished = False
+        self.trace = trace
+
+    def label(self) -> str:
+        """Short ASCII description for Server-Timing: verb and first table."""
+        verb = self.sql.split(' ', 1)[0].upper()
+        table = _TABLE_RE.search(self.sql)
+        text = f'{verb} {table.group(1)}' if table else verb
+        return text.replace('"', '').encode('ascii', 'replace').decode('ascii')
+
+    def describe(self) -> str:
+        sql = self.sql if len(self.sql) <= MAX_SQL_LENGTH else self.sql[:MAX_SQL_LENGTH] + '...'
+        text = f'{self.duration * 1000:.1f} ms, {self.rows} rows, params {self.shape}: {sql}'
+        if self.plan:
+            text += '\n    plan: ' + '\n          '.join(self.plan)
+        return text
+
+
+class RequestTrace:
+    """Queries and timed spans of one request."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.started = time.perf_counter()
+        self.queries: List[QueryRecord] = []
+        self.spans: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def add_span(self, name: str, seconds: float) -> None:
+        with self._lock:
+            self.spans[name] = self.spans.get(name, 0.0) + seconds
+
+    def server_timing(self) -> str:
+        total = time.perf_counter() - self.started
+        queries = list(self.queries)
+        db_time = sum(query.duration for query in queries)
+        entries = [f'app;dur={total * 1000:.1f}',
+                   f'db;dur={db_time * 1000:.1f};desc="{len(queries)} queries"']
+        for name, seconds in self.spans.items():
+            entries.append(f'{name};dur={seconds * 1000:.1f}')
+        slowest = sorted(queries, key=lambda query: query.duration, reverse=True)[:SERVER_TIMING_QUERIES]
+        for index, query in enumerate(slowest, 1):
+            entries.append(f'q{index};dur={query.duration * 1000:.1f};desc="{query.label()} ({query.rows} rows)"')
+        return ', '.join(entries)
+
+    def finish(self) -> None:
+        """Close records still open at the end of the request; log it if slow."""
+        for query in list(self.queries):
+            query_finished(query, explain=False)
+        total = time.perf_counter() - self.started
+        if _config is not None and total * 1000 >= _config['slow_request_ms']:
+            lines = '\n  '.join(query.describe() for query in self.queries)
+            logger.warning('slow request %s: %.1f ms, %d queries (%.1f ms)%s', self.name, total * 1000,
+                           len(self.queries), sum(query.duration for query in self.queries) * 1000,
+                           '\n  ' + lines if lines else '')
+
+
+@contextmanager
+def span(name: str) -> Iterator[None]:
+    """Time a block as a named Server-Timing entry of the current request."""
+    trace = _current.get()
+    if trace is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        trace.add_span(name, time.perf_counter() - start)
+
+
+def _explain(conn, dialect: str, query: QueryRecord, sql: str, params: Any) -> None:
+    """Capture the plan of a read query; never disturbs the caller's transaction."""
+    if query.sql.split(' ', 1)[0].upper() not in ('SELECT', 'WITH'):
+        return
+    try:
+        if dialect == 'sqlite':
+            rows = conn.execute(f'EXPLAIN QUERY PLAN {sql}', params or ()).fetchall()
+            query.plan = [row[3] for row in rows]
+            return
+        cursor = conn.cursor()
+        savepoint = not conn.autocommit
+        if savepoint:
+            cursor.execute('SAVEPOINT trace_explain')
+        try:
+            cursor.execute(f'EXPLAIN {sql}', params)
+            query.plan = [row[0] for row in cursor.fetchall()]
+        except Exception:
+            if savepoint:
+                cursor.execute('ROLLBACK TO SAVEPOINT trace_explain')
+            raise
+        finally:
+            if savepoint:
+                cursor.execute('RELEASE SAVEPOINT trace_explain')
+    except Exception as e:
+        query.plan = [f'(plan not available: {e})']
+
+
+def query_finished(query: QueryRecord, explain: bool = True, conn=None, dialect: str = '',
+                   sql: str = '', params: Any = None) -> None:
+    """Log a finished query if it was slow (with its plan if ``explain`` is possible)."""
+    if query.finished:
+        return
+    query.finished = True
+    if _config is None or query.duration * 1000 < _config['slow_query_ms']:
+        return
+    if explain and _config['explain'] and conn is not None:
+        _explain(conn, dialect, query, sql, params)
+    where = f' [{query.trace.name}]' if query.trace else ''
+    logger.warning('slow query%s: %s', where, query.describe())
+
+
+class TracedCursor:
+    """Cursor proxy timing ``execute`` and the fetches of its results."""
+
+    def __init__(self, cursor, conn, dialect: str):
+        object.__setattr__(self, '_cursor', cursor)
+        object.__setattr__(self, '_conn', conn)
+        object.__setattr__(self, '_dialect', dialect)
+        object.__setattr__(self, '_query', None)
+        object.__setattr__(self, '_statement', (None, None))
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+    def __setattr__(self, name, value):
+        setattr(self._cursor, name, value)
+
+    def _finish(self, explain: bool = True) -> None:
+        query = self._query
+        if query is not None and not query.finished:
+            sql, params = self._statement
+            query_finished(query, explain, self._conn, self._dialect, sql, params)
+
+    def _start(self, sql: str, params: Any, shape: str) -> QueryRecord:
+        self._finish()
+        trace = _current.get()
+        query = QueryRecord(sql, shape, trace)
+        if trace is not None:
+            trace.queries.append(query)
+        object.__setattr__(self, '_query', query)
+        object.__setattr__(self, '_statement', (sql, params))
+        return query
+
+    def _timed(self, call, *args):
+        start = time.perf_counter()
+        try:
+            return call(*args)
+        finally:
+            self._query.duration += time.perf_counter() - start
+
+    def execute(self, sql, params=None):
+        query = self._start(sql, params, params_shape(params))
+        result = self._timed(self._cursor.execute, sql, *(() if params is None else (params,)))
+        # A named (server-side) cursor's execute only declares it: its
+        # description arrives with the first fetch, which finishes the record
+        if self._cursor.description is None and not getattr(self._cursor, 'name', None):
+            # Not a query: nothing to fetch
+            if self._cursor.rowcount and self._cursor.rowcount > 0:
+                query.rows = self._cursor.rowcount
+            self._finish()
+        # sqlite3's execute returns the cursor itself
+        return self if result is self._cursor else result
+
+    def executemany(self, sql, seq_of_params):
+        seq_of_params = list(seq_of_params)
+        shape = f'{len(seq_of_params)} x {params_shape(seq_of_params[0]) if seq_of_params else "()"}'
+        query = self._start(sql, None, shape)
+        result = self._timed(self._cursor.executemany, sql, seq_of_params)
+        query.rows = max(self._cursor.rowcount, 0)
+        self._finish(explain=False)
+        return self if result is self._cursor else result
+
+    def fetchone(self):
+        row = self._timed(self._cursor.fetchone)
+        if row is None:
+            self._finish()
+        else:
+            self._query.rows += 1
+        return row
+
+    def fetchmany(self, *args):
+        rows = self._timed(self._cursor.fetchmany, *args)
+        self._query.rows += len(rows)
+        if not rows:
+            self._finish()
+        return rows
+
+    def fetchall(self):
+        rows = self._timed(self._cursor.fetchall)
+        self._query.rows += len(rows)
+        self._finish()
+        return rows
+
+    def __iter__(self):
+        while True:
+            rows = self.fetchmany(getattr(self._cursor, 'itersize', 0) or 100)
+            if not rows:
+                return
+            yield from rows
+
+    def close(self) -> None:
+        self._finish(explain=False)
+        self._cursor.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __del__(self):
+        # Single-row reads never fetch past the end: log them once the cursor goes away
+        self._finish(explain=False)
+
+
+class TracedConnection:
+    """Connection proxy whose cursors are TracedCursor."""
+
+    def __init__(self, conn, dialect: str):
+        object.__setattr__(self, '_conn', conn)
+        object.__setattr__(self, '_dialect', dialect)
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+    def __setattr__(self, name, value):
+        setattr(self._conn, name, value)
+
+    def cursor(self, *args, **kwargs) -> TracedCursor:
+        return TracedCursor(self._conn.cursor(*args, **kwargs), self._conn, self._dialect)
+
+    # sqlite3 shortcuts
+    def execute(self, sql, params=None) -> TracedCursor:
+        cursor = self.cursor()
+        cursor.execute(sql, params)
+        return cursor
+
+    def executemany(self, sql, seq_of_params) -> TracedCursor:
+        cursor = self.cursor()
+        cursor.executemany(sql, seq_of_params)
+        return cursor
+
+    def commit(self) -> None:
+        with span('commit'):
+            self._conn.commit()
+
+    def __enter__(self):
+        self._conn.__enter__()
+        return self
+
+    def __exit__(self, *exc):
+        return self._conn.__exit__(*exc)
+
+
+def wrap_connection(conn, dialect: str):
+    """``conn`` wrapped for tracing, or unchanged when tracing is off."""
+    return conn if _config is None else TracedConnection(conn, dialect)
+
+
+class TracingMiddleware:
+    """ASGI middleware giving each request a trace and a Server-Timing header."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send) -> None:
+        if scope['type'] != 'http' or _config is None:
+            await self.app(scope, receive, send)
+            return
+
+        trace = RequestTrace(f"{scope['method']} {scope['path']}")
+
+        async def send_with_timing(message) -> None:
+            if message['type'] == 'http.response.start' and _config['server_timing']:
+                MutableHeaders(scope=message).append('Server-Timing', trace.server_timing())
+            await send(message)
+
+        token = _current.set(trace)
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            _current.reset(token)
+            trace.finish()